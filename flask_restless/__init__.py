@@ -16,6 +16,9 @@ SQLAlchemy models via the JSON API protocol.
 # The following names are available as part of the public API for
 # Flask-Restless. End users of this package can import these names by doing
 # ``from flask_restless import APIManager``, for example.
+from .cache import AggregateCache
+from .cache import FileSystemStore
+from .cache import ResponseCache
 from .helpers import collection_name
 from .helpers import model_for
 from .helpers import serializer_for
@@ -23,6 +26,8 @@ from .helpers import url_for
 from .helpers import primary_key_for
 from .manager import APIManager
 from .manager import IllegalArgumentError
+from .metrics import Metrics
+from .profiling import SamplingProfiler
 from .serialization import DefaultDeserializer
 from .serialization import DefaultSerializer
 from .serialization import DeserializationException
@@ -31,8 +36,12 @@ from .serialization import SerializationException
 from .serialization import simple_serialize
 from .serialization import simple_serialize_many
 from .search import register_operator
+from .slowlog import SlowRequestLog
+from .statements import StatementCounter
+from .timing import ServerTiming
 from .views import JSONAPI_MIMETYPE
 from .views import ProcessingException
+from .workers import WorkerPool
 
 #: The current version of this extension.
 #:
@@ -41,21 +50,30 @@ from .views import ProcessingException
 __version__ = '1.0.0b2-dev'
 
 __all__ = [
+    'AggregateCache',
     'APIManager',
     'collection_name',
     'DefaultDeserializer',
     'DefaultSerializer',
     'DeserializationException',
+    'FileSystemStore',
     'IllegalArgumentError',
     'JSONAPI_MIMETYPE',
+    'Metrics',
     'model_for',
     'MultipleExceptions',
     'primary_key_for',
     'ProcessingException',
     'register_operator',
+    'ResponseCache',
+    'SamplingProfiler',
     'SerializationException',
     'serializer_for',
+    'ServerTiming',
     'simple_serialize',
     'simple_serialize_many',
+    'SlowRequestLog',
+    'StatementCounter',
     'url_for',
+    'WorkerPool',
 ]
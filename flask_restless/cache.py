@@ -0,0 +1,813 @@
+# cache.py - server-side caching of responses
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Server-side caching of responses to :http:method:`get` requests.
+
+The main class in this module, :class:`ResponseCache`, stores the
+encoded bodies and headers of responses in a pluggable store and
+discards them when a session that it watches commits changes to the
+models on which they depend. For more information, see
+:ref:`responsecache`.
+
+The :class:`AggregateCache` class stores the results of the function
+evaluation endpoint and, where possible, keeps them up to date as
+changes are committed. For more information, see
+:ref:`aggregatecache`.
+
+"""
+from collections import defaultdict
+from itertools import chain
+from uuid import uuid4
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+
+from flask import current_app
+from flask import json
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+from sqlalchemy.orm.attributes import NEVER_SET
+from sqlalchemy.orm.attributes import NO_VALUE
+from sqlalchemy.sql import func
+
+from .helpers import LRUCache
+
+#: The default maximum total size in bytes of the responses stored by a
+#: :class:`ResponseCache` that uses the default in-memory store.
+DEFAULT_MAXBYTES = 16 * 1024 * 1024
+
+#: The default number of seconds for which an :class:`AggregateCache`
+#: stores the result of evaluating functions.
+DEFAULT_AGGREGATE_TTL = 60
+
+#: The default maximum number of results stored by an
+#: :class:`AggregateCache`.
+DEFAULT_AGGREGATE_MAXSIZE = 1000
+
+#: The names of the functions whose results an :class:`AggregateCache`
+#: maintains incrementally.
+INCREMENTAL_FUNCTIONS = ('count', 'sum')
+
+#: The names of the equality operator in filter objects.
+EQUALITY_OPERATORS = ('==', 'eq', 'equals', 'equal_to')
+
+#: The names, in lowercase, of the collations that compare strings by
+#: their bytes, as Python does.
+BINARY_COLLATIONS = ('binary', 'c', 'posix')
+
+#: The names of the dialects whose default collation compares strings by
+#: their bytes, as Python does.
+#:
+#: The default collations of MySQL, for example, ignore case and
+#: trailing spaces.
+BINARY_DIALECTS = ('sqlite', 'postgresql')
+
+STRING_TYPES = (str, )
+
+if sys.version_info < (3, 0):
+    STRING_TYPES += (unicode, )  # noqa
+
+#: The function used to atomically replace one file with another.
+#:
+#: :func:`os.replace` is not available on Python 2, in which case
+#: :func:`os.rename` is used; the latter is atomic on POSIX systems.
+_replace = getattr(os, 'replace', os.rename)
+
+
+class CachedResponse(object):
+    """The body and headers of a response stored in a
+    :class:`ResponseCache`.
+
+    `generations` identifies the state of the models on which the
+    response depends at the time it was computed, as returned by
+    :meth:`ResponseCache.generations`. `body` is the encoded body of the
+    response and `headers` is its list of headers.
+
+    The length of a cached response is its approximate size in bytes, so
+    that it can be stored in a :class:`~flask_restless.helpers.LRUCache`
+    with a byte budget.
+
+    """
+
+    def __init__(self, generations, body, headers):
+        self.generations = generations
+        self.body = body
+        self.headers = headers
+
+    def __len__(self):
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers)
+
+
+class FileSystemStore(object):
+    """A dictionary-like store that keeps each value in its own file in
+    the specified directory.
+
+    `directory` is created if it does not exist. Keys must be valid file
+    names; the keys used by :class:`ResponseCache` are hexadecimal
+    strings. Values are pickled, so the directory must not be writable
+    by untrusted users.
+
+    """
+
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        #: The directory in which values are stored.
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def __getitem__(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (IOError, OSError):
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        """Returns the value for `key`, or `default` if there is none."""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        # Write to a temporary file first so that concurrent readers
+        # never see a partially written value.
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        _replace(temp_path, self._path(key))
+
+    def __delitem__(self, key):
+        try:
+            os.remove(self._path(key))
+        except (IOError, OSError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return os.path.isfile(self._path(key))
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory)
+                   if not name.startswith('.'))
+
+    def clear(self):
+        """Removes all values from this store."""
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(self._path(name))
+            except (IOError, OSError):
+                pass
+
+
+class ResponseCache(object):
+    """A cache of responses to :http:method:`get` requests.
+
+    `store` is the dictionary-like object in which the responses are
+    stored, keyed by strings. It must support :meth:`dict.get`, item
+    assignment, and item deletion. If it is ``None``, an in-memory
+    :class:`~flask_restless.helpers.LRUCache` is used that holds at most
+    `maxbytes` bytes of responses. If the store has an ``evictions``
+    attribute, it is reported in :meth:`stats`.
+
+    `scope` is a function that takes no arguments and returns a value
+    that identifies the client on whose behalf the request is being made
+    (for example, the ID of the current user). It is called after the
+    preprocessors for the request, and responses computed for one scope
+    are never returned to clients in another. If it is ``None``, all
+    clients share the same scope.
+
+    Entries are invalidated when a session passed to :meth:`watch`
+    commits a transaction that created, updated, or deleted instances of
+    a model on which they depend. The generation counters used for this
+    are kept in memory, so entries written by another process (or
+    before a restart) are never returned, even if `store` is shared.
+
+    """
+
+    def __init__(self, store=None, scope=None, maxbytes=DEFAULT_MAXBYTES):
+        if store is None:
+            store = LRUCache(maxsize=None, maxbytes=maxbytes)
+
+        #: The dictionary-like object in which responses are stored.
+        self.store = store
+
+        #: The function that returns the scope of the current request.
+        self.scope = scope
+
+        #: The number of lookups that found a current response.
+        self.hits = 0
+
+        #: The number of lookups that did not find a current response.
+        self.misses = 0
+
+        #: The number of stored responses discarded because a model on
+        #: which they depend had changed.
+        self.stale = 0
+
+        #: The number of times a change to a model was committed.
+        self.invalidations = 0
+
+        # The generations are prefixed with a token unique to this
+        # object so that responses stored by others are never current.
+        self._epoch = uuid4().hex
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    @property
+    def hit_ratio(self):
+        """The fraction of lookups that found a current response."""
+        lookups = self.hits + self.misses
+        return self.hits / float(lookups) if lookups else 0.0
+
+    def stats(self):
+        """Returns a dictionary containing the metrics for this cache.
+
+        The dictionary has the keys ``'hits'``, ``'misses'``,
+        ``'hit_ratio'``, ``'stale'``, ``'invalidations'``, and
+        ``'evictions'``. The number of evictions is ``None`` if the store
+        does not report it.
+
+        """
+        return dict(hits=self.hits, misses=self.misses,
+                    hit_ratio=self.hit_ratio, stale=self.stale,
+                    invalidations=self.invalidations,
+                    evictions=getattr(self.store, 'evictions', None))
+
+    def key(self, *parts):
+        """Returns the key under which to store the response for the
+        current request.
+
+        The key depends on the URL of the request with its query
+        parameters sorted, its :http:header:`Accept` header, the current
+        scope, and the additional hashable `parts`, which should include
+        the parameters of the request as modified by the preprocessors.
+
+        """
+        scope = self.scope() if self.scope is not None else None
+        args = sorted(request.args.items(multi=True))
+        token = repr((request.base_url, args, request.headers.get('Accept'),
+                      scope, parts))
+        return hashlib.sha1(token.encode('utf-8')).hexdigest()
+
+    def generations(self, models):
+        """Returns a value that identifies the current state of the
+        specified models.
+
+        `models` must be given in the same order each time; the returned
+        value changes whenever a change to any of them is committed.
+
+        """
+        with self._lock:
+            return (self._epoch, ) + tuple(self._generations.get(model, 0)
+                                           for model in models)
+
+    def get(self, key, models):
+        """Returns the response stored under `key` if it is current, or
+        ``None`` otherwise.
+
+        `models` are the models on which the response depends, as given
+        to :meth:`generations` when the response was stored.
+
+        """
+        entry = self.store.get(key)
+        if entry is not None and entry.generations != self.generations(models):
+            self.stale += 1
+            try:
+                del self.store[key]
+            except KeyError:
+                pass
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return current_app.response_class(entry.body, headers=entry.headers)
+
+    def set(self, key, generations, response):
+        """Stores the specified response under `key`.
+
+        `generations` must have been computed by :meth:`generations`
+        *before* the response was computed, so that if a change is
+        committed in the meantime the stored response is never returned.
+
+        """
+        headers = list(response.headers)
+        self.store[key] = CachedResponse(generations, response.get_data(),
+                                         headers)
+
+    def invalidate(self, models):
+        """Marks the responses that depend on any of the specified models
+        (or on any model from which they inherit) as stale.
+
+        """
+        with self._lock:
+            for model in models:
+                for mapper in sqlalchemy_inspect(model).iterate_to_root():
+                    model = mapper.class_
+                    self._generations[model] = \
+                        self._generations.get(model, 0) + 1
+            self.invalidations += 1
+
+    def watch(self, session):
+        """Invalidates responses whenever `session` commits changes to the
+        models on which they depend.
+
+        `session` may be a :class:`~sqlalchemy.orm.session.Session` or a
+        :class:`~sqlalchemy.orm.scoping.scoped_session`. Calling this
+        method more than once with the same session has no effect.
+
+        """
+        if event.contains(session, 'after_flush', self._record_changes):
+            return
+        event.listen(session, 'after_flush', self._record_changes)
+        event.listen(session, 'after_commit', self._invalidate_changes)
+
+    def record(self, session, models):
+        """Records that `session` changed the specified models without
+        flushing any instances, for example by executing an
+        :class:`~sqlalchemy.sql.expression.Insert` directly.
+
+        Responses that depend on the models are invalidated when the
+        session next commits. This has no effect unless :meth:`watch` has
+        been called with `session`.
+
+        """
+        if event.contains(session, 'after_flush', self._record_changes):
+            session.info.setdefault(self, set()).update(models)
+
+    def _record_changes(self, session, flush_context):
+        changed = session.info.setdefault(self, set())
+        for instance in chain(session.new, session.dirty, session.deleted):
+            changed.add(type(instance))
+
+    def _invalidate_changes(self, session):
+        changed = session.info.pop(self, None)
+        if changed:
+            self.invalidate(changed)
+
+
+class CachedAggregate(object):
+    """The result of evaluating functions stored in an
+    :class:`AggregateCache`.
+
+    `results` is the list of results of the functions and `expires` is
+    the time after which the result is no longer returned.
+
+    If `conditions` is not ``None``, the result is maintained
+    incrementally: `conditions` is the list of pairs ``(key, value)``
+    that each row must satisfy, `functions` is the list of pairs
+    ``(name, key)`` of the functions, and `counts` is the list of the
+    numbers of non-null values of the field of each function.
+
+    `related` indicates whether the filters refer to other models, in
+    which case the result is discarded whenever any change is
+    committed.
+
+    """
+
+    def __init__(self, results, expires, conditions=None, functions=None,
+                 counts=None, related=False):
+        self.results = results
+        self.expires = expires
+        self.conditions = conditions
+        self.functions = functions
+        self.counts = counts
+        self.related = related
+
+    def apply(self, old, new):
+        """Updates the results for a row whose column values changed
+        from the dictionary `old` to the dictionary `new`.
+
+        Either dictionary is ``None`` if the row was created or deleted,
+        respectively. Returns ``False`` if the update could not be made
+        because a required value is missing.
+
+        """
+        keys = [key for key, value in self.conditions]
+        keys.extend(key for name, key in self.functions)
+        for image in old, new:
+            if image is not None and any(key not in image for key in keys):
+                return False
+        for image, sign in (old, -1), (new, 1):
+            if image is None:
+                continue
+            if any(image[key] != value for key, value in self.conditions):
+                continue
+            for i, (name, key) in enumerate(self.functions):
+                value = image[key]
+                if value is None:
+                    continue
+                self.counts[i] += sign
+                if name == 'count':
+                    self.results[i] = self.counts[i]
+                elif self.counts[i] == 0:
+                    # The SQL sum of no values is NULL, not zero.
+                    self.results[i] = None
+                else:
+                    self.results[i] = (self.results[i] or 0) + sign * value
+        return True
+
+
+class AggregateCache(object):
+    """A cache of the results of the function evaluation endpoint.
+
+    Each result is keyed by the model, the function objects, and the
+    filter objects of the request, and is stored for at most `ttl`
+    seconds. At most `maxsize` results are stored; the least recently
+    used ones are discarded first.
+
+    When a session passed to :meth:`watch` commits changes to a model,
+    the results of ``count`` and ``sum`` functions of columns of the
+    model, filtered only by the equality of columns to constant values
+    (for strings, only where the collation of the column compares them
+    by their bytes), are updated in place from the rows created,
+    updated, and deleted in the transaction. Other results for that
+    model, and results whose filters refer to other models, are
+    discarded. Changes made in any other way, for example by another
+    process, are only seen once a result expires.
+
+    """
+
+    def __init__(self, ttl=DEFAULT_AGGREGATE_TTL,
+                 maxsize=DEFAULT_AGGREGATE_MAXSIZE):
+        #: The number of seconds for which a result is stored.
+        self.ttl = ttl
+
+        #: The number of lookups that found a current result.
+        self.hits = 0
+
+        #: The number of lookups that did not find a current result.
+        self.misses = 0
+
+        #: The number of times a result was updated in place.
+        self.updates = 0
+
+        self._entries = LRUCache(maxsize=maxsize)
+        # Map each model to the keys of the results for that model.
+        self._keys = defaultdict(set)
+        # The keys of the results whose filters refer to other models.
+        self._related_keys = set()
+        # Incremented whenever a watched session commits changes.
+        self._generation = 0
+        # The number of watched sessions whose flushed changes have not
+        # yet been committed or rolled back.
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def key(self, model, functions, filters):
+        """Returns the key under which to store the result of evaluating
+        the specified function objects on the instances of `model` that
+        match the specified filter objects.
+
+        """
+        return (model, json.dumps(functions, sort_keys=True),
+                json.dumps(filters, sort_keys=True))
+
+    def get(self, key):
+        """Returns a copy of the list of results stored under `key` if
+        it has not expired, or ``None`` otherwise.
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires <= time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return list(entry.results)
+
+    def generation(self):
+        """Returns a value that changes whenever a watched session
+        commits changes.
+
+        This must be called *before* computing a result to be stored with
+        :meth:`set`.
+
+        """
+        with self._lock:
+            return self._generation
+
+    def extra_columns(self, model, functions, filters, session):
+        """Returns the list of additional columns that must be selected
+        along with the specified functions so that their result can be
+        maintained incrementally.
+
+        `session` is the session with which the functions are evaluated.
+        The values of these columns must be given to :meth:`set`.
+
+        """
+        plan = self._plan(model, functions, filters, session)
+        if plan is None:
+            return []
+        return [func.count(getattr(model, key)) for name, key in plan[1]]
+
+    def set(self, key, generation, model, functions, filters, row, session):
+        """Stores the result of evaluating the specified functions under
+        `key`.
+
+        `row` is the row returned by the database, consisting of the
+        results of the functions followed by the values of the columns
+        returned by :meth:`extra_columns`. `generation` is the value
+        returned by :meth:`generation` before the result was computed.
+
+        The result is not stored if any change has been committed since
+        then, if `session` has changes that have not yet been committed,
+        since the result may not reflect them, or if any watched session
+        is committing changes, since the result may already reflect them
+        before they are applied to the stored results.
+
+        """
+        if session.info.get(self):
+            return
+        results = list(row[:len(functions)])
+        related = self._related(model, filters)
+        plan = None
+        if not related:
+            plan = self._plan(model, functions, filters, session)
+        if plan is None:
+            entry = CachedAggregate(results, time.time() + self.ttl,
+                                    related=related)
+        else:
+            conditions, incremental = plan
+            counts = list(row[len(functions):])
+            entry = CachedAggregate(results, time.time() + self.ttl,
+                                    conditions, incremental, counts)
+        with self._lock:
+            if self._generation != generation or self._pending:
+                return
+            self._entries[key] = entry
+            self._keys[model].add(key)
+            if related:
+                self._related_keys.add(key)
+
+    def clear(self):
+        """Removes all stored results."""
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self._related_keys.clear()
+
+    def watch(self, session):
+        """Updates or discards results whenever `session` commits changes
+        to the models on which they depend.
+
+        `session` may be a :class:`~sqlalchemy.orm.session.Session` or a
+        :class:`~sqlalchemy.orm.scoping.scoped_session`. Calling this
+        method more than once with the same session has no effect.
+
+        """
+        if event.contains(session, 'after_flush', self._record_changes):
+            return
+        event.listen(session, 'after_flush', self._record_changes)
+        event.listen(session, 'after_commit', self._apply_changes)
+        event.listen(session, 'after_transaction_end', self._discard_changes)
+
+    def record(self, session, models):
+        """Records that `session` changed the specified models without
+        flushing any instances, for example by executing an ``UPDATE``
+        statement on many rows.
+
+        The results for these models are discarded when the session
+        next commits. This has no effect unless :meth:`watch` has been
+        called with `session`.
+
+        """
+        if event.contains(session, 'after_flush', self._record_changes):
+            changes = self._changes(session)
+            for model in models:
+                changes[model] = None
+
+    def _changes(self, session):
+        """Returns the dictionary of changes recorded for the current
+        transaction of `session`, creating it if necessary.
+
+        While the dictionary exists, the changes have been sent to the
+        database but not yet applied to the stored results, so
+        :meth:`set` stores nothing; the database may commit them before
+        :meth:`_apply_changes` is called.
+
+        """
+        changes = session.info.get(self)
+        if changes is None:
+            changes = session.info[self] = {}
+            with self._lock:
+                self._pending += 1
+        return changes
+
+    def _pop_changes(self, session):
+        """Removes and returns the dictionary of changes recorded for the
+        current transaction of `session`, or ``None`` if there is none.
+
+        """
+        changes = session.info.pop(self, None)
+        if changes is not None:
+            with self._lock:
+                self._pending -= 1
+        return changes
+
+    def _plan(self, model, functions, filters, session):
+        """Returns the pair ``(conditions, functions)`` used to maintain
+        the result of evaluating the specified functions incrementally,
+        as described in :class:`CachedAggregate`, or ``None`` if it
+        cannot be maintained incrementally.
+
+        `session` is the session with which the functions are evaluated;
+        its dialect determines how strings are compared.
+
+        """
+        mapper = sqlalchemy_inspect(model)
+        dialect = session.get_bind(mapper=mapper).dialect.name
+        columns = mapper.column_attrs
+        conditions = []
+        for filt in filters or []:
+            if not isinstance(filt, dict):
+                return None
+            if sorted(filt) != ['name', 'op', 'val']:
+                return None
+            name, value = filt['name'], filt['val']
+            if filt['op'] not in EQUALITY_OPERATORS or name not in columns:
+                return None
+            if not _comparable(columns[name], value, dialect):
+                return None
+            conditions.append((name, value))
+        incremental = []
+        for function in functions:
+            name = str(function.get('name', '')).lower()
+            if name not in INCREMENTAL_FUNCTIONS or 'filter' in function:
+                return None
+            if function.get('field') not in columns:
+                return None
+            incremental.append((name, function['field']))
+        return conditions, incremental
+
+    def _related(self, model, filters):
+        """Returns ``True`` if any of the specified filter objects refers
+        to a model other than `model`.
+
+        """
+        relationships = sqlalchemy_inspect(model).relationships
+        for filt in filters or []:
+            if not isinstance(filt, dict):
+                return True
+            if filt.get('op') in ('has', 'any'):
+                return True
+            names = [filt.get('name'), filt.get('field')]
+            if any(isinstance(name, STRING_TYPES) and
+                   ('.' in name or name in relationships) for name in names):
+                return True
+            if any(key in filt for key in ('and', 'or', 'not')):
+                return True
+        return False
+
+    def _record_changes(self, session, flush_context):
+        changes = self._changes(session)
+        with self._lock:
+            watched = set(self._keys)
+        rows = chain(((instance, True, True) for instance in session.dirty),
+                     ((instance, False, True) for instance in session.new),
+                     ((instance, True, False) for instance in session.deleted))
+        for instance, has_old, has_new in rows:
+            cls = type(instance)
+            mapper = sqlalchemy_inspect(cls)
+            if not any(m.class_ in watched for m in mapper.iterate_to_root()):
+                changes[cls] = None
+            if changes.get(cls, ()) is None:
+                continue
+            state = sqlalchemy_inspect(instance)
+            old = _old_values(state) if has_old else None
+            new = _new_values(state) if has_new else None
+            changes.setdefault(cls, []).append((old, new))
+
+    def _apply_changes(self, session):
+        changes = self._pop_changes(session)
+        if not changes:
+            return
+        with self._lock:
+            self._generation += 1
+            for cls, rows in changes.items():
+                for mapper in sqlalchemy_inspect(cls).iterate_to_root():
+                    model = mapper.class_
+                    for key in list(self._keys.get(model, ())):
+                        self._apply(model, key, rows)
+            for key in list(self._related_keys):
+                self._discard(key[0], key)
+
+    def _apply(self, model, key, rows):
+        """Updates the result stored under `key` for each of the changed
+        rows, or discards it if that is not possible.
+
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self._keys[model].discard(key)
+            self._related_keys.discard(key)
+            return
+        if rows is None or entry.conditions is None:
+            self._discard(model, key)
+            return
+        for old, new in rows:
+            if not entry.apply(old, new):
+                self._discard(model, key)
+                return
+        self.updates += 1
+
+    def _discard(self, model, key):
+        try:
+            del self._entries[key]
+        except KeyError:
+            pass
+        self._keys[model].discard(key)
+        self._related_keys.discard(key)
+
+    def _discard_changes(self, session, transaction):
+        # After a commit, the changes have already been applied.
+        if transaction.parent is None:
+            self._pop_changes(session)
+
+
+def _comparable(column_property, value, dialect):
+    """Returns ``True`` if comparing `value` to the value of the
+    specified column in Python gives the same result as comparing them
+    in SQL, in a database of the dialect named `dialect`.
+
+    Strings are comparable only if the collation of the column is known
+    to compare them by their bytes.
+
+    """
+    if value is None:
+        return True
+    column_type = column_property.columns[0].type
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        return False
+    if isinstance(value, bool) or python_type is bool:
+        return isinstance(value, bool) and python_type is bool
+    if python_type in (int, float):
+        return isinstance(value, (int, float))
+    if python_type in STRING_TYPES:
+        return (isinstance(value, STRING_TYPES) and
+                _binary_collation(column_type, dialect))
+    return isinstance(value, python_type)
+
+
+def _binary_collation(column_type, dialect):
+    """Returns ``True`` if the collation of a string column of the
+    specified type is known to compare strings by their bytes in a
+    database of the dialect named `dialect`.
+
+    """
+    # Even the binary collations of MySQL ignore trailing spaces.
+    if dialect == 'mysql':
+        return False
+    collation = getattr(column_type, 'collation', None)
+    if collation is None:
+        return dialect in BINARY_DIALECTS
+    return collation.lower() in BINARY_COLLATIONS
+
+
+def _old_values(state):
+    """Returns the dictionary of the values of the column attributes of
+    the specified instance state as they were before the current flush.
+
+    Attributes whose previous values are unknown are omitted.
+
+    """
+    values = {}
+    for attr in state.mapper.column_attrs:
+        key = attr.key
+        if key in state.committed_state:
+            value = state.committed_state[key]
+            if value is NO_VALUE or value is NEVER_SET:
+                continue
+            values[key] = value
+        elif key in state.dict:
+            values[key] = state.dict[key]
+    return values
+
+
+def _new_values(state):
+    """Returns the dictionary of the loaded values of the column
+    attributes of the specified instance state.
+
+    """
+    return dict((attr.key, state.dict[attr.key])
+                for attr in state.mapper.column_attrs
+                if attr.key in state.dict)
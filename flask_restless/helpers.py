@@ -22,27 +22,48 @@ model.
    https://docs.sqlalchemy.org/en/latest/core/inspection.html
 
 """
+from collections import defaultdict
 import datetime
 import inspect
+import threading
+import weakref
 
 from dateutil.parser import parse as parse_datetime
 from sqlalchemy import Date
 from sqlalchemy import DateTime
 from sqlalchemy import Interval
+from sqlalchemy import Table
 from sqlalchemy import Time
+from sqlalchemy import event
 from sqlalchemy.exc import NoInspectionAvailable
 from sqlalchemy.ext.associationproxy import AssociationProxy
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.orm import Mapper
 from sqlalchemy.orm import RelationshipProperty
+from sqlalchemy.orm.exc import UnmappedColumnError
 from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import ColumnElement
 from sqlalchemy.inspection import inspect as sqlalchemy_inspect
 from werkzeug.urls import url_quote_plus
 
+#: The Content-Type we expect for most requests to APIs.
+#:
+#: The JSON API specification requires the content type to be
+#: ``application/vnd.api+json``.
+JSONAPI_MIMETYPE = 'application/vnd.api+json'
+
 #: Strings which, when received by the server as the value of a date or time
 #: field, indicate that the server should use the current time when setting the
 #: value of the field.
 CURRENT_TIME_MARKERS = ('CURRENT_TIMESTAMP', 'CURRENT_DATE', 'LOCALTIMESTAMP')
 
+#: The maximum number of values in the ``IN`` clause of a single query
+#: made by :func:`get_all_by`.
+#:
+#: Some databases limit the number of parameters in a query; for
+#: example, SQLite allows at most 999 by default.
+IN_CLAUSE_SIZE = 500
+
 
 def session_query(session, model):
     """Returns a SQLAlchemy query object for the specified `model`.
@@ -65,6 +86,203 @@ def session_query(session, model):
     return session.query(model)
 
 
+class ModelInfo(object):
+    """Introspected metadata about a single SQLAlchemy model class.
+
+    Most of the helper functions in this module are called once per
+    resource (or once per attribute of each resource) during
+    serialization, deserialization, and filtering. Walking the mapper's
+    descriptors each time is expensive, so an instance of this class
+    computes that information once per model class. Use
+    :func:`model_info` to get the (cached) instance for a model.
+
+    Information about relationships, columns, and primary keys is
+    computed when this object is created. Information that depends on
+    evaluating arbitrary attributes of the model (for example, whether a
+    hybrid property is settable) is computed the first time it is
+    requested for a given attribute name.
+
+    """
+
+    def __init__(self, model):
+        # Make sure that any newly defined mappers have been configured,
+        # since that may add attributes (for example, backrefs) to this
+        # model. This does nothing if there are no new mappers.
+        configure_mappers()
+        mapper = sqlalchemy_inspect(model)
+        descriptors = mapper.all_orm_descriptors
+
+        #: The model class described by this object.
+        self.model = model
+
+        #: The names of all descriptors of the model, including columns,
+        #: relationships, association proxies, and hybrid properties.
+        self.descriptor_names = frozenset(descriptors.keys())
+
+        #: The names of the relationships of the model (excluding
+        #: association proxies).
+        self.relationship_names = frozenset(mapper.relationships.keys())
+
+        # A mapping from name of each association proxy to the name of
+        # the local attribute through which it proxies.
+        association_proxies = {}
+        # The names of association proxies whose remote attribute is
+        # not a relationship.
+        scalar_collections = []
+        #: A mapping from relationship or association proxy name to a
+        #: Boolean representing whether it is a to-many relation.
+        self.uselist = {}
+        #: A mapping from relationship or association proxy name to the
+        #: related model class.
+        self.related_models = {}
+        for name in self.relationship_names:
+            prop = mapper.relationships[name]
+            self.uselist[name] = prop.uselist
+            self.related_models[name] = prop.mapper.class_
+        for name, descriptor in descriptors.items():
+            if not isinstance(descriptor, AssociationProxy):
+                continue
+            # Accessing the proxy via the class tells the proxy the
+            # class that owns it, which is necessary before accessing
+            # its local and remote attributes.
+            getattr(model, name)
+            local_key = descriptor.local_attr.key
+            association_proxies[name] = local_key
+            self.uselist[name] = descriptor.local_attr.property.uselist
+            remote_property = descriptor.remote_attr.property
+            if isinstance(remote_property, RelationshipProperty):
+                self.related_models[name] = remote_property.mapper.class_
+            else:
+                scalar_collections.append(name)
+
+        #: The names of each association proxy that proxies to a scalar
+        #: collection, as described in
+        #: :func:`assoc_proxy_scalar_collections`.
+        self.assoc_proxy_scalar_collections = tuple(
+            name for name in scalar_collections if self.uselist[name])
+
+        #: The names of the relationships of the model, as described in
+        #: :func:`get_relations`.
+        proxies_by_local_key = dict((v, k) for k, v in
+                                    association_proxies.items())
+        relations = []
+        for name in mapper.relationships.keys():
+            relations.append(name)
+            proxy = proxies_by_local_key.get(name)
+            if proxy is not None \
+               and proxy not in self.assoc_proxy_scalar_collections:
+                relations.append(proxy)
+        self.relations = tuple(relations)
+
+        #: The :class:`sqlalchemy.Column` objects that contain foreign
+        #: keys for relationships in the model.
+        self.foreign_key_columns = tuple(c for c in mapper.columns
+                                         if c.foreign_keys)
+
+        #: The names of the primary key columns of the model.
+        self.primary_key_names = tuple(c.name for c in mapper.primary_key)
+
+        #: The name of the attribute that holds the version counter of
+        #: the model (as configured by the ``version_id_col`` mapper
+        #: argument), or ``None`` if the model is not versioned.
+        self.version_id_key = None
+        if mapper.version_id_col is not None:
+            prop = mapper.get_property_by_column(mapper.version_id_col)
+            self.version_id_key = prop.key
+
+        # These are computed lazily, one attribute name at a time.
+        self._settable = {}
+        self._field_types = {}
+
+    def has_field(self, fieldname):
+        """Returns ``True`` if the model has the specified field or if it
+        has a settable hybrid property for this field name.
+
+        """
+        try:
+            return self._settable[fieldname]
+        except KeyError:
+            pass
+        if fieldname not in self.descriptor_names:
+            return False
+        field = sqlalchemy_inspect(self.model).all_orm_descriptors[fieldname]
+        # First, we check whether `fieldname` specifies a settable
+        # hybrid property. This is a bit flimsy: we check whether the
+        # `fset` attribute has been set on the `hybrid_property`
+        # instance. The `fset` instance attribute is only set if the
+        # user defined a hybrid property setter.
+        if hasattr(field, 'fset'):
+            result = field.fset is not None
+        else:
+            # At this point, we simply check that the attribute is not
+            # callable.
+            result = not callable(getattr(self.model, fieldname))
+        self._settable[fieldname] = result
+        return result
+
+    def field_type(self, fieldname):
+        """Returns the SQLAlchemy type of the field, as described in
+        :func:`get_field_type`.
+
+        """
+        try:
+            return self._field_types[fieldname]
+        except KeyError:
+            pass
+        result = _get_field_type(self.model, fieldname)
+        # Only remember results for names that are known to the mapper,
+        # so that arbitrary strings from clients do not fill the cache.
+        if fieldname in self.descriptor_names:
+            self._field_types[fieldname] = result
+        return result
+
+
+#: A cache of :class:`ModelInfo` objects, keyed by model class.
+#:
+#: The keys are weak references so that this cache does not keep model
+#: classes alive.
+_model_info_cache = weakref.WeakKeyDictionary()
+
+
+def model_info(model):
+    """Returns the :class:`ModelInfo` object for the specified model
+    class, creating it if necessary.
+
+    """
+    try:
+        return _model_info_cache[model]
+    except KeyError:
+        info = ModelInfo(model)
+        _model_info_cache[model] = info
+        return info
+
+
+@event.listens_for(Mapper, 'after_configured')
+def _clear_model_info_cache():
+    """Forgets all cached :class:`ModelInfo` objects whenever mappers are
+    (re)configured.
+
+    Configuring a new mapper may add attributes (for example, a backref)
+    to previously introspected models, so the cached information may be
+    stale.
+
+    """
+    _model_info_cache.clear()
+
+
+@event.listens_for(Mapper, 'instrument_class')
+def _clear_model_info_cache_on_new_mapper(mapper, cls):
+    """Forgets all cached :class:`ModelInfo` objects whenever a new
+    mapper is created.
+
+    SQLAlchemy configures new mappers lazily. Since a cache hit does
+    not inspect any mapper, the cache must be cleared here so that the
+    next lookup configures the new mapper (and sees any new backrefs).
+
+    """
+    _model_info_cache.clear()
+
+
 def assoc_proxy_scalar_collections(model):
     """Yields the name of each association proxy collection as a string.
 
@@ -81,12 +299,8 @@ def assoc_proxy_scalar_collections(model):
     .. versionadded:: 1.0.0
 
     """
-    mapper = sqlalchemy_inspect(model)
-    for k, v in mapper.all_orm_descriptors.items():
-        if isinstance(v, AssociationProxy) \
-           and not isinstance(v.remote_attr.property, RelationshipProperty) \
-           and is_like_list(model, v.local_attr.key):
-            yield k
+    for name in model_info(model).assoc_proxy_scalar_collections:
+        yield name
 
 
 def get_relations(model):
@@ -169,45 +383,11 @@ def get_relations(model):
         ['tags']
 
     """
-    mapper = sqlalchemy_inspect(model)
-
-    # If we didn't have to deal with association proxies, we could just
-    # do `return list(mapper.relationships)`.
-    #
-    # However, we need to deal with (at least) two different usages of
-    # association proxies: one in which the proxy is to a scalar
-    # collection (like a list of strings) and one in which the proxy is
-    # to a collection of instances (like a to-many relationship).
-    #
-    # First we record each association proxy and the the local attribute
-    # through which it proxies. This information is stored in a mapping
-    # from local attribute key to proxy name. For example, an
-    # association proxy defined like this::
-    #
-    #     tags = associationproxy('articletags', 'tag')
-    #
-    # is stored below as a dictionary entry mapping 'articletags' to
-    # 'tags'.
-    association_proxies = {}
-    for k, v in mapper.all_orm_descriptors.items():
-        if isinstance(v, AssociationProxy):
-            association_proxies[v.local_attr.key] = k
-
-    # Next we determine which association proxies represent scalar
-    # collections as opposed to to-many relationships. We need to ignore
-    # these.
-    scalar_collections = set(assoc_proxy_scalar_collections(model))
-
-    # Finally we find all plain old relationships and all association
-    # proxy relationships.
-    #
-    # If the association proxy is through an association object, we
-    # yield that too.
-    for r in mapper.relationships.keys():
-        yield r
-        proxy = association_proxies.get(r)
-        if proxy is not None and proxy not in scalar_collections:
-                yield association_proxies[r]
+    # The relationships are computed once per model; see the
+    # constructor of :class:`ModelInfo` for the details of how
+    # association proxies are handled.
+    for name in model_info(model).relations:
+        yield name
 
 
 def get_related_model(model, relationname):
@@ -238,6 +418,10 @@ def get_related_model(model, relationname):
     the model of the proxied remote relation.
 
     """
+    try:
+        return model_info(model).related_models[relationname]
+    except KeyError:
+        pass
     mapper = sqlalchemy_inspect(model)
     attribute = mapper.all_orm_descriptors[relationname]
     # HACK This is required for Python 3.3 only. I'm guessing it lazily
@@ -268,8 +452,7 @@ def foreign_key_columns(model):
     foreign keys for relationships in the specified model class.
 
     """
-    mapper = sqlalchemy_inspect(model)
-    return [c for c in mapper.columns if c.foreign_keys]
+    return list(model_info(model).foreign_key_columns)
 
 
 def foreign_keys(model):
@@ -285,22 +468,7 @@ def has_field(model, fieldname):
     settable hybrid property for this field name.
 
     """
-    mapper = sqlalchemy_inspect(model)
-    # Get all descriptors, which include columns, relationships, and
-    # other things like association proxies and hybrid properties.
-    descriptors = mapper.all_orm_descriptors
-    if fieldname not in descriptors:
-        return False
-    field = descriptors[fieldname]
-    # First, we check whether `fieldname` specifies a settable hybrid
-    # property. This is a bit flimsy: we check whether the `fset`
-    # attribute has been set on the `hybrid_property` instance. The
-    # `fset` instance attribute is only set if the user defined a hybrid
-    # property setter.
-    if hasattr(field, 'fset'):
-        return field.fset is not None
-    # At this point, we simply check that the attribute is not callable.
-    return not callable(getattr(model, fieldname))
+    return model_info(model).has_field(fieldname)
 
 
 def is_relationship(model, fieldname):
@@ -316,8 +484,7 @@ def is_relationship(model, fieldname):
     proxies.
 
     """
-    mapper = sqlalchemy_inspect(model)
-    return fieldname in mapper.relationships
+    return fieldname in model_info(model).relationship_names
 
 
 def get_field_type(model, fieldname):
@@ -326,6 +493,14 @@ def get_field_type(model, fieldname):
     This works for plain columns and association proxies. If `fieldname`
     specifies a hybrid property, this function returns `None`.
 
+    """
+    return model_info(model).field_type(fieldname)
+
+
+def _get_field_type(model, fieldname):
+    """Computes the return value of :func:`get_field_type` without
+    consulting the cache of :class:`ModelInfo` objects.
+
     """
     field = getattr(model, fieldname)
     if isinstance(field, ColumnElement):
@@ -346,8 +521,7 @@ def primary_key_names(model):
     The returned list contains the name of each primary key as a string.
 
     """
-    mapper = sqlalchemy_inspect(model)
-    return [column.name for column in mapper.primary_key]
+    return list(model_info(model).primary_key_names)
 
 
 def primary_key_value(instance, as_string=False):
@@ -389,6 +563,10 @@ def is_like_list(model_or_instance, relationname):
         model = get_model(model_or_instance)
     else:
         model = model_or_instance
+    try:
+        return model_info(model).uselist[relationname]
+    except KeyError:
+        pass
     mapper = sqlalchemy_inspect(model)
     relation = mapper.all_orm_descriptors[relationname]
     if isinstance(relation, AssociationProxy):
@@ -396,6 +574,52 @@ def is_like_list(model_or_instance, relationname):
     return relation.property.uselist
 
 
+def association_columns(model, relationname):
+    """Returns the columns of the association table through which the
+    many-to-many relationship named `relationname` on `model` is
+    defined, or ``None`` if rows cannot be safely inserted into and
+    deleted from that table directly.
+
+    The returned value is a three-tuple whose elements are the
+    association table, a list of pairs for the local side of the
+    relationship, and a list of pairs for the remote side. In each pair,
+    the left element is the name of an attribute of the model (on the
+    local side) or of the related model (on the remote side) and the
+    right element is the column of the association table whose value is
+    taken from that attribute.
+
+    ``None`` is returned if the relationship does not use an association
+    :class:`~sqlalchemy.Table`, is view-only, has validators on either
+    side, or if the association table has other columns that require a
+    value.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    prop = mapper.relationships.get(relationname)
+    if prop is None or prop.viewonly or not isinstance(prop.secondary, Table):
+        return None
+    # Validators would be bypassed by writing to the table directly.
+    properties = [prop] + list(prop._reverse_property)
+    if any(p.key in p.parent.validators for p in properties):
+        return None
+    try:
+        local = [(prop.parent.get_property_by_column(parent_column).key,
+                  column) for parent_column, column in prop.synchronize_pairs]
+        remote = [(prop.mapper.get_property_by_column(child_column).key,
+                   column)
+                  for child_column, column in prop.secondary_synchronize_pairs]
+    except UnmappedColumnError:
+        return None
+    used = set(column.key for key, column in local + remote)
+    for column in prop.secondary.columns:
+        if column.key in used:
+            continue
+        if not (column.nullable or column.default is not None or
+                column.server_default is not None):
+            return None
+    return prop.secondary, local, remote
+
+
 def is_mapped_class(cls):
     """Returns ``True`` if and only if the specified SQLAlchemy model class is
     a mapped class.
@@ -436,6 +660,120 @@ def get_by(session, model, pk_value, primary_key=None):
     return result.first()
 
 
+def _primary_key_coercer(model, pk_name):
+    """Returns a function that converts a primary key value given by a
+    client (usually a string) to the Python type of the primary key
+    column named `pk_name` of `model`.
+
+    Types that cannot be constructed from a string, like
+    :class:`datetime.datetime`, are parsed as by
+    :func:`string_to_datetime`. The returned function returns its
+    argument unchanged if it cannot be converted.
+
+    """
+    try:
+        python_type = getattr(model, pk_name).property.columns[0].type \
+            .python_type
+    except (AttributeError, IndexError, NotImplementedError):
+        python_type = None
+
+    def coerce(value):
+        if python_type is None or isinstance(value, python_type):
+            return value
+        try:
+            return python_type(value)
+        except (TypeError, ValueError):
+            pass
+        # A marker like ``CURRENT_TIMESTAMP`` would become a SQL function,
+        # which does not identify any single instance.
+        if value in CURRENT_TIME_MARKERS:
+            return value
+        try:
+            result = string_to_datetime(model, pk_name, value)
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            return value
+        return value if result is None else result
+
+    return coerce
+
+
+def get_all_by(session, model, pk_values, primary_key=None,
+               chunk_size=IN_CLAUSE_SIZE):
+    """Returns a list containing, for each value in `pk_values`, the
+    instance of `model` whose primary key has that value, or ``None`` if
+    no such instance exists.
+
+    This is equivalent to::
+
+        [get_by(session, model, value, primary_key) for value in pk_values]
+
+    but it makes at most one query for every `chunk_size` values. Values
+    that identify instances already in the identity map of `session`
+    (when `primary_key` is the primary key of the mapper) do not require
+    a query at all.
+
+    If `primary_key` is specified, the column specified by that string is
+    used as the primary key column. Otherwise, the column named ``id`` is
+    used.
+
+    """
+    pk_name = primary_key or primary_key_for(model)
+    coerce = _primary_key_coercer(model, pk_name)
+    mapper = sqlalchemy_inspect(model)
+    # The identity map can only be consulted if the values are the
+    # values of the primary key of the mapper.
+    use_identity_map = (len(mapper.primary_key) == 1 and
+                        mapper.get_property_by_column(mapper.primary_key[0])
+                        .key == pk_name)
+    found = {}
+    missing = []
+    for value in pk_values:
+        value = coerce(value)
+        if value in found:
+            continue
+        instance = None
+        if use_identity_map:
+            key = mapper.identity_key_from_primary_key([value])
+            instance = session.identity_map.get(key)
+            if instance is not None:
+                state = sqlalchemy_inspect(instance)
+                if (not isinstance(instance, model) or state.expired or
+                        not state.persistent):
+                    instance = None
+        found[value] = instance
+        if instance is None:
+            missing.append(value)
+    column = getattr(model, pk_name)
+    query = session_query(session, model)
+    for start in range(0, len(missing), chunk_size):
+        chunk = missing[start:start + chunk_size]
+        for instance in query.filter(column.in_(chunk)):
+            found[coerce(getattr(instance, pk_name))] = instance
+    return [found[coerce(value)] for value in pk_values]
+
+
+def resolve_identifiers(session, identifiers):
+    """Returns a list containing the instance identified by each pair in
+    `identifiers`, or ``None`` for each pair that identifies no instance.
+
+    `identifiers` is a list of pairs in which the left element is a
+    SQLAlchemy model class and the right element is the value of the
+    primary key of an instance of that model. The identifiers are
+    grouped by model and each group is fetched with :func:`get_all_by`,
+    so the number of queries depends on the number of distinct models,
+    not on the number of identifiers.
+
+    """
+    groups = defaultdict(list)
+    for model, pk_value in identifiers:
+        groups[model].append(pk_value)
+    instances = dict((model, iter(get_all_by(session, model, pk_values)))
+                     for model, pk_values in groups.items())
+    # Each group is in the same order as the given list, so taking the
+    # next instance from the group of each model restores that order.
+    return [next(instances[model]) for model, pk_value in identifiers]
+
+
 def string_to_datetime(model, fieldname, value):
     """Casts `value` to a :class:`datetime.datetime` or
     :class:`datetime.timedelta` object if the given field of the given
@@ -512,21 +850,285 @@ class Singleton(_Singleton('SingletonMeta', (object,), {})):
     pass
 
 
+class LRUCache(object):
+    """A mapping with at most `maxsize` entries that discards the least
+    recently used entry when it is full.
+
+    If `maxbytes` is not ``None``, entries are also discarded while the
+    total size of the values exceeds `maxbytes`. The size of a value is
+    computed by calling `sizeof` on it. A value larger than `maxbytes` is
+    not stored at all. If `maxsize` is ``None``, the number of entries is
+    limited only by `maxbytes`.
+
+    This is safe to use from multiple threads. Keys must be hashable;
+    since the same value may be returned to many callers, values should
+    be immutable.
+
+    """
+
+    # The entries are kept in a circular doubly linked list ordered from
+    # least recently used (just after the root) to most recently used
+    # (just before the root). Each link is a list of the form ``[prev,
+    # next, key, value, size]``.
+    _PREV, _NEXT, _KEY, _VALUE, _SIZE = 0, 1, 2, 3, 4
+
+    def __init__(self, maxsize=128, maxbytes=None, sizeof=len):
+        #: The maximum number of entries in this cache, or ``None``.
+        self.maxsize = maxsize
+
+        #: The maximum total size of the values in this cache, or
+        #: ``None``.
+        self.maxbytes = maxbytes
+
+        #: The function that computes the size of a value.
+        self.sizeof = sizeof
+
+        #: The total size of the values in this cache, if
+        #: :attr:`maxbytes` is not ``None``.
+        self.size = 0
+
+        #: The number of lookups that found an entry.
+        self.hits = 0
+
+        #: The number of lookups that did not find an entry.
+        self.misses = 0
+
+        #: The number of entries discarded to make room for others.
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._links = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, 0]
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def _unlink(self, link):
+        link[self._PREV][self._NEXT] = link[self._NEXT]
+        link[self._NEXT][self._PREV] = link[self._PREV]
+        del self._links[link[self._KEY]]
+        self.size -= link[self._SIZE]
+
+    def _is_full(self):
+        if self.maxsize is not None and len(self._links) > self.maxsize:
+            return True
+        return self.maxbytes is not None and self.size > self.maxbytes
+
+    def get(self, key, default=None):
+        """Returns the value for `key`, or `default` if there is none.
+
+        A successful lookup marks the entry as the most recently used.
+
+        """
+        with self._lock:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            prev, next_ = link[self._PREV], link[self._NEXT]
+            prev[self._NEXT] = next_
+            next_[self._PREV] = prev
+            last = self._root[self._PREV]
+            last[self._NEXT] = self._root[self._PREV] = link
+            link[self._PREV] = last
+            link[self._NEXT] = self._root
+            return link[self._VALUE]
+
+    def __setitem__(self, key, value):
+        size = 0
+        if self.maxbytes is not None:
+            size = self.sizeof(value)
+        with self._lock:
+            link = self._links.get(key)
+            if link is not None:
+                self._unlink(link)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            last = self._root[self._PREV]
+            link = [last, self._root, key, value, size]
+            last[self._NEXT] = self._root[self._PREV] = link
+            self._links[key] = link
+            self.size += size
+            while self._is_full():
+                self._unlink(self._root[self._NEXT])
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._unlink(self._links[key])
+
+    def clear(self):
+        """Removes all entries from this cache."""
+        with self._lock:
+            self._links.clear()
+            self._root[:] = [self._root, self._root, None, None, 0]
+            self.size = 0
+
+
+class APIRegistry(Singleton):
+    """The singleton index of the APIs created by every known
+    :class:`APIManager` object.
+
+    The global functions :func:`url_for`, :func:`collection_name`,
+    :func:`serializer_for`, :func:`model_for`, and
+    :func:`primary_key_for` are called once per resource (and once per
+    relationship) during serialization, so instead of asking each
+    :class:`APIManager` in turn, they consult the dictionaries kept
+    here. These are updated by :meth:`APIManager.create_api_blueprint`
+    via :meth:`add_api`.
+
+    Lookups that fail are remembered as well, since serialization
+    frequently asks about models for which no API has been created (for
+    example, when deciding whether to provide a "related" link). These
+    negative results are forgotten each time an API is created or an
+    :class:`APIManager` is registered.
+
+    """
+
+    def __init__(self):
+        #: A global set of created :class:`APIManager` objects.
+        self.created_managers = set()
+
+        #: A mapping from model to a pair whose left element is the
+        #: :class:`APIManager` that created an API for that model and
+        #: whose right element is the corresponding :class:`APIInfo`.
+        self._apis = {}
+
+        #: A mapping from collection name to a pair whose left element
+        #: is an :class:`APIManager` and whose right element is the
+        #: model known by that collection name.
+        self._models = {}
+
+        #: A mapping from model to the name of the primary key to use
+        #: for that model when none was given to
+        #: :meth:`APIManager.create_api_blueprint`.
+        self._primary_keys = {}
+
+        #: Models and collection names known *not* to have an API.
+        self._unknown_models = set()
+        self._unknown_collections = set()
+
+    def register(self, apimanager):
+        """Inform this object about the specified :class:`APIManager` object.
+
+        """
+        self.created_managers.add(apimanager)
+        self._forget_unknown()
+
+    def add_api(self, apimanager, model, info):
+        """Records that `apimanager` has created an API for `model`.
+
+        `info` is the :class:`APIInfo` describing the created API. If
+        another API has already been created for `model` (or under the
+        same collection name), the most recently created one wins.
+
+        """
+        self.created_managers.add(apimanager)
+        self._apis[model] = (apimanager, info)
+        self._models[info.collection_name] = (apimanager, model)
+        self._forget_unknown()
+
+    def _forget_unknown(self):
+        self._unknown_models.clear()
+        self._unknown_collections.clear()
+
+    def _reindex(self):
+        """Rebuilds the indices from the APIs created by each of the
+        currently known :class:`APIManager` objects.
+
+        This is only necessary if an :class:`APIManager` has been
+        removed from :attr:`created_managers`.
+
+        """
+        apis = {}
+        models = {}
+        for manager in self.created_managers:
+            for model, info in manager.created_apis_for.items():
+                apis[model] = (manager, info)
+                models[info.collection_name] = (manager, model)
+        self._apis = apis
+        self._models = models
+
+    def _lookup(self, index_name, unknown, key):
+        """Returns the pair stored under `key` in the index named by
+        `index_name`, or ``None`` if there is no such pair for any
+        currently known :class:`APIManager`.
+
+        """
+        if key in unknown:
+            return None
+        pair = getattr(self, index_name).get(key)
+        if pair is not None and pair[0] not in self.created_managers:
+            # The APIManager that created this API is no longer known,
+            # so the indices are stale.
+            self._reindex()
+            pair = getattr(self, index_name).get(key)
+        if pair is None:
+            unknown.add(key)
+        return pair
+
+    def api_for(self, model):
+        """Returns a pair whose left element is the :class:`APIManager`
+        that created an API for `model` and whose right element is the
+        corresponding :class:`APIInfo`, or ``None`` if there is no such
+        API.
+
+        """
+        return self._lookup('_apis', self._unknown_models, model)
+
+    def model_for(self, collection_name):
+        """Returns a pair whose left element is an :class:`APIManager`
+        and whose right element is the model whose collection name is
+        `collection_name`, or ``None`` if there is no such model.
+
+        """
+        return self._lookup('_models', self._unknown_collections,
+                            collection_name)
+
+    def default_primary_key(self, model):
+        """Returns the name of the primary key to use for `model` when
+        none was specified at the time of API creation.
+
+        This is ``'id'`` if that is one of the primary keys of `model`,
+        and otherwise the first primary key. The result is computed only
+        once for each model.
+
+        """
+        try:
+            return self._primary_keys[model]
+        except KeyError:
+            pk_names = primary_key_names(model)
+            primary_key = 'id' if 'id' in pk_names else pk_names[0]
+            self._primary_keys[model] = primary_key
+            return primary_key
+
+
 class KnowsAPIManagers:
     """An object that allows client code to register :class:`APIManager`
     objects.
 
+    Every such object shares the set of known :class:`APIManager`
+    objects with the :class:`APIRegistry` singleton.
+
     """
 
     def __init__(self):
+        #: The registry of APIs created by the known managers.
+        self.registry = APIRegistry()
+
         #: A global list of created :class:`APIManager` objects.
-        self.created_managers = set()
+        self.created_managers = self.registry.created_managers
 
     def register(self, apimanager):
         """Inform this object about the specified :class:`APIManager` object.
 
         """
-        self.created_managers.add(apimanager)
+        self.registry.register(apimanager)
 
 
 class ModelFinder(KnowsAPIManagers, Singleton):
@@ -536,16 +1138,14 @@ class ModelFinder(KnowsAPIManagers, Singleton):
         if _apimanager is not None:
             # This may raise ValueError.
             return _apimanager.model_for(resource_type, **kw)
-        for manager in self.created_managers:
-            try:
-                return self(resource_type, _apimanager=manager, **kw)
-            except ValueError:
-                pass
-        message = ('No model with collection name {0} is known to any'
-                   ' APIManager objects; maybe you have not set the'
-                   ' `collection_name` keyword argument when calling'
-                   ' `APIManager.create_api()`?').format(resource_type)
-        raise ValueError(message)
+        pair = self.registry.model_for(resource_type)
+        if pair is None:
+            message = ('No model with collection name {0} is known to any'
+                       ' APIManager objects; maybe you have not set the'
+                       ' `collection_name` keyword argument when calling'
+                       ' `APIManager.create_api()`?').format(resource_type)
+            raise ValueError(message)
+        return pair[1]
 
 
 class CollectionNameFinder(KnowsAPIManagers, Singleton):
@@ -558,15 +1158,14 @@ class CollectionNameFinder(KnowsAPIManagers, Singleton):
                            ' {1}').format(_apimanager, model)
                 raise ValueError(message)
             return _apimanager.collection_name(model, **kw)
-        for manager in self.created_managers:
-            try:
-                return self(model, _apimanager=manager, **kw)
-            except ValueError:
-                pass
-        message = ('Model {0} is not known to any APIManager'
-                   ' objects; maybe you have not called'
-                   ' APIManager.create_api() for this model.').format(model)
-        raise ValueError(message)
+        pair = self.registry.api_for(model)
+        if pair is None:
+            message = ('Model {0} is not known to any APIManager'
+                       ' objects; maybe you have not called'
+                       ' APIManager.create_api() for this'
+                       ' model.').format(model)
+            raise ValueError(message)
+        return pair[1].collection_name
 
 
 class UrlFinder(KnowsAPIManagers, Singleton):
@@ -581,23 +1180,19 @@ class UrlFinder(KnowsAPIManagers, Singleton):
                            ' {1}; maybe another APIManager instance'
                            ' did?').format(_apimanager, model)
                 raise ValueError(message)
-            return _apimanager.url_for(model, resource_id=resource_id,
-                                       relation_name=relation_name,
-                                       related_resource_id=related_resource_id,
-                                       relationship=relationship, **kw)
-        for manager in self.created_managers:
-            try:
-                return self(model, resource_id=resource_id,
-                            relation_name=relation_name,
-                            related_resource_id=related_resource_id,
-                            relationship=relationship, _apimanager=manager,
-                            **kw)
-            except ValueError:
-                pass
-        message = ('Model {0} is not known to any APIManager'
-                   ' objects; maybe you have not called'
-                   ' APIManager.create_api() for this model.').format(model)
-        raise ValueError(message)
+        else:
+            pair = self.registry.api_for(model)
+            if pair is None:
+                message = ('Model {0} is not known to any APIManager'
+                           ' objects; maybe you have not called'
+                           ' APIManager.create_api() for this'
+                           ' model.').format(model)
+                raise ValueError(message)
+            _apimanager = pair[0]
+        return _apimanager.url_for(model, resource_id=resource_id,
+                                   relation_name=relation_name,
+                                   related_resource_id=related_resource_id,
+                                   relationship=relationship, **kw)
 
 
 class SerializerFinder(KnowsAPIManagers, Singleton):
@@ -610,15 +1205,14 @@ class SerializerFinder(KnowsAPIManagers, Singleton):
                            ' {1}').format(_apimanager, model)
                 raise ValueError(message)
             return _apimanager.serializer_for(model, **kw)
-        for manager in self.created_managers:
-            try:
-                return self(model, _apimanager=manager, **kw)
-            except ValueError:
-                pass
-        message = ('Model {0} is not known to any APIManager'
-                   ' objects; maybe you have not called'
-                   ' APIManager.create_api() for this model.').format(model)
-        raise ValueError(message)
+        pair = self.registry.api_for(model)
+        if pair is None:
+            message = ('Model {0} is not known to any APIManager'
+                       ' objects; maybe you have not called'
+                       ' APIManager.create_api() for this'
+                       ' model.').format(model)
+            raise ValueError(message)
+        return pair[1].serializer
 
 
 class PrimaryKeyFinder(KnowsAPIManagers, Singleton):
@@ -631,14 +1225,17 @@ class PrimaryKeyFinder(KnowsAPIManagers, Singleton):
             model = instance_or_model.__class__
 
         if _apimanager is not None:
-            managers_to_search = [_apimanager]
-        else:
-            managers_to_search = self.created_managers
-        for manager in managers_to_search:
-            if model in manager.created_apis_for:
-                primary_key = manager.primary_key_for(model, **kw)
-                break
+            if model in _apimanager.created_apis_for:
+                primary_key = _apimanager.primary_key_for(model, **kw)
+                known = True
+            else:
+                known = False
         else:
+            pair = self.registry.api_for(model)
+            known = pair is not None
+            if known:
+                primary_key = pair[1].primary_key
+        if not known:
             message = ('Model "{0}" is not known to {1}; maybe you have not'
                        ' called APIManager.create_api() for this model?')
             if _apimanager is not None:
@@ -652,11 +1249,13 @@ class PrimaryKeyFinder(KnowsAPIManagers, Singleton):
         # a value for the `primary_key` keyword argument, then we must
         # compute the primary key name from the model directly.
         if primary_key is None:
-            pk_names = primary_key_names(model)
-            primary_key = 'id' if 'id' in pk_names else pk_names[0]
+            primary_key = self.registry.default_primary_key(model)
         return primary_key
 
 
+#: The registry of APIs shared by the global functions below.
+registry = APIRegistry()
+
 #: Returns the URL for the specified model, similar to :func:`flask.url_for`.
 #:
 #: `model` is a SQLAlchemy model class. This should be a model on which
@@ -17,6 +17,7 @@ their SQLAlchemy models.
 """
 from collections import defaultdict
 from collections import namedtuple
+from functools import partial
 from uuid import uuid1
 import sys
 
@@ -24,17 +25,18 @@ from sqlalchemy.inspection import inspect
 from flask import Blueprint
 from flask import url_for as flask_url_for
 
-from .helpers import collection_name
-from .helpers import model_for
-from .helpers import primary_key_for
-from .helpers import serializer_for
-from .helpers import url_for
+from .helpers import model_info
+from .helpers import registry
+from .metrics import MetricsView
 from .serialization import DefaultSerializer
 from .serialization import DefaultDeserializer
 from .views import API
+from .views import compress_response
 from .views import FunctionAPI
+from .views import OperationsAPI
 from .views import RelationshipAPI
 from .views import SchemaView
+from .workers import WorkerPool
 
 #: The names of HTTP methods that allow fetching information.
 READONLY_METHODS = frozenset(('GET', ))
@@ -149,6 +151,44 @@ class APIManager(object):
     information on using preprocessors and postprocessors, see
     :doc:`processors`.
 
+    If `atomic_operations` is ``True``, this object also creates an
+    endpoint at ``/operations`` (below `url_prefix`) that performs many
+    operations on the created APIs in a single request and a single
+    database transaction. For more information, see :ref:`operations`.
+
+    `deferred_postprocessors` must be a dictionary like `postprocessors`,
+    but its functions are applied in the background after the changes
+    made by a request have been committed, on the
+    :class:`~flask_restless.WorkerPool` given by `worker_pool`. If
+    `worker_pool` is ``None``, a pool with the default settings is
+    created when it is first needed. As with `postprocessors`, these
+    functions are executed before those given for each individual model.
+    For more information, see :ref:`deferred`.
+
+    `server_timing` is a :class:`~flask_restless.ServerTiming` that
+    measures the time spent in each phase of handling the requests to the
+    APIs created by this object. If it is ``None``, requests are not
+    measured at all. For more information, see :ref:`servertiming`.
+
+    `statement_counter` is a :class:`~flask_restless.StatementCounter`
+    that counts the SQL statements executed by each request to the APIs
+    created by this object and detects probable N + 1 queries. For more
+    information, see :ref:`statementcounter`.
+
+    `metrics` is a :class:`~flask_restless.Metrics` that records metrics
+    of the requests to the APIs created by this object. If it is not
+    ``None``, this object also creates an endpoint at ``/metrics`` (below
+    `url_prefix`) that exposes them in the text format of Prometheus. For
+    more information, see :ref:`metrics`.
+
+    `slow_request_log` is a :class:`~flask_restless.SlowRequestLog` that
+    logs the requests to the APIs created by this object that take longer
+    than its threshold. For more information, see :ref:`slowlog`.
+
+    `profiler` is a :class:`~flask_restless.SamplingProfiler` that
+    profiles a sample of the requests to each endpoint of the APIs
+    created by this object. For more information, see :ref:`profiling`.
+
     """
 
     #: The format of the name of the API view for a given model.
@@ -158,7 +198,11 @@ class APIManager(object):
     APINAME_FORMAT = '{0}api'
 
     def __init__(self, app=None, session=None, flask_sqlalchemy_db=None,
-                 preprocessors=None, postprocessors=None, url_prefix=None):
+                 preprocessors=None, postprocessors=None, url_prefix=None,
+                 atomic_operations=False, deferred_postprocessors=None,
+                 worker_pool=None, server_timing=None,
+                 statement_counter=None, metrics=None,
+                 slow_request_log=None, profiler=None):
         if session is None and flask_sqlalchemy_db is None:
             msg = 'must specify either `flask_sqlalchemy_db` or `session`'
             raise ValueError(msg)
@@ -166,15 +210,12 @@ class APIManager(object):
         self.app = app
 
         # Stash this instance so that it can be examined later by the global
-        # `url_for`, `model_for`, and `collection_name` functions.
+        # `url_for`, `model_for`, and `collection_name` functions, all of
+        # which share a single registry.
         #
         # TODO This is a bit of poor code style because it requires the
         # APIManager to know about these global functions that use it.
-        url_for.register(self)
-        model_for.register(self)
-        collection_name.register(self)
-        serializer_for.register(self)
-        primary_key_for.register(self)
+        registry.register(self)
 
         #: A mapping whose keys are models for which this object has
         #: created an API via the :meth:`create_api_blueprint` method
@@ -182,6 +223,13 @@ class APIManager(object):
         #: those models.
         self.created_apis_for = {}
 
+        #: A mapping whose keys are the collection names of models for
+        #: which this object has created an API and whose values are
+        #: the corresponding models.
+        #:
+        #: This is the inverse of :attr:`.created_apis_for`.
+        self.models_by_collection_name = {}
+
         # TODO In Python 2.7, this can just be
         #
         #     self.models = self.created_apis_for.viewkeys()
@@ -214,14 +262,43 @@ class APIManager(object):
         # self.restless_info = RestlessInfo(session, pre, post)
         self.pre = preprocessors or {}
         self.post = postprocessors or {}
+        self.deferred = deferred_postprocessors or {}
         self.session = session
 
+        #: The :class:`~flask_restless.WorkerPool` on which deferred
+        #: postprocessors are executed.
+        self.worker_pool = worker_pool
+
+        #: The :class:`~flask_restless.ServerTiming` that measures requests
+        #: to the created APIs, or ``None``.
+        self.server_timing = server_timing
+
+        #: The :class:`~flask_restless.StatementCounter` that counts the
+        #: SQL statements executed by requests to the created APIs, or
+        #: ``None``.
+        self.statement_counter = statement_counter
+
+        #: The :class:`~flask_restless.Metrics` that records metrics of
+        #: requests to the created APIs, or ``None``.
+        self.metrics = metrics
+
+        #: The :class:`~flask_restless.SlowRequestLog` that logs slow
+        #: requests to the created APIs, or ``None``.
+        self.slow_request_log = slow_request_log
+
+        #: The :class:`~flask_restless.SamplingProfiler` that profiles a
+        #: sample of the requests to the created APIs, or ``None``.
+        self.profiler = profiler
+
         #: The default URL prefix for APIs created by this manager.
         #:
         #: This can be overriden by the `url_prefix` keyword argument in the
         #: :meth:`create_api` method.
         self.url_prefix = url_prefix
 
+        #: Whether to create the atomic operations endpoint.
+        self.atomic_operations = atomic_operations
+
         # if self.app is not None:
         #     self.init_app(self.app)
 
@@ -254,6 +331,11 @@ class APIManager(object):
         :attr:`.models`, so changes to :attr:`.models` will be reflected
         in the response.
 
+        If :attr:`.atomic_operations` is ``True``, the blueprint also
+        has the route ``/operations`` for the atomic operations endpoint.
+        If :attr:`.metrics` is not ``None``, it also has the route
+        ``/metrics`` for the metrics endpoint.
+
         """
         # It is important that `self.models` is being passed as
         # reference here, since it will be updated each time
@@ -270,6 +352,14 @@ class APIManager(object):
         name = 'manager{0}.schema'.format(id(self))
         blueprint = Blueprint(name, __name__, url_prefix=url_prefix)
         blueprint.add_url_rule('', view_func=schema_view)
+        if self.atomic_operations:
+            operations_view = OperationsAPI.as_view('operationsapi',
+                                                    self.session, self.models)
+            blueprint.add_url_rule('/operations', methods=['POST'],
+                                   view_func=operations_view)
+        if self.metrics is not None:
+            metrics_view = MetricsView.as_view('metricsview', self.metrics)
+            blueprint.add_url_rule('/metrics', view_func=metrics_view)
         return blueprint
 
     def model_for(self, collection_name):
@@ -294,13 +384,8 @@ class APIManager(object):
             <class 'mymodels.Person'>
 
         """
-        # Reverse the dictionary.
-        #
-        # TODO In Python 3 this should be a dict comprehension.
-        models = dict((info.collection_name, model)
-                      for model, info in self.created_apis_for.items())
         try:
-            return models[collection_name]
+            return self.models_by_collection_name[collection_name]
         except KeyError:
             raise ValueError('Collection name {0} unknown. Be sure to set the'
                              ' `collection_name` keyword argument when calling'
@@ -453,7 +538,20 @@ class APIManager(object):
                              serializer_class=None, deserializer_class=None,
                              includes=None, allow_to_many_replacement=False,
                              allow_delete_from_to_many_relationships=False,
-                             allow_client_generated_ids=False):
+                             allow_client_generated_ids=False,
+                             allow_bulk_creation=False, allow_patch_many=False,
+                             allow_delete_many=False, max_bulk_rows=None,
+                             passive_deletes=False,
+                             optimistic_concurrency=False, version_column=None,
+                             return_changed_attributes=False,
+                             deferred_postprocessors=None, etags=False,
+                             weak_etags=False, last_modified_column=None,
+                             validator_query=False, response_cache=None,
+                             compress=False, compression_level=6,
+                             compression_threshold=500,
+                             max_function_groups=100,
+                             max_histogram_buckets=1000,
+                             aggregate_cache=None):
         """Creates and returns a ReSTful API interface as a blueprint, but does
         not register it on any :class:`flask.Flask` application.
 
@@ -545,6 +643,20 @@ class APIManager(object):
         request. For information on the request format, see
         :doc:`functionevaluation`. This is ``False`` by default.
 
+        `max_function_groups` is the maximum number of groups in a
+        response from the function evaluation endpoint when the client
+        groups the results, as described in :ref:`groupedfunctions`.
+
+        `max_histogram_buckets` is the maximum number of buckets in a
+        response from the function evaluation endpoint when the client
+        requests a histogram, as described in :ref:`histograms`.
+
+        `aggregate_cache` is a :class:`~flask_restless.AggregateCache`
+        in which to store the results of the function evaluation
+        endpoint. The same cache may be shared by several APIs. By
+        default, results are not cached. For more information, see
+        :ref:`aggregatecache`.
+
         .. warning::
 
            If ``allow_functions`` is ``True``, you must not create an
@@ -648,6 +760,96 @@ class APIManager(object):
         this be a UUID. This is ``False`` by default. For more information, see
         :doc:`creating`.
 
+        If `allow_bulk_creation` is ``True`` and this API allows
+        :http:method:`post` requests, the server will allow the client to
+        create several resources in a single request by providing a list
+        of resource objects as the primary data of the request document.
+        This is ``False`` by default. For more information, see
+        :ref:`bulkcreation`.
+
+        If `allow_patch_many` is ``True`` and this API allows
+        :http:method:`patch` requests, the server will allow the client to
+        update every resource in the collection that matches the filters
+        given in the query parameters with a single request, which is
+        performed by a single ``UPDATE`` statement. Similarly, if
+        `allow_delete_many` is ``True`` and this API allows
+        :http:method:`delete` requests, the client may delete every
+        matching resource with a single ``DELETE`` statement.
+        `max_bulk_rows` is the maximum number of resources that such a
+        request may affect; by default there is no limit. Both are
+        ``False`` by default. For more information, see :ref:`patchmany`
+        and :ref:`deletemany`.
+
+        If `passive_deletes` is ``True``, a request to delete a single
+        resource executes a ``DELETE`` statement directly instead of
+        loading the related resources so that SQLAlchemy can cascade the
+        deletion to them; the database is expected to handle the rows
+        that refer to the deleted row, for example with ``ON DELETE
+        CASCADE``. This is ``False`` by default. For more information,
+        see :ref:`passivedeletes`.
+
+        If `optimistic_concurrency` is ``True``, requests to update or
+        delete a resource that have an :http:header:`If-Match` header
+        succeed only if the entity tag in that header matches the current
+        version of the resource, and otherwise receive a
+        :http:statuscode:`412` response. The version is stored in the
+        version counter of `model` (as configured by the
+        ``version_id_col`` mapper argument), or in the attribute named by
+        `version_column`, which must change whenever the resource is
+        updated. This is ``False`` by default. For more information, see
+        :ref:`optimisticconcurrency`.
+
+        If `return_changed_attributes` is ``True``, the response to a
+        request to update a resource of a model whose columns are modified
+        by the server on updates contains only the attributes and
+        relationships given in the request, those modified by the server,
+        and the relationships requested by the client, instead of the
+        entire resource. This is ``False`` by default. For more
+        information, see :ref:`changedattributes`.
+
+        `deferred_postprocessors` must be a dictionary like
+        `postprocessors`, but its functions are applied in the background,
+        on the worker pool of this object, after the changes made by a
+        request have been committed. For more information, see
+        :ref:`deferred`.
+
+        If `etags` is ``True``, responses to :http:method:`get` requests
+        will include an :http:header:`ETag` header computed from the body
+        of the response, and requests with a matching
+        :http:header:`If-None-Match` header will receive a
+        :http:statuscode:`304` response. If `weak_etags` is ``True``, the
+        entity tags will be weak; for models with a version counter (or
+        if `last_modified_column` is given), weak entity tags are computed
+        without serializing the requested resources. If
+        `last_modified_column` is the name of a date/time attribute of
+        `model`, responses will include a :http:header:`Last-Modified`
+        header and requests with an :http:header:`If-Modified-Since`
+        header will be handled accordingly. If `validator_query` is
+        ``True``, these validators are computed by a single query for the
+        version counter and/or `last_modified_column` of the requested
+        resources (or, if `weak_etags` is ``True``, an aggregate of them
+        for collections) before any resources are fetched; this requires
+        `last_modified_column` or both `weak_etags` and a model with a
+        version counter. All of these are disabled by default. For more
+        information, see :ref:`conditionalrequests`.
+
+        `response_cache` is a :class:`~flask_restless.ResponseCache`
+        in which to store the responses to :http:method:`get` requests for
+        collections of resources and individual resources. The same cache
+        may be shared by several APIs. Stored responses are invalidated
+        when the session commits changes to the models on which they
+        depend. By default, responses are not cached. For more
+        information, see :ref:`responsecache`.
+
+        If `compress` is ``True``, the body of each response from the
+        created API is compressed with the best content coding accepted by
+        the client (``br`` if the :mod:`brotli` module is installed, then
+        ``gzip`` and ``deflate``). `compression_level` is the compression
+        level, from 1 (fastest) to 9 (smallest), and bodies smaller than
+        `compression_threshold` bytes are not compressed. Compression is
+        disabled by default. For more information, see
+        :ref:`compression`.
+
         """
         # Perform some sanity checks on the provided keyword arguments.
         if only is not None and exclude is not None:
@@ -656,6 +858,23 @@ class APIManager(object):
         if collection_name == '':
             msg = 'Collection name must be nonempty'
             raise IllegalArgumentError(msg)
+        if (validator_query and last_modified_column is None and
+                (not weak_etags or model_info(model).version_id_key is None)):
+            msg = ('Cannot use a validator query without a version counter'
+                   ' and weak ETags, or a last modified column')
+            raise IllegalArgumentError(msg)
+        if (optimistic_concurrency and version_column is None and
+                model_info(model).version_id_key is None):
+            msg = ('Cannot use optimistic concurrency control without a'
+                   ' version counter or a version column')
+            raise IllegalArgumentError(msg)
+        if version_column is not None and not hasattr(model, version_column):
+            msg = 'no attribute "{0}" on model {1}'
+            msg = msg.format(version_column, model)
+            raise IllegalArgumentError(msg)
+        if compress and not 1 <= compression_level <= 9:
+            msg = 'Compression level must be between 1 and 9'
+            raise IllegalArgumentError(msg)
         if collection_name is None:
             # If the model is polymorphic in a single table inheritance
             # scenario, this should *not* be the tablename, but perhaps
@@ -680,6 +899,14 @@ class APIManager(object):
             preprocessors_[key] = value + preprocessors_[key]
         for key, value in self.post.items():
             postprocessors_[key] = value + postprocessors_[key]
+        deferred_ = defaultdict(list)
+        deferred_.update(deferred_postprocessors or {})
+        for key, value in self.deferred.items():
+            deferred_[key] = value + deferred_[key]
+        if any(deferred_.values()):
+            if self.worker_pool is None:
+                self.worker_pool = WorkerPool()
+            self.worker_pool.watch(self.session)
         # Validate that all the additional attributes exist on the model.
         if additional_attributes is not None:
             for attr in additional_attributes:
@@ -708,17 +935,46 @@ class APIManager(object):
         #
         # Rename some variables with long names for the sake of brevity.
         atmr = allow_to_many_replacement
+        rca = return_changed_attributes
         api_view = API.as_view(apiname, self.session, model,
                                preprocessors=preprocessors_,
                                postprocessors=postprocessors_,
                                primary_key=primary_key,
                                validation_exceptions=validation_exceptions,
                                allow_to_many_replacement=atmr,
+                               allow_bulk_creation=allow_bulk_creation,
+                               max_bulk_rows=max_bulk_rows,
+                               passive_deletes=passive_deletes,
+                               optimistic_concurrency=optimistic_concurrency,
+                               version_column=version_column,
+                               return_changed_attributes=rca,
                                page_size=page_size,
                                max_page_size=max_page_size,
                                serializer=serializer,
                                deserializer=deserializer,
-                               includes=includes)
+                               includes=includes,
+                               etags=etags,
+                               weak_etags=weak_etags,
+                               last_modified_column=last_modified_column,
+                               validator_query=validator_query,
+                               response_cache=response_cache,
+                               aggregate_cache=aggregate_cache,
+                               deferred_postprocessors=deferred_,
+                               worker_pool=self.worker_pool,
+                               server_timing=self.server_timing,
+                               statement_counter=self.statement_counter,
+                               metrics=self.metrics,
+                               slow_request_log=self.slow_request_log,
+                               profiler=self.profiler)
+        if response_cache is not None:
+            response_cache.watch(self.session)
+        if aggregate_cache is not None:
+            aggregate_cache.watch(self.session)
+        if self.metrics is not None:
+            if response_cache is not None:
+                self.metrics.add_cache('response', response_cache)
+            if aggregate_cache is not None:
+                self.metrics.add_cache('aggregate', aggregate_cache)
 
         # add the URL rules to the blueprint: the first is for methods on the
         # collection only, the second is for methods which may or may not
@@ -734,6 +990,10 @@ class APIManager(object):
             prefix = DEFAULT_URL_PREFIX
         blueprint = Blueprint(name, __name__, url_prefix=prefix)
         add_rule = blueprint.add_url_rule
+        if compress:
+            blueprint.after_request(partial(compress_response,
+                                            level=compression_level,
+                                            threshold=compression_threshold))
 
         # The URLs that will be routed below.
         collection_url = '/{0}'.format(collection_name)
@@ -763,6 +1023,17 @@ class APIManager(object):
                       primary_key=primary_key,
                       validation_exceptions=validation_exceptions,
                       allow_to_many_replacement=allow_to_many_replacement,
+                      etags=etags,
+                      weak_etags=weak_etags,
+                      last_modified_column=last_modified_column,
+                      aggregate_cache=aggregate_cache,
+                      deferred_postprocessors=deferred_,
+                      worker_pool=self.worker_pool,
+                      server_timing=self.server_timing,
+                      statement_counter=self.statement_counter,
+                      metrics=self.metrics,
+                      slow_request_log=self.slow_request_log,
+                      profiler=self.profiler,
                       # Keyword arguments RelationshipAPI.__init__()
                       allow_delete_from_to_many_relationships=adftmr)
         # When PATCH is allowed, certain non-PATCH requests are allowed
@@ -785,6 +1056,18 @@ class APIManager(object):
                                    related_resource_id=None)
         add_rule(collection_url, view_func=api_view,
                  methods=collection_methods, defaults=collection_defaults)
+        # Updating or deleting many resources at once must be explicitly
+        # enabled.
+        collection_methods = set()
+        if allow_patch_many:
+            collection_methods.add('PATCH')
+        if allow_delete_many:
+            collection_methods.add('DELETE')
+        collection_methods = frozenset(collection_methods) & methods
+        if collection_methods:
+            add_rule(collection_url, view_func=api_view,
+                     methods=collection_methods,
+                     defaults=dict(resource_id=None))
 
         # The URL for accessing a single resource. (DELETE and PATCH are
         # special because the :meth:`API.delete` and :meth:`API.patch` methods
@@ -820,8 +1103,16 @@ class APIManager(object):
         # evaluating functions on all instances of the specified model
         if allow_functions:
             eval_api_name = '{0}.eval'.format(apiname)
-            eval_api_view = FunctionAPI.as_view(eval_api_name, self.session,
-                                                model)
+            eval_api_view = FunctionAPI.as_view(
+                eval_api_name, self.session, model,
+                max_groups=max_function_groups,
+                max_buckets=max_histogram_buckets,
+                aggregate_cache=aggregate_cache,
+                server_timing=self.server_timing,
+                statement_counter=self.statement_counter,
+                metrics=self.metrics,
+                slow_request_log=self.slow_request_log,
+                profiler=self.profiler)
             eval_endpoint = '/eval{0}'.format(collection_url)
             eval_methods = ['GET']
             blueprint.add_url_rule(eval_endpoint, methods=eval_methods,
@@ -829,9 +1120,12 @@ class APIManager(object):
 
         # Finally, record that this APIManager instance has created an API for
         # the specified model.
-        self.created_apis_for[model] = APIInfo(collection_name, blueprint.name,
-                                               serializer, primary_key)
+        info = APIInfo(collection_name, blueprint.name, serializer,
+                       primary_key)
+        self.created_apis_for[model] = info
+        self.models_by_collection_name[collection_name] = model
         self.models.add(model)
+        registry.add_api(self, model, info)
         return blueprint
 
     def create_api(self, *args, **kw):
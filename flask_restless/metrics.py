@@ -0,0 +1,381 @@
+# metrics.py - recording metrics of the requests to created APIs
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Recording metrics of the requests to the created APIs.
+
+The main class in this module, :class:`Metrics`, records the number,
+latency, and size of the requests handled by the views of an
+:class:`~flask_restless.APIManager`, along with the effectiveness of
+its caches, and exposes them in the text format of `Prometheus`_. For
+more information, see :ref:`metrics`.
+
+.. _Prometheus: https://prometheus.io/docs/instrumenting/exposition_formats/
+
+"""
+from bisect import bisect_left
+from functools import wraps
+import threading
+
+from flask import current_app
+from flask import Response
+from flask import request
+from flask.views import MethodView
+from werkzeug.exceptions import HTTPException
+
+from .timing import clock
+
+#: The key in the WSGI environment of the dictionary of quantities
+#: observed so far in the current request, if it is being recorded.
+METRICS_ENVIRON_KEY = 'flask_restless.metrics'
+
+#: The MIME type of the text format of Prometheus.
+METRICS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+#: The default upper bounds, in seconds, of the buckets of the histogram
+#: of request latencies.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+#: The prefix of the name of each metric.
+PREFIX = 'flask_restless_'
+
+#: The counters summed over the requests to each endpoint, as triples of
+#: the key in the dictionary of observed quantities, the name of the
+#: metric, and its description.
+SUMS = (
+    ('rows', 'rows_returned_total',
+     'Number of primary resources in response documents.'),
+    ('included', 'included_resources_total',
+     'Number of included resources in response documents.'),
+    ('bytes', 'response_bytes_total',
+     'Number of bytes in response bodies.'),
+    ('count_seconds', 'count_query_seconds_total',
+     'Time spent executing queries that count the resources in a'
+     ' collection.'),
+)
+
+#: The names of the labels that identify an endpoint.
+LABELS = ('collection', 'endpoint', 'method')
+
+
+def observe(name, value):
+    """Adds `value` to the quantity named `name` observed in the current
+    request, if it is being recorded by a :class:`Metrics`.
+
+    """
+    observed = request.environ.get(METRICS_ENVIRON_KEY)
+    if observed is not None:
+        observed[name] = observed.get(name, 0) + value
+
+
+def observe_document(document):
+    """Observes the number of primary and included resources in the
+    specified JSON API document, if the current request is being
+    recorded by a :class:`Metrics`.
+
+    """
+    observed = request.environ.get(METRICS_ENVIRON_KEY)
+    if observed is None or not isinstance(document, dict):
+        return
+    data = document.get('data')
+    if isinstance(data, list):
+        observed['rows'] = len(data)
+    elif data is not None:
+        observed['rows'] = 1
+    observed['included'] = len(document.get('included') or ())
+
+
+def endpoint_name(kind, kw):
+    """Returns the name of the endpoint of a view whose kind of endpoint
+    is `kind`, as given by the ``endpoint_kind`` attribute of the view,
+    when it is called with the keyword arguments `kw`.
+
+    The views of resources provide several endpoints, named
+    ``'collection'``, ``'resource'``, and ``'related'``.
+
+    """
+    if kind == 'resource':
+        if kw.get('resource_id') is None:
+            return 'collection'
+        if kw.get('relation_name') is not None:
+            return 'related'
+    return kind
+
+
+def escape(value):
+    """Returns the specified label value escaped for the text format of
+    Prometheus.
+
+    """
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"')
+
+
+def format_labels(names, values):
+    """Returns the text format of the labels with the specified names
+    and values.
+
+    """
+    pairs = ('{0}="{1}"'.format(name, escape(value))
+             for name, value in zip(names, values))
+    return '{' + ','.join(pairs) + '}'
+
+
+def merge(totals, shard):
+    """Adds the quantities recorded in the dictionary `shard` to those
+    in the dictionary `totals`, in place.
+
+    The values of both dictionaries are as described in
+    :meth:`Metrics.collect`.
+
+    """
+    # Copying is atomic, whereas iterating over a dictionary that another
+    # thread is changing is not.
+    for key, value in list(shard.items()):
+        if key[0] == 'duration':
+            total = totals.setdefault(key, [0] * len(value))
+            for i, x in enumerate(list(value)):
+                total[i] += x
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def format_value(value):
+    """Returns the text format of the specified sample value."""
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Metrics(object):
+    """Records metrics of the requests to the views of an
+    :class:`~flask_restless.APIManager` and exposes them in the text
+    format of Prometheus.
+
+    For each collection, kind of endpoint, and HTTP method, this object
+    records the number of requests by status code, a histogram of their
+    latencies whose buckets have the upper bounds (in seconds) given by
+    `buckets`, the number of primary and included resources in the
+    response documents, the number of bytes in the response bodies, and
+    the time spent counting the resources in a collection. It also
+    exposes the number of hits and misses of each cache used by the
+    created APIs.
+
+    To make recording cheap when requests are handled by many threads,
+    each thread records into its own shard, without locking, and the
+    shards are merged when the metrics are exposed. The shards of threads
+    that have exited are folded into a single dictionary of totals at
+    that time, so that servers that start a thread per request do not
+    accumulate shards.
+
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        #: The upper bounds of the buckets of the latency histogram.
+        self.buckets = tuple(sorted(buckets))
+
+        self._caches = []
+        self._shards = {}
+        self._totals = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def add_cache(self, kind, cache):
+        """Exposes the hits and misses of `cache`, a cache of the kind
+        named `kind`, like ``'response'`` or ``'aggregate'``.
+
+        Calling this method more than once with the same cache has no
+        effect.
+
+        """
+        with self._lock:
+            if any(c is cache for k, i, c in self._caches):
+                return
+            index = sum(1 for k, i, c in self._caches if k == kind)
+            self._caches.append((kind, index, cache))
+
+    def wrap(self, name, function):
+        """Returns a function that calls `function` and adds its duration,
+        in seconds, to the quantity named `name` observed in the current
+        request.
+
+        """
+        @wraps(function)
+        def timed(*args, **kw):
+            start = clock()
+            try:
+                return function(*args, **kw)
+            finally:
+                observe(name, clock() - start)
+        return timed
+
+    def measure(self, collection, endpoint, view, *args, **kw):
+        """Calls the view function `view` with the specified arguments,
+        recording metrics of the current request, and returns its
+        response.
+
+        `collection` is the collection name of the model of the API to
+        which the request was made and `endpoint` is the kind of endpoint
+        of the view, like ``'resource'`` or ``'relationship'``.
+
+        """
+        labels = (collection, endpoint_name(endpoint, kw), request.method)
+        request.environ[METRICS_ENVIRON_KEY] = observed = {}
+        start = clock()
+        try:
+            response = current_app.make_response(view(*args, **kw))
+        except HTTPException as exception:
+            # The application will respond with the status code of the
+            # exception, for example if a processor calls `abort()`.
+            status = exception.code or 500
+            self.record(labels, status, clock() - start, observed)
+            raise
+        except Exception:
+            # The application will respond with an internal server error.
+            self.record(labels, 500, clock() - start, observed)
+            raise
+        finally:
+            del request.environ[METRICS_ENVIRON_KEY]
+        duration = clock() - start
+        if not response.is_streamed:
+            observed['bytes'] = response.calculate_content_length() or 0
+        self.record(labels, response.status_code, duration, observed)
+        return response
+
+    def record(self, labels, status, duration, observed):
+        """Records a request to the endpoint identified by the triple
+        `labels`, of the form ``(collection, endpoint, method)``.
+
+        `status` is the status code of the response, `duration` is the
+        latency of the request in seconds, and `observed` is a dictionary
+        of the quantities observed while handling it, whose keys are
+        those of :data:`SUMS`.
+
+        """
+        shard = self._shard()
+        key = ('requests', labels + (str(status), ))
+        shard[key] = shard.get(key, 0) + 1
+        key = ('duration', labels)
+        histogram = shard.get(key)
+        if histogram is None:
+            # One counter per bucket, one for `+Inf`, then the sum.
+            histogram = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect_left(self.buckets, duration)] += 1
+        histogram[-1] += duration
+        for name, value in observed.items():
+            key = (name, labels)
+            shard[key] = shard.get(key, 0) + value
+
+    def collect(self):
+        """Returns a dictionary that merges the shards of all threads.
+
+        Its keys are pairs of the form ``(name, labels)``, where ``name``
+        is ``'requests'``, ``'duration'``, or one of the keys of
+        :data:`SUMS`. For the histogram of latencies, the value is the
+        list of the number of requests in each bucket, the number of
+        requests above the last bucket, and the sum of the latencies.
+
+        """
+        result = {}
+        with self._lock:
+            # A thread that has exited no longer changes its shard.
+            for thread, shard in list(self._shards.items()):
+                if not thread.is_alive():
+                    merge(self._totals, shard)
+                    del self._shards[thread]
+            merge(result, self._totals)
+            shards = list(self._shards.values())
+        for shard in shards:
+            merge(result, shard)
+        return result
+
+    def exposition(self):
+        """Returns the metrics in the text format of Prometheus."""
+        samples = sorted(self.collect().items())
+        lines = []
+
+        def family(name, kind, description):
+            lines.append('# HELP {0}{1} {2}'.format(PREFIX, name,
+                                                    description))
+            lines.append('# TYPE {0}{1} {2}'.format(PREFIX, name, kind))
+
+        def sample(name, names, values, value):
+            lines.append('{0}{1}{2} {3}'.format(PREFIX, name,
+                                                format_labels(names, values),
+                                                format_value(value)))
+
+        family('requests_total', 'counter', 'Number of requests handled.')
+        for (name, labels), value in samples:
+            if name == 'requests':
+                sample('requests_total', LABELS + ('status', ), labels, value)
+        family('request_duration_seconds', 'histogram',
+               'Latency of requests in seconds.')
+        bounds = [format_value(float(b)) for b in self.buckets] + ['+Inf']
+        for (name, labels), histogram in samples:
+            if name != 'duration':
+                continue
+            cumulative = 0
+            for bound, count in zip(bounds, histogram):
+                cumulative += count
+                sample('request_duration_seconds_bucket', LABELS + ('le', ),
+                       labels + (bound, ), cumulative)
+            sample('request_duration_seconds_sum', LABELS, labels,
+                   histogram[-1])
+            sample('request_duration_seconds_count', LABELS, labels,
+                   cumulative)
+        for key, metric, description in SUMS:
+            family(metric, 'counter', description)
+            for (name, labels), value in samples:
+                if name == key:
+                    sample(metric, LABELS, labels, value)
+        with self._lock:
+            caches = list(self._caches)
+        cache_labels = ('cache', 'index')
+        family('cache_hits_total', 'counter', 'Number of cache hits.')
+        for kind, index, cache in caches:
+            sample('cache_hits_total', cache_labels, (kind, index),
+                   cache.hits)
+        family('cache_misses_total', 'counter', 'Number of cache misses.')
+        for kind, index, cache in caches:
+            sample('cache_misses_total', cache_labels, (kind, index),
+                   cache.misses)
+        family('cache_hit_ratio', 'gauge',
+               'Fraction of cache lookups that were hits.')
+        for kind, index, cache in caches:
+            lookups = cache.hits + cache.misses
+            ratio = cache.hits / float(lookups) if lookups else 0.0
+            sample('cache_hit_ratio', cache_labels, (kind, index), ratio)
+        return '\n'.join(lines) + '\n'
+
+    def _shard(self):
+        """Returns the shard of the current thread."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards[threading.current_thread()] = shard
+            return shard
+
+
+class MetricsView(MethodView):
+    """Exposes the metrics recorded by a :class:`Metrics` object in the
+    text format of Prometheus.
+
+    """
+
+    def __init__(self, metrics):
+        super(MetricsView, self).__init__()
+        self.metrics = metrics
+
+    def get(self):
+        """Returns the current metrics."""
+        return Response(self.metrics.exposition(),
+                        content_type=METRICS_MIMETYPE)
@@ -0,0 +1,160 @@
+# profiling.py - profiling a sample of the requests to created APIs
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Profiling a sample of the requests to the created APIs.
+
+The main class in this module, :class:`SamplingProfiler`, profiles one
+in every so many requests to each endpoint of the views of an
+:class:`~flask_restless.APIManager` with :mod:`cProfile`, aggregates the
+statistics of each endpoint in memory, and reports them on demand. For
+more information, see :ref:`profiling`.
+
+"""
+import cProfile
+from itertools import count
+import os
+import pstats
+import threading
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from flask import request
+
+from .metrics import endpoint_name
+
+#: The default number of requests to an endpoint per profiled request.
+DEFAULT_EVERY = 100
+
+
+class SamplingProfiler(object):
+    """Profiles one in every `every` requests to each endpoint of the
+    views of an :class:`~flask_restless.APIManager`.
+
+    An endpoint is identified by the collection name of the API, the kind
+    of endpoint (as in :ref:`metrics`), and the HTTP method, so for
+    example requests for a collection of people and requests for a single
+    person are sampled and aggregated separately. The statistics of the
+    profiled requests to each endpoint are added together in memory, and
+    may be reported by :meth:`report` or written to files by :meth:`dump`.
+
+    Only one request is profiled at a time; a request that would be
+    sampled while another request is being profiled is not profiled.
+
+    """
+
+    def __init__(self, every=DEFAULT_EVERY):
+        #: The number of requests to an endpoint per profiled request.
+        self.every = every
+
+        self._counters = {}
+        self._stats = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+
+    def measure(self, collection, endpoint, view, *args, **kw):
+        """Calls the view function `view` with the specified arguments,
+        profiling it if the current request is sampled, and returns its
+        response.
+
+        `collection` and `endpoint` are as described in
+        :meth:`flask_restless.Metrics.measure`.
+
+        """
+        key = (collection, endpoint_name(endpoint, kw), request.method)
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, count())
+        if next(counter) % self.every != 0:
+            return view(*args, **kw)
+        if not self._profiling.acquire(False):
+            return view(*args, **kw)
+        try:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler, not managed by this object, is active.
+                return view(*args, **kw)
+            try:
+                return view(*args, **kw)
+            finally:
+                profile.disable()
+                self._add(key, profile)
+        finally:
+            self._profiling.release()
+
+    def samples(self):
+        """Returns a dictionary mapping each endpoint, as a triple of the
+        form ``(collection, endpoint, method)``, to the number of
+        requests to it that have been profiled.
+
+        """
+        with self._lock:
+            return dict(self._samples)
+
+    def report(self, limit=20, sort='cumulative'):
+        """Returns a text report of the `limit` functions with the
+        highest value of `sort`, which may be any of the keys accepted by
+        :meth:`pstats.Stats.sort_stats`, for each profiled endpoint.
+
+        """
+        with self._lock:
+            items = sorted(self._stats.items())
+            samples = dict(self._samples)
+            stream = StringIO()
+            for key, stats in items:
+                stream.write('{0} {1} {2} ({3} requests)\n'.format(
+                    key[2], key[0], key[1], samples[key]))
+                stats.stream = stream
+                stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def dump(self, directory):
+        """Writes the statistics of each profiled endpoint to a file in
+        `directory`, in the format of :mod:`pstats`, and returns the list
+        of paths of the written files.
+
+        The name of each file has the form
+        ``<collection>.<endpoint>.<method>.pstats``.
+
+        """
+        paths = []
+        with self._lock:
+            for (collection, endpoint, method), stats in self._stats.items():
+                filename = '{0}.{1}.{2}.pstats'.format(collection, endpoint,
+                                                       method)
+                path = os.path.join(directory, filename)
+                stats.dump_stats(path)
+                paths.append(path)
+        return paths
+
+    def reset(self):
+        """Discards the statistics of all profiled requests."""
+        with self._lock:
+            self._stats.clear()
+            self._samples.clear()
+
+    def _add(self, key, profile):
+        """Adds the statistics of `profile` to those of the endpoint
+        identified by `key`.
+
+        """
+        with self._lock:
+            if key in self._stats:
+                self._stats[key].add(profile)
+            else:
+                self._stats[key] = pstats.Stats(profile)
+            self._samples[key] = self._samples.get(key, 0) + 1
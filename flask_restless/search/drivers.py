@@ -28,6 +28,39 @@ from ..helpers import session_query
 from .filters import create_filters
 
 
+def resolve_field(query, model, field_name, aliases=None):
+    """Returns a pair whose left element is `query`, joined with a
+    related model if necessary, and whose right element is the SQLAlchemy
+    attribute named by `field_name`.
+
+    `field_name` is either the name of an attribute of `model` or a
+    dot-separated relationship path of the form ``'owner.name'``. In the
+    latter case, the query is joined with an alias of the related model.
+    If `aliases` is a dictionary, the alias created
+    for each relationship is stored in it and reused by subsequent calls
+    with the same dictionary, so the related model is joined only once.
+
+    If the field or the relationship does not exist, this function
+    raises :exc:`AttributeError`.
+
+    """
+    if '.' not in field_name:
+        return query, getattr(model, field_name)
+    relation_name, field_name_in_relation = field_name.split('.')
+    if aliases is not None and relation_name in aliases:
+        relation_model = aliases[relation_name]
+    else:
+        try:
+            related_model = get_related_model(model, relation_name)
+        except KeyError:
+            raise AttributeError(relation_name)
+        relation_model = aliased(related_model)
+        query = query.join(relation_model)
+        if aliases is not None:
+            aliases[relation_name] = relation_model
+    return query, getattr(relation_model, field_name_in_relation)
+
+
 def search_relationship(session, instance, relation, filters=None, sort=None,
                         group_by=None, ignorecase=False):
     """Returns a filtered, sorted, and grouped SQLAlchemy query
@@ -112,21 +145,11 @@ def search(session, model, filters=None, sort=None, group_by=None,
     if sort:
         for (symbol, field_name) in sort:
             direction_name = 'asc' if symbol == '+' else 'desc'
-            if '.' in field_name:
-                field_name, field_name_in_relation = field_name.split('.')
-                relation_model = aliased(get_related_model(model, field_name))
-                field = getattr(relation_model, field_name_in_relation)
-                if ignorecase:
-                    field = field.collate('NOCASE')
-                direction = getattr(field, direction_name)
-                query = query.join(relation_model)
-                query = query.order_by(direction())
-            else:
-                field = getattr(model, field_name)
-                if ignorecase:
-                    field = field.collate('NOCASE')
-                direction = getattr(field, direction_name)
-                query = query.order_by(direction())
+            query, field = resolve_field(query, model, field_name)
+            if ignorecase:
+                field = field.collate('NOCASE')
+            direction = getattr(field, direction_name)
+            query = query.order_by(direction())
     else:
         pks = primary_key_names(model)
         pk_order = (getattr(model, field).asc() for field in pks)
@@ -135,14 +158,7 @@ def search(session, model, filters=None, sort=None, group_by=None,
     # Group the query.
     if group_by:
         for field_name in group_by:
-            if '.' in field_name:
-                field_name, field_name_in_relation = field_name.split('.')
-                relation_model = aliased(get_related_model(model, field_name))
-                field = getattr(relation_model, field_name_in_relation)
-                query = query.join(relation_model)
-                query = query.group_by(field)
-            else:
-                field = getattr(model, field_name)
-                query = query.group_by(field)
+            query, field = resolve_field(query, model, field_name)
+            query = query.group_by(field)
 
     return query
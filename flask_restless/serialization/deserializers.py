@@ -40,6 +40,7 @@ from ..helpers import has_field
 from ..helpers import is_like_list
 from ..helpers import model_for
 from ..helpers import primary_key_for
+from ..helpers import resolve_identifiers
 from ..helpers import string_to_datetime as to_datetime
 
 
@@ -506,40 +507,48 @@ class DefaultDeserializer(DeserializerBase):
         for relation_name, related_value in related_resources.items():
             setattr(instance, relation_name, related_value)
 
-    # # TODO JSON API currently doesn't support bulk creation of resources,
-    # # so this code cannot be accurately used/tested.
-    # def deserialize_many(self, document):
-    #     """Creates and returns a list of instances of the SQLAlchemy
-    #     model specified in the constructor whose fields are given in the
-    #     JSON API document.
-    #
-    #     This method assumes that each resource in the given document is
-    #     of the same type.
-    #
-    #     For more information, see the documentation for the
-    #     :meth:`Deserializer.deserialize_many` method.
-    #
-    #     """
-    #     if 'data' not in document:
-    #         raise MissingData
-    #     data = document['data']
-    #     if not isinstance(data, list):
-    #         raise NotAList
-    #     # Since loading each instance from a given resource object
-    #     # representation could theoretically raise a
-    #     # DeserializationException, we collect all the errors and wrap
-    #     # them in a MultipleExceptions exception object.
-    #     result = []
-    #     failed = []
-    #     for resource in data:
-    #         try:
-    #             instance = self._load(resource)
-    #             result.append(instance)
-    #         except DeserializationException as exception:
-    #             failed.append(exception)
-    #     if failed:
-    #         raise MultipleExceptions(failed)
-    #     return result
+    def deserialize_many(self, document):
+        """Creates and returns a list of instances of the SQLAlchemy
+        model specified in the constructor whose fields are given in the
+        JSON API document.
+
+        This method is used when creating resources in bulk (see
+        :ref:`bulkcreation`). The instances are returned in the order
+        in which they appear in the document.
+
+        Since loading each instance from a given resource object
+        representation could raise a :exc:`DeserializationException`,
+        this method collects all the errors and raises them together as
+        a :exc:`MultipleExceptions` exception. The
+        :attr:`~DeserializationException.index` attribute of each of
+        the collected exceptions is the index of the problematic
+        resource object.
+
+        For more information, see the documentation for the
+        :meth:`Deserializer.deserialize_many` method.
+
+        """
+        if 'data' not in document:
+            raise MissingData(self.relation_name)
+        data = document['data']
+        if not isinstance(data, list):
+            raise NotAList(self.relation_name)
+        result = []
+        failed = []
+        for index, resource in enumerate(data):
+            try:
+                instance = self._load(resource)
+                result.append(instance)
+            except DeserializationException as exception:
+                exception.index = index
+                failed.append(exception)
+            except MultipleExceptions as exception:
+                for inner in exception.exceptions:
+                    inner.index = index
+                failed.extend(exception.exceptions)
+        if failed:
+            raise MultipleExceptions(failed)
+        return result
 
 
 class DefaultRelationshipDeserializer(DeserializerBase):
@@ -654,18 +663,24 @@ class DefaultRelationshipDeserializer(DeserializerBase):
         resource_identifiers = document['data']
         if not isinstance(resource_identifiers, list):
             raise NotAList(self.relation_name)
-        # Since loading each related instance from a given resource
-        # identifier object representation could theoretically raise a
+        # Since validating each resource identifier object could raise a
         # DeserializationException, we collect all the errors and wrap
         # them in a MultipleExceptions exception object.
-        result = []
+        identifiers = []
         failed = []
         for resource_identifier in resource_identifiers:
             try:
-                instance = self._load(resource_identifier)
-                result.append(instance)
+                self._check_type_and_id(resource_identifier)
+                model = self._resource_to_model(resource_identifier)
             except DeserializationException as exception:
                 failed.append(exception)
+            else:
+                attributes = self._extract_attributes(resource_identifier,
+                                                      model)
+                pk_name, pk_value = next(attributes)
+                identifiers.append((model, pk_value))
         if failed:
             raise MultipleExceptions(failed)
-        return result
+        # Fetch all the identified instances at once instead of making
+        # one query per resource identifier.
+        return resolve_identifiers(self.session, identifiers)
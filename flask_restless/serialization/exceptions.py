@@ -84,6 +84,11 @@ class DeserializationException(Exception):
         #: The HTTP status code corresponding to this error.
         self.status = status
 
+        #: The index of the problematic resource object in the primary
+        #: data of the document, if the document contains a list of
+        #: resources (as when creating resources in bulk), or ``None``.
+        self.index = None
+
     def message(self):
         """Returns a more detailed description of the problem as a
         string.
@@ -0,0 +1,209 @@
+# slowlog.py - logging requests that take too long
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Logging the requests that take longer than a threshold.
+
+The main class in this module, :class:`SlowRequestLog`, writes a
+structured record of each request to the views of an
+:class:`~flask_restless.APIManager` that takes longer than a threshold,
+including the SQL statements it executed and, for a sample of requests,
+the query plan of its main query. For more information, see
+:ref:`slowlog`.
+
+"""
+from datetime import datetime
+import logging
+from logging.handlers import RotatingFileHandler
+import random
+
+from flask import current_app
+from flask import json
+from flask import request
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+
+from .statements import capture
+from .timing import clock
+from .views.base import FILTER_PARAM
+from .views.base import GROUP_PARAM
+from .views.base import PAGE_NUMBER_PARAM
+from .views.base import PAGE_SIZE_PARAM
+from .views.base import QUERY_ENVIRON_KEY
+from .views.base import SORT_PARAM
+
+#: The default number of seconds after which a request is logged.
+DEFAULT_THRESHOLD = 1.0
+
+#: The default fraction of logged requests whose main query is explained.
+DEFAULT_EXPLAIN_RATE = 0.1
+
+#: The query parameters whose values are JSON documents.
+JSON_PARAMS = (FILTER_PARAM, 'functions')
+
+#: The query parameters whose values are comma-separated lists.
+LIST_PARAMS = (SORT_PARAM, GROUP_PARAM, 'include')
+
+#: The query parameters whose values are integers.
+INTEGER_PARAMS = (PAGE_NUMBER_PARAM, PAGE_SIZE_PARAM)
+
+#: The statement that explains a query, by the name of the dialect of the
+#: database. Other dialects use ``EXPLAIN``.
+EXPLAIN_PREFIXES = {'sqlite': 'EXPLAIN QUERY PLAN '}
+
+
+def normalized_parameters():
+    """Returns a dictionary of the query parameters of the current request
+    in a canonical form.
+
+    JSON documents, like the value of the ``filter[objects]`` parameter,
+    are decoded, comma-separated lists are split, and page numbers and
+    sizes are converted to integers. Values that cannot be converted are
+    left as strings. A parameter given more than once has the list of its
+    values.
+
+    """
+    result = {}
+    for key in sorted(request.args):
+        values = []
+        for value in request.args.getlist(key):
+            try:
+                if key in JSON_PARAMS:
+                    value = json.loads(value)
+                elif key in INTEGER_PARAMS:
+                    value = int(value)
+            except ValueError:
+                pass
+            if key in LIST_PARAMS:
+                value = value.split(',')
+            values.append(value)
+        result[key] = values[0] if len(values) == 1 else values
+    return result
+
+
+def explain(session, model, query):
+    """Returns the query plan of `query`, a query on `model` in
+    `session`, as a list of rows, each of which is a list of values.
+
+    The query is explained on a new connection to the database, so that
+    the transaction of `session` is not affected.
+
+    """
+    bind = session.get_bind(mapper=sqlalchemy_inspect(model))
+    compiled = query.statement.compile(dialect=bind.dialect)
+    prefix = EXPLAIN_PREFIXES.get(bind.dialect.name, 'EXPLAIN ')
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    connection = bind.connect()
+    try:
+        result = connection.execute(prefix + str(compiled), params)
+        return [list(row) for row in result]
+    finally:
+        connection.close()
+
+
+class SlowRequestLog(object):
+    """Logs the requests to the views of an
+    :class:`~flask_restless.APIManager` that take at least `threshold`
+    seconds.
+
+    Each record is a dictionary containing the time the request finished,
+    its method, path, endpoint, collection, status code, and duration,
+    its query parameters in the canonical form returned by
+    :func:`normalized_parameters`, and the SQL statements it executed,
+    each with its duration and the number of rows it produced (if the
+    database reports it). For a random fraction `explain_rate` of the
+    logged requests that search a collection, the record also contains
+    the query plan of the search query, as returned by :func:`explain`,
+    or a description of the error that prevented computing it. Durations
+    are in milliseconds.
+
+    If `path` is not ``None``, each record is written as a line of JSON
+    to the file at that path, which is rotated when it exceeds
+    `max_bytes` bytes, keeping `backup_count` old files. If `callback`
+    is not ``None``, it is called with each record, in the request
+    context. If neither is given, records are logged as warnings on the
+    application.
+
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, path=None, callback=None,
+                 explain_rate=DEFAULT_EXPLAIN_RATE, max_bytes=10 * 1024 * 1024,
+                 backup_count=5):
+        #: The number of seconds after which a request is logged.
+        self.threshold = threshold
+
+        #: The function called with each record, or ``None``.
+        self.callback = callback
+
+        #: The fraction of logged requests whose main query is explained.
+        self.explain_rate = explain_rate
+
+        self._handler = None
+        if path is not None:
+            self._handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                                backupCount=backup_count,
+                                                delay=True)
+
+    def measure(self, session, model, collection, view, *args, **kw):
+        """Calls the view function `view` with the specified arguments,
+        logging the current request if it is slow, and returns its
+        response.
+
+        `session` and `model` are the session and model of the API to
+        which the request was made and `collection` is its collection
+        name.
+
+        """
+        request.environ[QUERY_ENVIRON_KEY] = None
+        start = clock()
+        try:
+            response, statements = capture(view, *args, **kw)
+            response = current_app.make_response(response)
+            duration = clock() - start
+            query = request.environ[QUERY_ENVIRON_KEY]
+        finally:
+            del request.environ[QUERY_ENVIRON_KEY]
+        if duration < self.threshold:
+            return response
+        record = dict(time=datetime.utcnow().isoformat() + 'Z',
+                      method=request.method, path=request.path,
+                      endpoint=request.endpoint, collection=collection,
+                      status=response.status_code, duration=duration * 1000,
+                      parameters=normalized_parameters())
+        record['statements'] = [dict(statement=shape, duration=seconds * 1000,
+                                     rows=rows)
+                                for shape, seconds, tables, rows in statements]
+        if query is not None and random.random() < self.explain_rate:
+            try:
+                record['explain'] = explain(session, model, query)
+            except Exception as exception:
+                record['explain_error'] = str(exception)
+        self.write(record)
+        return response
+
+    def write(self, record):
+        """Writes the specified record to the file and passes it to the
+        callback, as described in the documentation for this class.
+
+        """
+        if self._handler is not None:
+            line = json.dumps(record, sort_keys=True)
+            self._handler.handle(logging.makeLogRecord({'msg': line}))
+        if self.callback is not None:
+            self.callback(record)
+        if self._handler is None and self.callback is None:
+            message = 'Slow request: {0}'.format(json.dumps(record))
+            current_app.logger.warning(message)
+
+    def close(self):
+        """Closes the log file, if any."""
+        if self._handler is not None:
+            self._handler.close()
@@ -0,0 +1,346 @@
+# statements.py - counting the SQL statements executed by requests
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Counting the SQL statements executed while handling a request.
+
+The main class in this module, :class:`StatementCounter`, records each
+SQL statement executed while handling a request to the views of an
+:class:`~flask_restless.APIManager`, groups the statements by shape, and
+flags the shapes executed so many times that they are probably caused by
+loading a relationship of one resource at a time (the "N + 1 queries"
+problem). For more information, see :ref:`statementcounter`.
+
+"""
+import re
+import threading
+import time
+
+from flask import current_app
+from flask import has_request_context
+from flask import json
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+from sqlalchemy.sql.util import find_tables
+
+from .helpers import JSONAPI_MIMETYPE
+
+#: The key in the WSGI environment of the list of statements executed so
+#: far in the current request, if it is being counted.
+STATEMENTS_ENVIRON_KEY = 'flask_restless.statements'
+
+#: The name of the attribute of the execution context of a statement
+#: that stores the time at which its execution started.
+#:
+#: The start time is stored on the execution context rather than on the
+#: connection, since no event is fired after a statement fails, and the
+#: context is discarded along with it.
+_START_ATTRIBUTE = '_flask_restless_start'
+
+#: The clock used to measure durations.
+#:
+#: :func:`time.perf_counter` is monotonic, but it is not available on
+#: Python 2, in which case :func:`time.time` is used.
+clock = getattr(time, 'perf_counter', time.time)
+
+#: The default number of times a statement of the same shape must be
+#: executed in a single request to be flagged as a probable N + 1 query.
+DEFAULT_THRESHOLD = 5
+
+#: Matches a parenthesized list of one or more bound parameters, in any
+#: of the parameter styles of the DBAPI, like the list of an ``IN``
+#: expression.
+_PARAMETER_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)'
+                             r'(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+
+#: Matches a run of whitespace.
+_WHITESPACE = re.compile(r'\s+')
+
+#: Serializes the registration of the listeners for engine events.
+_listen_lock = threading.Lock()
+
+
+def normalize(statement):
+    """Returns the shape of the specified SQL statement.
+
+    Statements with the same shape differ only in the values of their
+    bound parameters, including the number of values in each list of
+    bound parameters.
+
+    """
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    return _PARAMETER_LIST.sub('(?)', statement)
+
+
+def counting():
+    """Returns ``True`` if and only if the SQL statements executed in the
+    current request are being recorded by :func:`capture`.
+
+    """
+    return has_request_context() and STATEMENTS_ENVIRON_KEY in request.environ
+
+
+def listen():
+    """Starts recording the SQL statements executed in the requests in
+    which :func:`capture` is called, unless already started.
+
+    """
+    if event.contains(Engine, 'after_cursor_execute', _after_execute):
+        return
+    with _listen_lock:
+        if not event.contains(Engine, 'after_cursor_execute', _after_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_execute)
+
+
+def capture(function, *args, **kw):
+    """Calls `function` with the specified arguments and returns a pair
+    whose left element is its return value and whose right element is the
+    list of SQL statements executed during the call.
+
+    Each statement is a tuple ``(shape, seconds, tables, rows)``, where
+    ``shape`` is as computed by :func:`normalize`, ``seconds`` is the
+    duration of its execution, ``tables`` is the set of names of the
+    tables it selects from, and ``rows`` is the number of rows it
+    produced or affected, or ``None`` if the database does not report it.
+
+    This function must be called in a request context. Calls may be
+    nested, in which case each one returns only the statements executed
+    during its own call.
+
+    """
+    listen()
+    statements = request.environ.get(STATEMENTS_ENVIRON_KEY)
+    if statements is not None:
+        start = len(statements)
+        return function(*args, **kw), statements[start:]
+    request.environ[STATEMENTS_ENVIRON_KEY] = statements = []
+    try:
+        return function(*args, **kw), statements
+    finally:
+        del request.environ[STATEMENTS_ENVIRON_KEY]
+
+
+def reachable_relationships(model):
+    """Returns the list of relationships of `model` and of each model
+    reachable from `model` through relationships.
+
+    """
+    relationships = []
+    mappers = [sqlalchemy_inspect(model)]
+    seen = set(mappers)
+    while mappers:
+        mapper = mappers.pop(0)
+        for prop in mapper.relationships:
+            relationships.append(prop)
+            if prop.mapper not in seen:
+                seen.add(prop.mapper)
+                mappers.append(prop.mapper)
+    return relationships
+
+
+class StatementCounter(object):
+    """Counts the SQL statements executed while handling each request to
+    the views of an :class:`~flask_restless.APIManager` and detects
+    probable N + 1 queries.
+
+    Statements of the same shape, as computed by :func:`normalize`, are
+    grouped together. A shape executed at least `threshold` times in a
+    single request is flagged as a probable N + 1 query, along with the
+    relationships, reachable from the model of the requested API, that
+    would load rows from the tables it selects from.
+
+    If `header` is ``True``, the number of statements and their total
+    duration in milliseconds are reported in the
+    :http:header:`X-Statement-Count` and :http:header:`X-Statement-Duration`
+    headers of each response. If `log` is ``True``, a summary of each
+    request is logged on the application, as a warning if a probable
+    N + 1 query was detected and as a debug message otherwise. If `meta`
+    is ``True`` and the application is in debug mode, the summary
+    returned by :meth:`summarize` is added to the ``meta`` object of the
+    response document, under the key ``'statements'``.
+
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, header=True, log=True,
+                 meta=True):
+        #: The number of times a statement of the same shape must be
+        #: executed in a request to be flagged as a probable N + 1 query.
+        self.threshold = threshold
+
+        #: Whether to report the statements in the response headers.
+        self.header = header
+
+        #: Whether to log a summary of each request.
+        self.log = log
+
+        #: Whether to add the summary to the response document in debug
+        #: mode.
+        self.meta = meta
+
+    def measure(self, model, view, *args, **kw):
+        """Calls the view function `view` with the specified arguments,
+        counting the statements executed in the current request, and
+        returns its response.
+
+        `model` is the model of the API to which the request was made.
+
+        """
+        response, statements = capture(view, *args, **kw)
+        response = current_app.make_response(response)
+        summary = self.summarize(statements, model)
+        if self.header:
+            response.headers['X-Statement-Count'] = str(summary['count'])
+            response.headers['X-Statement-Duration'] = \
+                '{0:.3f}'.format(summary['duration'])
+        if self.log:
+            self._log(summary)
+        if self.meta and current_app.debug:
+            self._add_meta(response, summary)
+        return response
+
+    def summarize(self, statements, model):
+        """Returns a dictionary summarizing the specified list of
+        statements executed in a request to the API for `model`.
+
+        Each element of `statements` is a tuple as described in
+        :func:`capture`. The returned dictionary has the total
+        ``count`` and ``duration`` (in milliseconds) of the statements,
+        the list of ``statements`` of each shape with their ``count`` and
+        ``duration``, most frequent first, and the list of probable N + 1
+        queries under ``'n_plus_one'``.
+
+        """
+        shapes = []
+        groups = {}
+        for shape, seconds, tables, rows in statements:
+            if shape not in groups:
+                shapes.append(shape)
+                groups[shape] = {'statement': shape, 'count': 0,
+                                 'duration': 0, 'tables': tables}
+            group = groups[shape]
+            group['count'] += 1
+            group['duration'] += seconds * 1000
+        shapes.sort(key=lambda shape: -groups[shape]['count'])
+        n_plus_one = []
+        for shape in shapes:
+            group = groups[shape]
+            if group['count'] < self.threshold or not group['tables']:
+                continue
+            models, relationships = self._responsible(model, group['tables'])
+            n_plus_one.append({'statement': shape, 'count': group['count'],
+                               'models': models,
+                               'relationships': relationships})
+        result = []
+        for shape in shapes:
+            group = groups[shape]
+            result.append({'statement': shape, 'count': group['count'],
+                           'duration': group['duration']})
+        duration = sum(group['duration'] for group in result)
+        return {'count': len(statements), 'duration': duration,
+                'statements': result, 'n_plus_one': n_plus_one}
+
+    def _responsible(self, model, tables):
+        """Returns the names of the models and of the relationships,
+        reachable from `model`, that load rows from the tables whose
+        names are in the set `tables`.
+
+        """
+        mappers = [sqlalchemy_inspect(model)]
+        relationships = []
+        for prop in reachable_relationships(model):
+            if prop.mapper not in mappers:
+                mappers.append(prop.mapper)
+            if prop.mapper.local_table.name not in tables:
+                continue
+            if prop.secondary is not None and \
+               prop.secondary.name not in tables:
+                continue
+            name = '{0}.{1}'.format(prop.parent.class_.__name__, prop.key)
+            relationships.append(name)
+        models = [mapper.class_.__name__ for mapper in mappers
+                  if mapper.local_table.name in tables]
+        return models, relationships
+
+    def _log(self, summary):
+        """Logs the specified summary of the current request."""
+        message = '{0} {1} executed {2} SQL statements in {3:.3f} ms'
+        message = message.format(request.method, request.full_path,
+                                 summary['count'], summary['duration'])
+        if not summary['n_plus_one']:
+            current_app.logger.debug(message)
+            return
+        parts = [message]
+        for query in summary['n_plus_one']:
+            culprits = query['relationships'] or query['models']
+            part = 'probable N + 1 query executed {0} times (from {1}): {2}'
+            culprits = ', '.join(culprits) or 'unknown'
+            part = part.format(query['count'], culprits, query['statement'])
+            parts.append(part)
+        current_app.logger.warning('; '.join(parts))
+
+    def _add_meta(self, response, summary):
+        """Adds the specified summary to the ``meta`` object of the JSON
+        API document in the body of `response`, if it has one.
+
+        The body is left unchanged if the response has an entity tag,
+        since the tag was computed from the body.
+
+        """
+        if response.is_streamed or response.mimetype != JSONAPI_MIMETYPE:
+            return
+        if 'ETag' in response.headers:
+            return
+        try:
+            document = json.loads(response.get_data())
+        except ValueError:
+            return
+        if not isinstance(document, dict):
+            return
+        document.setdefault('meta', {})['statements'] = summary
+        response.set_data(json.dumps(document))
+
+
+def _tables(context):
+    """Returns the set of names of the tables from which the statement
+    being executed in the specified execution context selects.
+
+    """
+    compiled = getattr(context, 'compiled', None)
+    froms = getattr(getattr(compiled, 'statement', None), 'froms', ())
+    names = set()
+    for from_ in froms:
+        for table in find_tables(from_):
+            name = getattr(table, 'name', None)
+            if name is not None:
+                names.add(name)
+    return names
+
+
+def _before_execute(conn, cursor, statement, parameters, context,
+                    executemany):
+    if context is not None and counting():
+        setattr(context, _START_ATTRIBUTE, clock())
+
+
+def _after_execute(conn, cursor, statement, parameters, context,
+                   executemany):
+    start = getattr(context, _START_ATTRIBUTE, None)
+    if start is None or not counting():
+        return
+    # The same context may execute another statement.
+    setattr(context, _START_ATTRIBUTE, None)
+    seconds = clock() - start
+    rows = cursor.rowcount if cursor.rowcount >= 0 else None
+    statements = request.environ[STATEMENTS_ENVIRON_KEY]
+    statements.append((normalize(statement), seconds, _tables(context),
+                       rows))
@@ -0,0 +1,179 @@
+# timing.py - measuring the phases of handling requests
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Measuring the time spent in each phase of handling a request.
+
+The main class in this module, :class:`ServerTiming`, records the
+duration of each phase of the requests handled by the views of an
+:class:`~flask_restless.APIManager`, reports them in the
+:http:header:`Server-Timing` header of the response, and passes them to
+an optional callback. For more information, see :ref:`servertiming`.
+
+"""
+from functools import wraps
+
+from flask import current_app
+from flask import has_request_context
+from flask import request
+
+from .statements import capture
+from .statements import clock
+
+#: The key in the WSGI environment of the list of spans measured so far
+#: in the current request, if it is being measured.
+TIMING_ENVIRON_KEY = 'flask_restless.timing'
+
+
+def measuring():
+    """Returns ``True`` if and only if the current request is being
+    measured by a :class:`ServerTiming`.
+
+    """
+    return has_request_context() and TIMING_ENVIRON_KEY in request.environ
+
+
+def record(name, start):
+    """Records a span named `name` that started at the time `start`, as
+    returned by :data:`clock`, and ends now, if the current request is
+    being measured.
+
+    """
+    spans = request.environ.get(TIMING_ENVIRON_KEY)
+    if spans is not None:
+        spans.append((name, clock() - start))
+
+
+class ServerTiming(object):
+    """Measures the time spent in each phase of handling the requests
+    to the views of an :class:`~flask_restless.APIManager`.
+
+    If `header` is ``True``, the durations are reported in the
+    :http:header:`Server-Timing` header of each response. If `sink` is
+    not ``None``, it must be a function that takes a single argument;
+    after each request, it is called with the list of triples of the form
+    ``(name, duration, count)``, where ``duration`` is the total number of
+    milliseconds spent in the phase named ``name`` and ``count`` is the
+    number of times the phase occurred. The sink is called in the request
+    context, so it may use :data:`flask.request`.
+
+    """
+
+    def __init__(self, header=True, sink=None):
+        #: Whether to report the durations in the response header.
+        self.header = header
+
+        #: The function that receives the durations of each request.
+        self.sink = sink
+
+    def wrap(self, name, function):
+        """Returns a function that calls `function` and records its
+        duration in the span named `name`.
+
+        """
+        @wraps(function)
+        def timed(*args, **kw):
+            start = clock()
+            try:
+                return function(*args, **kw)
+            finally:
+                record(name, start)
+        return timed
+
+    def wrap_all(self, name, processors):
+        """Wraps each of the functions in the specified dictionary of
+        lists of preprocessors or postprocessors as described in
+        :meth:`wrap`, in place, and returns the dictionary.
+
+        """
+        for key, functions in processors.items():
+            processors[key] = [self.wrap(name, f) for f in functions]
+        return processors
+
+    def wrap_serializer(self, serializer):
+        """Returns an object that behaves like `serializer`, except that
+        the durations of its :meth:`serialize` and :meth:`serialize_many`
+        methods are recorded in the span named ``'serialize'``.
+
+        """
+        return _TimedSerializer(self, serializer)
+
+    def measure(self, view, *args, **kw):
+        """Calls the view function `view` with the specified arguments,
+        measuring the current request, and returns its response.
+
+        """
+        request.environ[TIMING_ENVIRON_KEY] = spans = []
+        start = clock()
+        try:
+            response, statements = capture(view, *args, **kw)
+            response = current_app.make_response(response)
+        finally:
+            del request.environ[TIMING_ENVIRON_KEY]
+        spans.extend(('db', seconds) for shape, seconds, tables, rows
+                     in statements)
+        spans.append(('total', clock() - start))
+        metrics = self.metrics(spans)
+        if self.header:
+            response.headers['Server-Timing'] = self.format(metrics)
+        if self.sink is not None:
+            self.sink(metrics)
+        return response
+
+    @staticmethod
+    def metrics(spans):
+        """Returns the list of triples ``(name, duration, count)`` for
+        the specified list of pairs ``(name, seconds)``, in the order in
+        which each name first appears.
+
+        Durations are in milliseconds.
+
+        """
+        names = []
+        totals = {}
+        counts = {}
+        for name, seconds in spans:
+            if name not in totals:
+                names.append(name)
+                totals[name] = counts[name] = 0
+            totals[name] += seconds * 1000
+            counts[name] += 1
+        return [(name, totals[name], counts[name]) for name in names]
+
+    @staticmethod
+    def format(metrics):
+        """Returns the value of the :http:header:`Server-Timing` header
+        for the specified list of triples, as returned by
+        :meth:`metrics`.
+
+        """
+        parts = []
+        for name, duration, count in metrics:
+            part = '{0};dur={1:.3f}'.format(name, duration)
+            if count > 1:
+                part += ';desc="{0}"'.format(count)
+            parts.append(part)
+        return ', '.join(parts)
+
+
+class _TimedSerializer(object):
+    """A serializer that records the durations of the methods of another
+    serializer, as described in :meth:`ServerTiming.wrap_serializer`.
+
+    """
+
+    def __init__(self, timing, serializer):
+        self._serializer = serializer
+        self.serialize = timing.wrap('serialize', serializer.serialize)
+        self.serialize_many = timing.wrap('serialize',
+                                          serializer.serialize_many)
+
+    def __getattr__(self, name):
+        return getattr(self._serializer, name)
@@ -12,22 +12,26 @@
 """View classes for responding to JSON API requests with a SQLAlchemy
 backend.
 
-The classes :class:`API`, :class:`FunctionAPI`, and
-:class:`RelationshipAPI` are the :class:`~flask.MethodView` subclasses
-that do most of the work.
+The classes :class:`API`, :class:`FunctionAPI`, :class:`OperationsAPI`,
+and :class:`RelationshipAPI` are the :class:`~flask.MethodView`
+subclasses that do most of the work.
 
 """
+from .base import compress_response
 from .base import JSONAPI_MIMETYPE
 from .base import ProcessingException
 from .base import SchemaView
 from .resources import API
 from .relationships import RelationshipAPI
 from .function import FunctionAPI
+from .operations import OperationsAPI
 
 __all__ = [
     'API',
+    'compress_response',
     'FunctionAPI',
     'JSONAPI_MIMETYPE',
+    'OperationsAPI',
     'ProcessingException',
     'RelationshipAPI',
     'SchemaView',
@@ -23,8 +23,10 @@ from collections import defaultdict
 from functools import partial
 from functools import wraps
 from itertools import chain
+import hashlib
 import math
 import re
+import zlib
 # In Python 3...
 try:
     from urllib.parse import parse_qs
@@ -38,26 +40,42 @@ except ImportError:
     from urlparse import urlparse
     from urlparse import urlunparse
 
+# Brotli compression is available only if the module is installed.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 from flask import current_app
 from flask import json
 from flask import request
 from flask.views import MethodView
+from sqlalchemy import Integer
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
 from sqlalchemy.orm.exc import MultipleResultsFound
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.orm.query import Query
+from sqlalchemy.sql import func
 from werkzeug import parse_options_header
 from werkzeug.exceptions import HTTPException
+from werkzeug.http import quote_etag
 
 from ..helpers import collection_name
 from ..helpers import get_model
 from ..helpers import get_related_model
 from ..helpers import is_like_list
 from ..helpers import is_relationship
+from ..helpers import JSONAPI_MIMETYPE
+from ..helpers import LRUCache
+from ..helpers import model_info
 from ..helpers import primary_key_for
 from ..helpers import primary_key_value
+from ..helpers import query_by_primary_key
 from ..helpers import serializer_for
 from ..helpers import url_for
+from ..metrics import observe_document
 from ..search import FilterCreationError
 from ..search import FilterParsingError
 from ..search import search
@@ -69,15 +87,12 @@ from ..serialization import simple_serialize_many
 from ..serialization import simple_relationship_serialize
 from ..serialization import simple_relationship_serialize_many
 from ..serialization import SerializationException
+from ..timing import clock
+from ..timing import measuring
+from ..timing import record
 from .helpers import count
 from .helpers import upper_keys as upper
 
-#: The Content-Type we expect for most requests to APIs.
-#:
-#: The JSON API specification requires the content type to be
-#: ``application/vnd.api+json``.
-JSONAPI_MIMETYPE = 'application/vnd.api+json'
-
 #: The Content-Type for Javascript data.
 #:
 #: This is used, for example, in JSONP responses.
@@ -87,6 +102,36 @@ JAVASCRIPT_MIMETYPE = 'application/javascript'
 #: Flask-Restless.
 JSONAPI_VERSION = '1.0'
 
+#: The content codings that Flask-Restless can apply to responses, in
+#: order of preference.
+#:
+#: The ``br`` coding is used only if the :mod:`brotli` module is
+#: installed.
+CONTENT_CODINGS = ('br', 'gzip', 'deflate') if brotli else ('gzip', 'deflate')
+
+#: The key in the WSGI environment that marks a request as a single
+#: operation dispatched by the atomic operations endpoint.
+#:
+#: Views flush the session instead of committing it when handling such a
+#: request; the operations endpoint commits once after all operations
+#: have succeeded.
+OPERATION_ENVIRON_KEY = 'flask_restless.operation'
+
+#: The key in the WSGI environment under which views store the query
+#: that searches the requested collection, if the key is present.
+#:
+#: A :class:`~flask_restless.SlowRequestLog` sets this key to explain the
+#: query of a slow request.
+QUERY_ENVIRON_KEY = 'flask_restless.query'
+
+#: The key in the WSGI environment of the entity tag that identifies the
+#: version of the requested resource for optimistic concurrency control,
+#: if the response provides one.
+#:
+#: :func:`compress_response` does not make this entity tag weak, since
+#: it identifies the version of the resource, not the bytes of the body.
+VERSION_ETAG_ENVIRON_KEY = 'flask_restless.version_etag'
+
 #: Strings that indicate a database conflict when appearing in an error
 #: message of an exception raised by SQLAlchemy.
 #:
@@ -151,6 +196,23 @@ ACCEPT_RE = re.compile(
 ERROR_FIELDS = ('id_', 'links', 'status', 'code_', 'title', 'detail', 'source',
                 'meta')
 
+#: The maximum number of distinct query strings (or header values) whose
+#: parsed form is remembered by each of the caches below.
+PARSE_CACHE_SIZE = 256
+
+#: Parsed :http:header:`Accept` headers, keyed by header value.
+_accept_headers = LRUCache(PARSE_CACHE_SIZE)
+
+#: Parsed :http:header:`Content-Type` headers, keyed by header value.
+_content_type_headers = LRUCache(PARSE_CACHE_SIZE)
+
+#: Parsed sparse fieldsets, keyed by query string.
+_sparse_fields = LRUCache(PARSE_CACHE_SIZE)
+
+#: Parsed filtering, sorting, and grouping parameters, keyed by query
+#: string.
+_collection_args = LRUCache(PARSE_CACHE_SIZE)
+
 # For the sake of brevity, rename this function.
 chain = chain.from_iterable
 
@@ -258,6 +320,51 @@ def catch_processing_exceptions(func):
     return new_func
 
 
+def _cached(cache, key, parse, *args):
+    """Returns the value stored in `cache` under `key`, first storing
+    the result of calling ``parse(*args)`` if there is no such value.
+
+    If `parse` raises an exception, nothing is stored.
+
+    """
+    result = cache.get(key)
+    if result is None:
+        result = parse(*args)
+        cache[key] = result
+    return result
+
+
+class _FrozenDict(tuple):
+    """An immutable stand-in for a dictionary, as created by
+    :func:`_freeze`.
+
+    """
+    pass
+
+
+def _freeze(value):
+    """Returns an immutable copy of a deserialized JSON value.
+
+    Dictionaries become instances of :class:`_FrozenDict` and lists
+    become tuples. Use :func:`_thaw` to get back a mutable copy.
+
+    """
+    if isinstance(value, dict):
+        return _FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    """Returns a mutable copy of a value created by :func:`_freeze`."""
+    if isinstance(value, _FrozenDict):
+        return dict((k, _thaw(v)) for k, v in value)
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
 # This code is (lightly) adapted from the ``werkzeug`` library, in the
 # ``werkzeug.http`` module. See <http://werkzeug.pocoo.org> for more
 # information.
@@ -285,6 +392,11 @@ def parse_accept_header(value):
         yield name, quality
 
 
+def _parse_accept_pairs(value):
+    """Returns the tuple of pairs yielded by :func:`parse_accept_header`."""
+    return tuple(parse_accept_header(value))
+
+
 def requires_json_api_accept(func):
     """Decorator that requires :http:header:`Accept` headers with the
     JSON API media type to have no media type parameters.
@@ -329,7 +441,8 @@ def requires_json_api_accept(func):
         # If there is no Accept header, we don't need to do anything.
         if header is None:
             return func(*args, **kw)
-        header_pairs = list(parse_accept_header(header))
+        header_pairs = _cached(_accept_headers, header, _parse_accept_pairs,
+                               header)
         # If the Accept header is empty, then do nothing.
         #
         # An empty Accept header is technically allowed by RFC 2616,
@@ -365,6 +478,15 @@ def requires_json_api_accept(func):
     return new_func
 
 
+def _parse_content_type(value):
+    """Returns the content type and a (possibly empty) tuple of the media
+    type parameters of a :http:header:`Content-Type` header.
+
+    """
+    content_type, extra = parse_options_header(value)
+    return content_type, tuple(sorted(extra.items()))
+
+
 def requires_json_api_mimetype(func):
     """Decorator that requires requests *that include data* have the
     :http:header:`Content-Type` header required by the JSON API
@@ -396,7 +518,8 @@ def requires_json_api_mimetype(func):
         if request.method not in ('PATCH', 'POST'):
             return func(*args, **kw)
         header = request.headers.get('Content-Type')
-        content_type, extra = parse_options_header(header)
+        content_type, extra = _cached(_content_type_headers, header,
+                                      _parse_content_type, header)
         content_is_json = content_type.startswith(JSONAPI_MIMETYPE)
         is_msie = _is_msie8or9()
         # Request must have the Content-Type: application/vnd.api+json header,
@@ -411,7 +534,7 @@ def requires_json_api_mimetype(func):
         # any media type parameters.
         if extra:
             detail = ('Content-Type header must not have any media type'
-                      ' parameters but found {0}'.format(extra))
+                      ' parameters but found {0}'.format(dict(extra)))
             return error_response(415, detail=detail)
         return func(*args, **kw)
     return new_func
@@ -456,6 +579,11 @@ def catch_integrity_errors(session):
                 session.rollback()
                 # Special status code for conflicting instances: 409 Conflict
                 status = 409 if is_conflict(exception) else 400
+                # If SQLAlchemy detected that a resource was modified
+                # after the client fetched the version given in the
+                # If-Match header, the precondition failed.
+                if isinstance(exception, StaleDataError) and request.if_match:
+                    status = 412
                 detail = str(exception)
                 title = un_camel_case(exception.__class__.__name__)
                 return error_response(status, cause=exception, detail=detail,
@@ -488,7 +616,13 @@ def jsonpify(data):
     ``application/javascript``.
 
     """
-    document = json.dumps(data)
+    if measuring():
+        start = clock()
+        document = json.dumps(data)
+        record('encode', start)
+    else:
+        document = json.dumps(data)
+    observe_document(data)
     mimetype = JSONAPI_MIMETYPE
     callback = request.args.get('callback', False)
     if callback:
@@ -498,6 +632,184 @@ def jsonpify(data):
     return response
 
 
+def _compressor(coding, level):
+    """Returns a pair of functions that incrementally compress data with
+    the specified content coding.
+
+    The left function takes a bytestring and returns the next part of the
+    compressed data (which may be empty); the right function takes no
+    arguments and returns the remainder of the compressed data.
+
+    """
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        return compressor.process, compressor.finish
+    # The gzip format is the deflate format with a different header and
+    # trailer, which :mod:`zlib` writes if the window size is offset
+    # by 16.
+    wbits = zlib.MAX_WBITS + 16 if coding == 'gzip' else zlib.MAX_WBITS
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    return compressor.compress, compressor.flush
+
+
+def _compressed_chunks(chunks, compress, flush):
+    """Generates the compressed data for the given iterable of
+    bytestrings, as compressed by the functions returned by
+    :func:`_compressor`.
+
+    """
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield flush()
+
+
+def compress_response(response, level=6, threshold=500):
+    """Compresses the body of the specified response object using the
+    best content coding that is acceptable to the client, according to
+    the :http:header:`Accept-Encoding` header of the current request.
+
+    `level` is the compression level, from 1 (fastest) to 9 (smallest).
+    Bodies smaller than `threshold` bytes are not compressed, since the
+    savings would not be worth the time. Streamed responses (whose
+    size is not known in advance) are always compressed, one chunk at a
+    time.
+
+    The :http:header:`Vary` header of the response always includes
+    :http:header:`Accept-Encoding`, since the representation depends on
+    it. A strong entity tag is made weak when the body is compressed,
+    since it identifies the uncompressed representation, unless it is
+    the version of the requested resource, as stored under
+    :data:`VERSION_ETAG_ENVIRON_KEY`.
+
+    Returns `response`, so that this function can be registered to run
+    after each request (for example, using
+    :meth:`flask.Blueprint.after_request`).
+
+    """
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 304) or
+            response.direct_passthrough or
+            'Content-Encoding' in response.headers):
+        return response
+    coding = request.accept_encodings.best_match(CONTENT_CODINGS)
+    if coding is None:
+        return response
+    streamed = response.is_streamed
+    if not streamed and len(response.get_data()) < threshold:
+        return response
+    compress, flush = _compressor(coding, level)
+    if streamed:
+        chunks = _compressed_chunks(response.iter_encoded(), compress, flush)
+        response.response = chunks
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compress(response.get_data()) + flush())
+    response.headers['Content-Encoding'] = coding
+    etag, weak = response.get_etag()
+    version = request.environ.get(VERSION_ETAG_ENVIRON_KEY)
+    if etag is not None and not weak and etag != version:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def content_etag(data):
+    """Returns an entity tag computed from the bytes of a response body.
+
+    `data` is the encoded body of the response, as returned by
+    :meth:`flask.Response.get_data`.
+
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+def _utc_naive(value):
+    """Returns the naive UTC :class:`datetime.datetime` equivalent to
+    `value`, which may or may not be timezone-aware.
+
+    Werkzeug parses dates in HTTP headers as naive UTC datetimes, so
+    timestamps from the database must be made comparable with them.
+
+    """
+    offset = value.utcoffset()
+    if offset is not None:
+        value = (value - offset).replace(tzinfo=None)
+    return value
+
+
+def is_not_modified(etag=None, last_modified=None):
+    """Returns ``True`` if and only if the conditional request headers of
+    the current request indicate that the representation the client
+    already has is current.
+
+    `etag` is the entity tag of the current representation of the
+    requested resource (or collection), or ``None`` if it is not known.
+    `last_modified` is the :class:`datetime.datetime` at which the
+    requested resource (or collection) was last modified, or ``None`` if
+    it is not known.
+
+    As required by :rfc:`7232#section-3.3`, the
+    :http:header:`If-Modified-Since` header is ignored if the request has
+    an :http:header:`If-None-Match` header. The latter is evaluated using
+    the weak comparison function, so both strong and weak entity tags
+    match.
+
+    """
+    if_none_match = request.if_none_match
+    if if_none_match:
+        return etag is not None and if_none_match.contains_weak(etag)
+    if_modified_since = request.if_modified_since
+    if last_modified is None or if_modified_since is None:
+        return False
+    # HTTP dates have a resolution of one second.
+    last_modified = _utc_naive(last_modified).replace(microsecond=0)
+    return last_modified <= _utc_naive(if_modified_since)
+
+
+def version_etag(version):
+    """Returns the strong entity tag, without quotes, representing the
+    specified version of a resource, for use with optimistic concurrency
+    control.
+
+    The entity tag is the version itself, so a client can construct it
+    from the attribute that stores the version. Dates and times are
+    given in ISO 8601 format, as they are serialized.
+
+    """
+    if hasattr(version, 'isoformat'):
+        version = version.isoformat()
+    return str(version)
+
+
+def set_validators(response, etag=None, weak=False, last_modified=None):
+    """Sets the :http:header:`ETag` and :http:header:`Last-Modified`
+    headers on the specified response object.
+
+    If `etag` is not ``None``, it is set as the entity tag of the
+    response; it is marked as a weak entity tag if `weak` is
+    ``True``. If `last_modified` is not ``None``, it is set as the last
+    modification time of the response.
+
+    """
+    if etag is not None:
+        response.set_etag(etag, weak=weak)
+    if last_modified is not None:
+        response.last_modified = _utc_naive(last_modified)
+
+
+def not_modified_response(etag=None, weak=False, last_modified=None):
+    """Returns a :http:statuscode:`304` response with no body.
+
+    The arguments are the validators to include in the response, as
+    described in :func:`set_validators`.
+
+    """
+    response = current_app.response_class(status=304)
+    set_validators(response, etag, weak, last_modified)
+    return response
+
+
 def parse_sparse_fields(type_=None):
     """Get the sparse fields as requested by the client.
 
@@ -520,15 +832,91 @@ def parse_sparse_fields(type_=None):
         {'title', 'body'}
 
     """
-    # TODO use a regular expression to ensure field parameters are of the
-    # correct format? (maybe ``fields\[[^\[\]\.]*\]``)
+    # The parsed fields are shared by all requests with the same query
+    # string, so each caller gets its own copy of the sets.
+    fields = _cached(_sparse_fields, request.query_string,
+                     _parse_sparse_fields, request.args)
     # TODO In Python 2.7 and later, this should be a dictionary comprehension.
-    fields = dict((key[7:-1], set(value.split(',')))
-                  for key, value in request.args.items()
-                  if key.startswith('fields[') and key.endswith(']'))
+    fields = dict((key, set(value)) for key, value in fields)
     return fields.get(type_) if type_ is not None else fields
 
 
+def _parse_sparse_fields(args):
+    """Returns a tuple of pairs whose left element is a resource type
+    name and whose right element is the frozen set of fields to include
+    for that resource type, as requested in the query parameters `args`.
+
+    """
+    # TODO use a regular expression to ensure field parameters are of the
+    # correct format? (maybe ``fields\[[^\[\]\.]*\]``)
+    return tuple((key[7:-1], frozenset(value.split(',')))
+                 for key, value in args.items()
+                 if key.startswith('fields[') and key.endswith(']'))
+
+
+def _parse_collection_args(args):
+    """Parses the filtering, sorting, and grouping query parameters in
+    `args`.
+
+    Returns a six-tuple of the form ``(filters, simple_filters, sort,
+    group_by, single, ignorecase)``, in which every element is
+    immutable. `filters` is the frozen (see :func:`_freeze`) list of
+    filter objects given in the :data:`FILTER_PARAM` query parameter.
+    `simple_filters` is a tuple of pairs of the form ``(field, values)``,
+    one for each "simple" filter query parameter of the form
+    ``filter[field]=value1,value2``. `sort` is a tuple of pairs of the
+    form ``(direction, field)`` and `group_by` is a tuple of field names.
+
+    Raises :exc:`ValueError` if the filter objects are not valid JSON and
+    :exc:`SingleKeyError` if the :data:`SINGLE_PARAM` query parameter is
+    not a Boolean value.
+
+    """
+    # Determine filtering options.
+    #
+    # `filters` stores the filter objects, which are retrieved from the
+    # query parameter at :data:`FILTER_PARAM`. We also need to search the
+    # entire list of query parameters for everything of the form
+    # 'filter[...]'.
+    filters = _freeze(json.loads(args.get(FILTER_PARAM, '[]')))
+    simple_filters = []
+    for key, value in args.items():
+        # Skip keys that are not filters and are not filter[objects]
+        # and filter[single] request parameters.
+        #
+        # TODO Document that field names cannot be 'objects' or 'single'.
+        if not key.startswith('filter'):
+            continue
+        if key in (FILTER_PARAM, SINGLE_PARAM):
+            continue
+        # Get the field on which to filter and the values to match.
+        simple_filters.append((key[7:-1], tuple(value.split(','))))
+
+    # Determine sorting options.
+    sort = args.get(SORT_PARAM)
+    if sort:
+        sort = tuple(('-', value[1:]) if value.startswith('-')
+                     else ('+', value) for value in sort.split(','))
+    else:
+        sort = ()
+    ignorecase = bool(int(args.get(IGNORECASE_PARAM, '0')))
+
+    # Determine grouping options.
+    group_by = args.get(GROUP_PARAM)
+    if group_by:
+        group_by = tuple(group_by.split(','))
+    else:
+        group_by = ()
+
+    # Determine whether the client expects a single resource response.
+    try:
+        single = bool(int(args.get(SINGLE_PARAM, 0)))
+    except ValueError:
+        raise SingleKeyError('failed to extract Boolean from parameter')
+
+    return filters, tuple(simple_filters), sort, group_by, single, ignorecase
+
+
 def resources_from_path(instance, path):
     """Returns an iterable of all resources along the given relationship
     path for the specified instance of the model.
@@ -1098,16 +1486,76 @@ class ModelView(MethodView):
     performed when dealing with this model can be accessed from the
     :attr:`session` attribute.
 
+    `server_timing`, `statement_counter`, `metrics`, `slow_request_log`,
+    and `profiler` are as described in :ref:`servertiming`,
+    :ref:`statementcounter`, :ref:`metrics`, :ref:`slowlog`, and
+    :ref:`profiling`, respectively.
+
     """
 
     #: List of decorators applied to every method of this class.
     decorators = [requires_json_api_accept, requires_json_api_mimetype]
 
-    def __init__(self, session, model, *args, **kw):
+    #: The kind of endpoint provided by this view, used to label the
+    #: metrics of its requests.
+    endpoint_kind = None
+
+    def __init__(self, session, model, server_timing=None,
+                 statement_counter=None, metrics=None, slow_request_log=None,
+                 profiler=None, *args, **kw):
         super(ModelView, self).__init__(*args, **kw)
         self.session = session
         self.model = model
 
+        #: The :class:`~flask_restless.ServerTiming` that measures the
+        #: phases of each request, or ``None``.
+        self.server_timing = server_timing
+
+        #: The :class:`~flask_restless.StatementCounter` that counts the
+        #: SQL statements executed by each request, or ``None``.
+        self.statement_counter = statement_counter
+
+        #: The :class:`~flask_restless.Metrics` that records metrics of
+        #: each request, or ``None``.
+        self.metrics = metrics
+
+        #: The :class:`~flask_restless.SlowRequestLog` that logs slow
+        #: requests, or ``None``.
+        self.slow_request_log = slow_request_log
+
+        #: The :class:`~flask_restless.SamplingProfiler` that profiles a
+        #: sample of the requests, or ``None``.
+        self.profiler = profiler
+
+        # Measuring is done by wrapping the methods of this object, so
+        # that there is no cost at all when it is disabled.
+        if server_timing is not None:
+            self.collection_parameters = \
+                server_timing.wrap('parse', self.collection_parameters)
+
+    def dispatch_request(self, *args, **kw):
+        dispatch = super(ModelView, self).dispatch_request
+        # The profiler is innermost, so that it does not profile the
+        # other measurements.
+        if self.profiler is not None:
+            dispatch = partial(self.profiler.measure,
+                               collection_name(self.model),
+                               self.endpoint_kind, dispatch)
+        if self.statement_counter is not None:
+            dispatch = partial(self.statement_counter.measure, self.model,
+                               dispatch)
+        if self.server_timing is not None:
+            dispatch = partial(self.server_timing.measure, dispatch)
+        if self.metrics is not None:
+            dispatch = partial(self.metrics.measure,
+                               collection_name(self.model),
+                               self.endpoint_kind, dispatch)
+        if self.slow_request_log is not None:
+            dispatch = partial(self.slow_request_log.measure, self.session,
+                               self.model, collection_name(self.model),
+                               dispatch)
+        return dispatch(*args, **kw)
+
     def collection_parameters(self, resource_id=None, relation_name=None):
         """Gets filtering, sorting, grouping, and other settings from
         the request that affect the collection of resources in a
@@ -1121,26 +1569,18 @@ class ModelView(MethodView):
         This function can only be invoked in a request context.
 
         """
-        # Determine filtering options.
-        #
-        # `filters` stores the filter objects, which are retrieved from the
-        # query parameter at :data:`FILTER_PARAM`. We also support simple
-        # filtering, but we need to search the entire list of query
-        # parameters for everything of the form 'filter[...]' and convert
-        # each value found into a filter object.
-        filters = json.loads(request.args.get(FILTER_PARAM, '[]'))
-        for key, value in request.args.items():
-            # Skip keys that are not filters and are not filter[objects]
-            # and filter[single] request parameters.
-            #
-            # TODO Document that field names cannot be 'objects' or 'single'.
-            if not key.startswith('filter'):
-                continue
-            if key in (FILTER_PARAM, SINGLE_PARAM):
-                continue
-            # Get the field on which to filter and the values to match.
-            field = key[7:-1]
-            values = value.split(',')
+        # Parsing the query parameters depends only on the query string,
+        # so the parsed (immutable) values are shared among requests.
+        # Each request gets its own mutable copy, since preprocessors
+        # may modify them.
+        filters, simple_filters, sort, group_by, single, ignorecase = \
+            _cached(_collection_args, request.query_string,
+                    _parse_collection_args, request.args)
+        filters = _thaw(filters)
+        # We also support simple filtering, so we convert each query
+        # parameter of the form 'filter[...]' into a filter object.
+        for field, values in simple_filters:
+            values = list(values)
             # Determine whether this is a request of the form `GET
             # /comments` or `GET /article/1/comments`.
             if resource_id is not None and relation_name is not None:
@@ -1201,29 +1641,7 @@ class ModelView(MethodView):
         #             return dict(message='Unable to construct query'), 400
         #         param['val'] = result.get(query_field)
 
-        # Determine sorting options.
-        sort = request.args.get(SORT_PARAM)
-        if sort:
-            sort = [('-', value[1:]) if value.startswith('-') else ('+', value)
-                    for value in sort.split(',')]
-        else:
-            sort = []
-        ignorecase = bool(int(request.args.get(IGNORECASE_PARAM, '0')))
-
-        # Determine grouping options.
-        group_by = request.args.get(GROUP_PARAM)
-        if group_by:
-            group_by = group_by.split(',')
-        else:
-            group_by = []
-
-        # Determine whether the client expects a single resource response.
-        try:
-            single = bool(int(request.args.get(SINGLE_PARAM, 0)))
-        except ValueError:
-            raise SingleKeyError('failed to extract Boolean from parameter')
-
-        return filters, sort, group_by, single, ignorecase
+        return filters, list(sort), list(group_by), single, ignorecase
 
 
 class APIBase(ModelView):
@@ -1250,6 +1668,24 @@ class APIBase(ModelView):
     `allow_to_many_replacement` is as described in
     :ref:`allowreplacement`.
 
+    `allow_bulk_creation` is as described in :ref:`bulkcreation`.
+
+    `max_bulk_rows` is as described in :ref:`patchmany` and
+    :ref:`deletemany`.
+
+    `optimistic_concurrency` and `version_column` are as described in
+    :ref:`optimisticconcurrency`.
+
+    `deferred_postprocessors` and `worker_pool` are as described in
+    :ref:`deferred`.
+
+    `etags`, `weak_etags`, `last_modified_column`, and `validator_query`
+    are as described in :ref:`conditionalrequests`.
+
+    `response_cache` is as described in :ref:`responsecache`.
+
+    `aggregate_cache` is as described in :ref:`aggregatecache`.
+
     """
 
     #: List of decorators applied to every method of this class.
@@ -1258,8 +1694,13 @@ class APIBase(ModelView):
     def __init__(self, session, model, preprocessors=None, postprocessors=None,
                  primary_key=None, serializer=None, deserializer=None,
                  validation_exceptions=None, includes=None, page_size=10,
-                 max_page_size=100, allow_to_many_replacement=False, *args,
-                 **kw):
+                 max_page_size=100, allow_to_many_replacement=False,
+                 allow_bulk_creation=False, max_bulk_rows=None,
+                 optimistic_concurrency=False, version_column=None,
+                 etags=False, weak_etags=False, last_modified_column=None,
+                 validator_query=False, response_cache=None,
+                 aggregate_cache=None, deferred_postprocessors=None,
+                 worker_pool=None, *args, **kw):
         super(APIBase, self).__init__(session, model, *args, **kw)
 
         #: The name of the collection specified by the given model class
@@ -1276,6 +1717,26 @@ class APIBase(ModelView):
         #: updating a resource.
         self.allow_to_many_replacement = allow_to_many_replacement
 
+        #: Whether to allow creating several resources in a single
+        #: :http:method:`post` request.
+        self.allow_bulk_creation = allow_bulk_creation
+
+        #: The maximum number of resources that a single request may
+        #: update or delete by filter, or ``None`` if there is no limit.
+        self.max_bulk_rows = max_bulk_rows
+
+        #: Whether to honor the :http:header:`If-Match` header of
+        #: requests that update or delete a resource.
+        self.optimistic_concurrency = optimistic_concurrency
+
+        #: The name of the attribute of the model that stores the version
+        #: of each instance for optimistic concurrency control, or
+        #: ``None``. This is the version counter of the model unless
+        #: another attribute is specified.
+        self.version_column = version_column
+        if version_column is None:
+            self.version_column = model_info(self.model).version_id_key
+
         #: The default page size for responses that consist of a
         #: collection of resources.
         #:
@@ -1290,6 +1751,38 @@ class APIBase(ModelView):
         #: returned.
         self.max_page_size = max_page_size
 
+        #: Whether to provide an entity tag computed from the body of
+        #: each response to a :http:method:`get` request.
+        self.etags = etags
+
+        #: Whether to provide weak entity tags instead of strong ones.
+        #:
+        #: If the model has a version counter or if
+        #: :attr:`last_modified_column` is set, the weak entity tag is
+        #: computed from the primary keys and versions of the requested
+        #: resources, without serializing them.
+        self.weak_etags = weak_etags
+
+        #: The name of the attribute of the model that stores the time
+        #: at which each instance was last modified, or ``None``.
+        self.last_modified_column = last_modified_column
+
+        #: Whether to compute validators for :http:method:`get` requests
+        #: with a single aggregate query before fetching any resources.
+        self.validator_query = validator_query
+
+        #: Whether to handle :http:method:`get` requests conditionally.
+        self.conditional_get = (etags or weak_etags or
+                                last_modified_column is not None)
+
+        #: The :class:`~flask_restless.ResponseCache` in which to
+        #: store responses to :http:method:`get` requests, or ``None``.
+        self.response_cache = response_cache
+
+        #: The :class:`~flask_restless.AggregateCache` that stores the
+        #: results of the function evaluation endpoint, or ``None``.
+        self.aggregate_cache = aggregate_cache
+
         #: A custom serialization function for primary resources; see
         #: :ref:`serialization` for more information.
         #:
@@ -1320,10 +1813,33 @@ class APIBase(ModelView):
         #: the main functionality of that method has been executed.
         self.preprocessors = defaultdict(list, upper(preprocessors or {}))
 
+        #: The mapping from method name to a list of functions to apply in
+        #: the background after the changes made by that method have been
+        #: committed.
+        self.deferred_postprocessors = \
+            defaultdict(list, upper(deferred_postprocessors or {}))
+
+        #: The :class:`~flask_restless.WorkerPool` on which to execute
+        #: the deferred postprocessors, or ``None``.
+        self.worker_pool = worker_pool
+
         #: The mapping from resource type name to requested sparse
         #: fields for resources of that type.
         self.sparse_fields = parse_sparse_fields()
 
+        timing = self.server_timing
+        if timing is not None:
+            timing.wrap_all('preprocessors', self.preprocessors)
+            timing.wrap_all('postprocessors', self.postprocessors)
+            if self.serializer is not None:
+                self.serializer = timing.wrap_serializer(self.serializer)
+            self.get_all_inclusions = \
+                timing.wrap('include', self.get_all_inclusions)
+            self._paginated = timing.wrap('paginate', self._paginated)
+            self._count = timing.wrap('count', self._count)
+        if self.metrics is not None:
+            self._count = self.metrics.wrap('count_seconds', self._count)
+
         # HACK: We would like to use the :attr:`API.decorators` class attribute
         # in order to decorate each view method with a decorator that catches
         # database integrity errors. However, in order to rollback the session,
@@ -1367,6 +1883,47 @@ class APIBase(ModelView):
         """
         return False
 
+    def _version_headers(self, instance):
+        """Returns the dictionary of headers of a response containing the
+        specified instance that provide its version for optimistic
+        concurrency control.
+
+        """
+        version = getattr(instance, self.version_column)
+        etag = version_etag(version)
+        request.environ[VERSION_ETAG_ENVIRON_KEY] = etag
+        return {'ETag': quote_etag(etag)}
+
+    def _defer(self, processor_type, **kw):
+        """Defers applying the deferred postprocessors of the specified
+        type with the keyword arguments `kw` until the session commits.
+
+        """
+        functions = self.deferred_postprocessors[processor_type]
+        if functions:
+            self.worker_pool.defer(self.session, functions, kw)
+
+    def _record_changes(self, models):
+        """Records that the session changed the specified models by
+        executing a statement directly instead of flushing instances, so
+        that the caches discard what depends on them on commit.
+
+        """
+        if self.response_cache is not None:
+            self.response_cache.record(self.session, models)
+        if self.aggregate_cache is not None:
+            self.aggregate_cache.record(self.session, models)
+
+    def _commit(self):
+        """Commits the session, or only flushes it if the current request
+        is one operation of a request to the atomic operations endpoint.
+
+        """
+        if request.environ.get(OPERATION_ENVIRON_KEY):
+            self.session.flush()
+        else:
+            self.session.commit()
+
     def _handle_validation_exception(self, exception):
         """Rolls back the session, extracts validation error messages, and
         returns an error response with :http:statuscode:`400` containing the
@@ -1394,9 +1951,9 @@ class APIBase(ModelView):
         model.
 
         ``instance_or_instances`` is either a SQLAlchemy
-        :class:`~sqlalchemy.orm.query.Query` object representing
-        multiple instances of a SQLAlchemy model, or it is simply one
-        instance of a model. These instances represent the resources
+        :class:`~sqlalchemy.orm.query.Query` object or a list
+        representing multiple instances of a SQLAlchemy model, or it is
+        simply one instance of a model. These instances represent the resources
         that will be returned as primary data in the JSON API
         response. The resources to include will be computed based on
         these data and the client's ``include`` query parameter.
@@ -1412,7 +1969,7 @@ class APIBase(ModelView):
         # of a SQLAlchemy model, get the resources to include for that
         # one instance. Otherwise, collect the resources to include for
         # each instance in `instances`.
-        if isinstance(instance_or_instances, Query):
+        if isinstance(instance_or_instances, (Query, list)):
             instances = instance_or_instances
             to_include = set(chain(map(self.resources_to_include, instances)))
         else:
@@ -1425,6 +1982,10 @@ class APIBase(ModelView):
         result = simple_serialize_many(to_include, only=only)
         return result['data']
 
+    def _count(self, query):
+        """Returns the number of rows in the specified query."""
+        return count(self.session, query)
+
     def _paginated(self, items, filters=None, sort=None, group_by=None):
         """Returns a :class:`Paginated` object representing the
         correctly paginated list of resources to return to the client,
@@ -1475,7 +2036,7 @@ class APIBase(ModelView):
             #
             # but we can't get the length of the list of items until
             # we serialize them.
-            num_results = count(self.session, items)
+            num_results = self._count(items)
             return Paginated(items, page_size=0, num_results=num_results)
         # Determine the client's page number request. Raise an exception
         # if the page number is out of bounds.
@@ -1498,7 +2059,7 @@ class APIBase(ModelView):
             next_ = pagination.next_num
             items = pagination.items
         else:
-            num_results = count(self.session, items)
+            num_results = self._count(items)
             first = 1
             # Handle a special case for an empty collection of items.
             #
@@ -1522,8 +2083,245 @@ class APIBase(ModelView):
                          page_size=page_size, filters=filters, sort=sort,
                          group_by=group_by)
 
+    def _version_validators(self, instances, num_results=None):
+        """Returns the validators for a response containing the specified
+        instances that can be computed without serializing them.
+
+        `instances` is a list of instances of models that are the primary
+        data of the response. `num_results` is the total number of
+        results of which `instances` is one page, if applicable.
+
+        Returns a pair whose left element is a weak entity tag (or
+        ``None``) and whose right element is the time at which any of
+        `instances` was last modified (or ``None``).
+
+        The entity tag is computed only if :attr:`weak_etags` is
+        ``True`` and each instance has a version, either from the
+        version counter of its model or from the attribute named by
+        :attr:`last_modified_column`. It depends on the URL and
+        :http:header:`Accept` header of the request, the identity and
+        version of each instance, and `num_results`. Changes to related
+        resources that are included in the response do *not* change it.
+
+        """
+        last_modified = None
+        column = self.last_modified_column
+        if column is not None:
+            timestamps = [getattr(instance, column, None)
+                          for instance in instances]
+            timestamps = [t for t in timestamps if t is not None]
+            if timestamps:
+                last_modified = max(timestamps)
+        if not self.weak_etags:
+            return None, last_modified
+        versions = []
+        for instance in instances:
+            version_id_key = model_info(get_model(instance)).version_id_key
+            if version_id_key is not None:
+                version = getattr(instance, version_id_key)
+            elif column is not None:
+                version = getattr(instance, column, None)
+            else:
+                return None, last_modified
+            identity = sqlalchemy_inspect(instance).identity
+            versions.append((get_model(instance).__name__, identity, version))
+        token = repr((request.url, request.headers.get('Accept'),
+                      num_results, versions))
+        return content_etag(token.encode('utf-8')), last_modified
+
+    def _validators_from_row(self, row):
+        """Returns the validators for a response given a row returned by
+        the query constructed in :meth:`_query_validators` or
+        :meth:`_resource_validators`.
+
+        The row must end with the latest modification time if
+        :attr:`last_modified_column` is not ``None``.
+
+        """
+        last_modified = None
+        if self.last_modified_column is not None:
+            last_modified = row[-1]
+        etag = None
+        if self.weak_etags:
+            token = repr((request.url, request.headers.get('Accept'),
+                          tuple(row)))
+            etag = content_etag(token.encode('utf-8'))
+        return etag, last_modified
+
+    def _validator_columns(self):
+        """Returns the list of columns of the model fetched by
+        :meth:`_resource_validators`.
+
+        The list contains the version counter of the model (if any)
+        followed by the last modification time column (if any).
+
+        """
+        columns = []
+        version_id_key = model_info(self.model).version_id_key
+        if version_id_key is not None:
+            columns.append(getattr(self.model, version_id_key))
+        if self.last_modified_column is not None:
+            columns.append(getattr(self.model, self.last_modified_column))
+        return columns
+
+    def _query_validators(self, query):
+        """Returns the validators for a response containing the
+        collection represented by the specified query, computed by a
+        single aggregate query instead of fetching the collection.
+
+        `query` is the (filtered and sorted, but not paginated) query
+        whose results are the collection.
+
+        The entity tag depends on the URL and :http:header:`Accept` header
+        of the request and on the number of rows, aggregates of their
+        primary keys, the sum of their versions, and their latest
+        modification time. Any change to a row that increments its
+        version or updates its modification time changes the entity tag,
+        as does adding or removing rows, even if a row is removed and
+        another with the same version is added. For each column of the
+        primary key, the aggregates are its sum and maximum if it is an
+        integer, or its minimum and maximum otherwise.
+
+        Returns a pair like :meth:`_version_validators`, but the right
+        element is always ``None``: the latest modification time of the
+        collection does not change when a resource other than the
+        latest one is removed, so it cannot be a validator.
+
+        """
+        aggregates = [func.count()]
+        for column in sqlalchemy_inspect(self.model).primary_key:
+            if isinstance(column.type, Integer):
+                aggregates.append(func.sum(column))
+            else:
+                aggregates.append(func.min(column))
+            aggregates.append(func.max(column))
+        version_id_key = model_info(self.model).version_id_key
+        if version_id_key is not None:
+            aggregates.append(func.sum(getattr(self.model, version_id_key)))
+        if self.last_modified_column is not None:
+            column = getattr(self.model, self.last_modified_column)
+            aggregates.append(func.max(column))
+        row = query.order_by(None).with_entities(*aggregates).one()
+        etag, last_modified = self._validators_from_row(row)
+        return etag, None
+
+    def _resource_validators(self, resource_id):
+        """Returns the validators for a response containing the resource
+        with the specified ID, computed by fetching only its version and
+        last modification time.
+
+        Returns ``None`` if there is no such resource.
+
+        """
+        query = query_by_primary_key(self.session, self.model, resource_id,
+                                     self.primary_key)
+        row = query.with_entities(*self._validator_columns()).first()
+        if row is None:
+            return None
+        return self._validators_from_row(row)
+
+    def _conditional_response(self, response, status=200, headers=None,
+                              etag=None, last_modified=None):
+        """Adds validators to the response to a :http:method:`get`
+        request, or replaces the response with a :http:statuscode:`304`
+        response if the client already has the current representation.
+
+        `response` is the response object created by :func:`jsonpify`,
+        and `status` and `headers` are the status code and additional
+        headers of the response.
+
+        `etag` and `last_modified` are the validators computed by
+        :meth:`_version_validators`, if any. If `etag` is ``None``, an
+        entity tag is computed from the body of `response` instead.
+
+        Returns a value suitable for returning from a view method.
+
+        """
+        weak = self.weak_etags
+        if etag is None and (self.etags or weak):
+            etag = content_etag(response.get_data())
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, weak, last_modified)
+        set_validators(response, etag, weak, last_modified)
+        return response, status, headers or {}
+
+    def _cache_dependencies(self):
+        """Returns the list of models on which the response to the
+        current request depends, for use with :attr:`response_cache`.
+
+        The list contains the model of this API, the models of any
+        resources to be included in a compound document, and the models
+        related to each of these (since relationship objects refer to
+        them), sorted by name.
+
+        """
+        toinclude = request.args.get('include')
+        if toinclude is not None:
+            paths = toinclude.split(',')
+        else:
+            paths = self.default_includes or ()
+        models = set([self.model])
+        for path in paths:
+            model = self.model
+            for relation_name in path.split('.'):
+                try:
+                    model = get_related_model(model, relation_name)
+                except (KeyError, AttributeError):
+                    model = None
+                if model is None:
+                    break
+                models.add(model)
+        for model in list(models):
+            models.update(model_info(model).related_models.values())
+        return sorted(models, key=lambda m: (m.__module__, m.__name__))
+
+    def _cached_response(self, get_response, *parts):
+        """Returns the response to the current :http:method:`get`
+        request, using :attr:`response_cache` if it is not ``None``.
+
+        `get_response` is a function with no arguments that computes the
+        response. `parts` are the parameters of the request as modified
+        by the preprocessors; they are included in the cache key.
+
+        Only :http:statuscode:`200` responses are stored. If a stored
+        response has validators, a :http:statuscode:`304` response is
+        returned instead when the client already has it.
+
+        """
+        cache = self.response_cache
+        if cache is None:
+            return get_response()
+        key = cache.key(*parts)
+        models = self._cache_dependencies()
+        response = cache.get(key, models)
+        if response is not None:
+            etag, weak = response.get_etag()
+            last_modified = response.last_modified
+            if is_not_modified(etag, last_modified):
+                return not_modified_response(etag, weak, last_modified)
+            return response
+        # Compute the generations before the response so that a change
+        # committed in the meantime makes the stored response stale.
+        generations = cache.generations(models)
+        response = current_app.make_response(get_response())
+        if response.status_code == 200:
+            cache.set(key, generations, response)
+        return response
+
     def _get_resource_helper(self, resource, primary_resource=None,
-                             relation_name=None, related_resource=False):
+                             relation_name=None, related_resource=False,
+                             validators=None):
+        # If the client already has the current version of the resource,
+        # there is no need to serialize it.
+        #
+        # The validators may have already been computed by the caller.
+        if self.conditional_get:
+            if validators is None:
+                instances = [] if resource is None else [resource]
+                validators = self._version_validators(instances)
+            etag, last_modified = validators
+            if is_not_modified(etag, last_modified):
+                return not_modified_response(etag, True, last_modified)
         is_relationship = self.use_resource_identifiers()
         # The resource to serialize may be `None`, if we are fetching a
         # to-one relation that has no value. In this case, the "data"
@@ -1601,6 +2399,15 @@ class APIBase(ModelView):
         processor_type = 'GET_{0}'.format(self.resource_processor_type(**kw))
         for postprocessor in self.postprocessors[processor_type]:
             postprocessor(result=result)
+        if self.conditional_get:
+            return self._conditional_response(jsonpify(result), 200,
+                                              etag=etag,
+                                              last_modified=last_modified)
+        # Provide the version of a primary resource for use in the
+        # If-Match header of a subsequent request to update it.
+        if (self.optimistic_concurrency and not is_relation and
+                resource is not None and not is_relationship):
+            return jsonpify(result), 200, self._version_headers(resource)
         return jsonpify(result), 200
 
     def _get_collection_helper(self, resource=None, relation_name=None,
@@ -1625,6 +2432,19 @@ class APIBase(ModelView):
         except Exception as exception:
             detail = 'Unable to construct query'
             return error_response(400, cause=exception, detail=detail)
+        if QUERY_ENVIRON_KEY in request.environ:
+            request.environ[QUERY_ENVIRON_KEY] = search_items
+
+        # If the client already has the current version of the
+        # collection, as determined by a single aggregate query, there is
+        # no need to fetch any resources.
+        validators = None
+        if (self.validator_query and self.weak_etags and not is_relation
+                and not group_by):
+            validators = self._query_validators(search_items)
+            if is_not_modified(*validators):
+                return not_modified_response(validators[0], True,
+                                             validators[1])
 
         is_relationship = self.use_resource_identifiers()
         # Add the primary data (and any necessary links) to the JSON API
@@ -1639,6 +2459,20 @@ class APIBase(ModelView):
             except PaginationError as exception:
                 detail = exception.args[0]
                 return error_response(400, cause=exception, detail=detail)
+            # If the client already has the current version of this page
+            # of the collection, there is no need to serialize it.
+            if self.conditional_get:
+                if validators is None:
+                    # The latest modification time of the instances on
+                    # this page does not change when one of them is
+                    # deleted or when an older one moves into the page,
+                    # so a collection has no last modification time.
+                    etag = self._version_validators(paginated.items,
+                                                    paginated.num_results)[0]
+                    validators = etag, None
+                etag, last_modified = validators
+                if is_not_modified(etag, last_modified):
+                    return not_modified_response(etag, True, last_modified)
             # Serialize the found items.
             #
             # We are serializing one of three possibilities.
@@ -1691,6 +2525,14 @@ class APIBase(ModelView):
             except MultipleResultsFound as exception:
                 detail = 'Multiple results found'
                 return error_response(404, cause=exception, detail=detail)
+            # If the client already has the current version of the
+            # resource, there is no need to serialize it.
+            if self.conditional_get:
+                if validators is None:
+                    validators = self._version_validators([resource])
+                etag, last_modified = validators
+                if is_not_modified(etag, last_modified):
+                    return not_modified_response(etag, True, last_modified)
             # Serialize the single resource.
             try:
                 if is_relationship:
@@ -1751,6 +2593,9 @@ class APIBase(ModelView):
         status = 200
         meta = {'total': num_results}
         result.setdefault('meta', {}).update(meta)
+        if self.conditional_get:
+            return self._conditional_response(jsonpify(result), status,
+                                              headers, etag, last_modified)
         return jsonpify(result), status, headers
 
     def resources_to_include(self, instance):
@@ -16,19 +16,177 @@ The main class in this module, :class:`FunctionAPI`, is a
 the result of evaluating a SQL function on a SQLAlchemy model.
 
 """
+import datetime
+
+from dateutil.parser import parse as parse_datetime
 from flask import json
 from flask import request
+from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import Date
+from sqlalchemy import DateTime
+from sqlalchemy import funcfilter
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
 from sqlalchemy.sql import func
 
+from ..helpers import get_field_type
 from ..search import create_filters
 from ..search import FilterParsingError
 from ..search import FilterCreationError
+from ..search.drivers import resolve_field
 from .base import error_response
 from .base import jsonpify
 from .base import ModelView
+from .base import PAGE_NUMBER_PARAM
+from .base import PAGE_SIZE_PARAM
+from .base import Paginated
 from .base import SingleKeyError
 
+#: The default maximum number of groups in a response from the function
+#: evaluation endpoint when the client requests grouped results.
+DEFAULT_MAX_GROUPS = 100
+
+#: The default maximum number of buckets in a response from the function
+#: evaluation endpoint when the client requests a histogram.
+DEFAULT_MAX_BUCKETS = 1000
+
+#: The query parameter key that identifies the date or time field by
+#: which to bucket the results of a histogram.
+HISTOGRAM_FIELD_PARAM = 'histogram[field]'
+
+#: The query parameter key that identifies the width of each bucket of a
+#: histogram.
+HISTOGRAM_WIDTH_PARAM = 'histogram[width]'
+
+#: The query parameter key that identifies the start of the first bucket
+#: of a histogram.
+HISTOGRAM_START_PARAM = 'histogram[start]'
+
+#: The query parameter key that identifies the end of the last bucket of
+#: a histogram.
+HISTOGRAM_END_PARAM = 'histogram[end]'
+
+#: The widths of histogram buckets, each mapped to the format strings
+#: that truncate a date or time to the start of its bucket on SQLite and
+#: on MySQL, respectively.
+#:
+#: A week starts on Monday, as with the ``date_trunc`` function of
+#: PostgreSQL, so weeks are truncated by other means.
+BUCKET_FORMATS = {
+    'minute': ('%Y-%m-%d %H:%M:00', '%Y-%m-%d %H:%i:00'),
+    'hour': ('%Y-%m-%d %H:00:00', '%Y-%m-%d %H:00:00'),
+    'day': ('%Y-%m-%d', '%Y-%m-%d'),
+    'week': (None, None),
+    'month': ('%Y-%m-01', '%Y-%m-01'),
+}
+
+#: The names of the functions whose value for a bucket that contains no
+#: rows is zero. For other functions, the value is ``None``.
+ZERO_FUNCTIONS = ('count', 'sum')
+
+
+class UnsupportedDialect(Exception):
+    """Raised when a feature of the function evaluation endpoint is not
+    supported on the database in use.
+
+    This is a limitation of the server, not an error of the client.
+
+    """
+    pass
+
+
+def bucket_expression(dialect, field, width):
+    """Returns a SQL expression that truncates the value of `field` to
+    the start of its histogram bucket of the given width.
+
+    `dialect` is the SQLAlchemy dialect of the database, `field` is a
+    date or date and time column, and `width` is a key of
+    :data:`BUCKET_FORMATS`.
+
+    If the database of the dialect is not supported, this function
+    raises :exc:`UnsupportedDialect`.
+
+    """
+    sqlite_format, mysql_format = BUCKET_FORMATS[width]
+    if dialect.name == 'postgresql':
+        return func.date_trunc(width, field)
+    if dialect.name == 'sqlite':
+        if width == 'week':
+            # Go back six days, then forward to the next Monday.
+            return func.date(field, '-6 days', 'weekday 1')
+        return func.strftime(sqlite_format, field)
+    if dialect.name == 'mysql':
+        if width == 'week':
+            return func.subdate(func.date(field), func.weekday(field))
+        return func.date_format(field, mysql_format)
+    msg = 'histograms are not supported on {0}'.format(dialect.name)
+    raise UnsupportedDialect(msg)
+
+
+def truncate(value, width):
+    """Returns the start of the histogram bucket of the given width that
+    contains the :class:`datetime.datetime` `value`.
+
+    """
+    value = value.replace(second=0, microsecond=0)
+    if width == 'minute':
+        return value
+    value = value.replace(minute=0)
+    if width == 'hour':
+        return value
+    value = value.replace(hour=0)
+    if width == 'day':
+        return value
+    if width == 'week':
+        return value - datetime.timedelta(days=value.weekday())
+    return value.replace(day=1)
+
+
+def next_bucket(value, width):
+    """Returns the start of the histogram bucket of the given width that
+    follows the one starting at `value`.
+
+    """
+    if width == 'month':
+        if value.month == 12:
+            return value.replace(year=value.year + 1, month=1)
+        return value.replace(month=value.month + 1)
+    if width == 'week':
+        return value + datetime.timedelta(days=7)
+    return value + datetime.timedelta(**{width + 's': 1})
+
+
+def to_datetime(value):
+    """Returns the :class:`datetime.datetime` represented by the value
+    of a bucket returned by the database, which may be a string, a date,
+    or a date and time. Any time zone information is discarded.
+
+    """
+    if not isinstance(value, datetime.date):
+        value = parse_datetime(value)
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=None)
+    return datetime.datetime(value.year, value.month, value.day)
+
+
+def supports_filter_clause(dialect):
+    """Returns ``True`` if and only if the database of the specified
+    SQLAlchemy dialect supports the ``FILTER`` clause on aggregate
+    functions.
+
+    PostgreSQL supports it since version 9.4 and SQLite since version
+    3.30.0.
+
+    """
+    if dialect.name == 'postgresql':
+        version = dialect.server_version_info
+        return version is not None and version >= (9, 4)
+    if dialect.name == 'sqlite':
+        version = getattr(dialect.dbapi, 'sqlite_version_info', None)
+        return version is not None and version >= (3, 30, 0)
+    return False
+
 
 def create_function_query(session, model, functions):
     """Creates a SQLAlchemy query representing the given SQLAlchemy functions.
@@ -43,6 +201,14 @@ def create_function_query(session, model, functions):
 
         {'name': 'avg', 'field': 'amount'}
 
+    A dictionary may also have a ``'filter'`` key whose value is a list
+    of filter objects, as in the ``filter[objects]`` query parameter. In
+    that case, the function is applied only to the rows that match all
+    of those filters, using a ``FILTER`` clause if the database supports
+    it and a ``CASE`` expression otherwise. This way, functions with
+    different filters are still evaluated in a single pass over the
+    table.
+
     The return value of this function is a SQLAlchemy query with the
     given functions applied.
 
@@ -52,9 +218,13 @@ def create_function_query(session, model, functions):
     exception will have a ``field`` attribute which is the name of the
     field which does not exist. The latter exception will have a
     ``function`` attribute which is the name of the function with does
-    not exist.
+    not exist. If the ``'filter'`` value is not a list of filter objects
+    or if a filter object is invalid,
+    :exc:`~flask_restless.search.FilterParsingError` or
+    :exc:`~flask_restless.search.FilterCreationError` is raised.
 
     """
+    use_filter_clause = None
     processed = []
     for function in functions:
         if 'name' not in function:
@@ -72,23 +242,71 @@ def create_function_query(session, model, functions):
         except AttributeError as exception:
             exception.field = fieldname
             raise exception
-        processed.append(funcobj(field))
-    return session.query(*processed)
+        filters = function.get('filter')
+        if not filters:
+            processed.append(funcobj(field))
+            continue
+        if (not isinstance(filters, list) or
+                not all(isinstance(f, dict) for f in filters)):
+            message = ('`filter` in function object must be a list of filter'
+                       ' objects')
+            raise FilterParsingError(message)
+        # This function call may raise an exception.
+        condition = and_(*create_filters(model, filters))
+        # Determine the capabilities of the database only if needed.
+        if use_filter_clause is None:
+            bind = session.get_bind(mapper=sqlalchemy_inspect(model))
+            use_filter_clause = supports_filter_clause(bind.dialect)
+        if use_filter_clause:
+            processed.append(funcfilter(funcobj(field), condition))
+        else:
+            # Aggregate functions ignore the NULL given for each row
+            # that does not satisfy the condition.
+            processed.append(funcobj(case([(condition, field)])))
+    # Selecting from the model allows the query to be joined with
+    # related models when grouping by a relationship path.
+    return session.query(*processed).select_from(model)
 
 
 class FunctionAPI(ModelView):
     """Provides method-based dispatching for :http:method:`get` requests which
     wish to apply SQL functions to all instances of a model.
 
+    `max_groups` is the maximum number of groups in a response to a
+    request that groups the results, as described in
+    :ref:`groupedfunctions`. It is also the default page size of such a
+    response.
+
+    `max_buckets` is the maximum number of buckets in a response to a
+    request for a histogram, as described in :ref:`histograms`.
+
+    `aggregate_cache` is as described in :ref:`aggregatecache`.
+
     .. versionadded:: 0.4
 
     """
 
-    # TODO Currently, this method first creates a query from the given
-    # functions, then applies the filters to the query
-    # afterwards. However, in SQLAlchemy 1.0.0, we could use the
-    # :func:`sqlalchemy.funcfilter` function for backends that support
-    # the FILTER clause with aggregate functions.
+    #: The kind of endpoint provided by this view, used to label the
+    #: metrics of its requests.
+    endpoint_kind = 'eval'
+
+    def __init__(self, session, model, max_groups=DEFAULT_MAX_GROUPS,
+                 max_buckets=DEFAULT_MAX_BUCKETS, aggregate_cache=None, *args,
+                 **kw):
+        super(FunctionAPI, self).__init__(session, model, *args, **kw)
+
+        #: The maximum number of buckets in a response to a request for a
+        #: histogram.
+        self.max_buckets = max_buckets
+
+        #: The :class:`~flask_restless.AggregateCache` in which to store
+        #: the results of evaluating functions, or ``None``.
+        self.aggregate_cache = aggregate_cache
+
+        #: The maximum number of groups in a response to a request that
+        #: groups the results of the functions.
+        self.max_groups = max_groups
+
     def get(self):
         """Returns the result of evaluating the SQL functions specified in the
         body of the request.
@@ -116,11 +334,19 @@ class FunctionAPI(ModelView):
         try:
             query = create_function_query(self.session, self.model, functions)
         except AttributeError as exception:
+            # Only the exception raised for an unknown field is caused by
+            # the client; any other indicates a bug.
+            if not hasattr(exception, 'field'):
+                raise
             detail = 'unknown field "{0}"'.format(exception.field)
             return error_response(400, cause=exception, detail=detail)
         except KeyError as exception:
             detail = str(exception)
             return error_response(400, cause=exception, detail=detail)
+        except (FilterParsingError, FilterCreationError) as exception:
+            detail = 'invalid filter object in function object: {0}'
+            detail = detail.format(str(exception))
+            return error_response(400, cause=exception, detail=detail)
 
         # Get the filtering, sorting, and grouping parameters.
         try:
@@ -135,6 +361,7 @@ class FunctionAPI(ModelView):
 
         try:
             # Create the filtered query according to the parameters.
+            filter_objects = filters
             filters = create_filters(self.model, filters)
             # Apply the filters to the query.
             query = query.filter(*filters)
@@ -142,17 +369,202 @@ class FunctionAPI(ModelView):
             detail = 'invalid filter object: {0}'.format(str(exception))
             return error_response(400, cause=exception, detail=detail)
 
+        if HISTOGRAM_FIELD_PARAM in request.args:
+            if group_by:
+                detail = 'Cannot group the results of a histogram'
+                return error_response(400, detail=detail)
+            return self._histogram(query, functions)
+
+        if group_by:
+            return self._grouped(query, len(functions), group_by, sort)
+
+        cache = self.aggregate_cache
+        if cache is not None:
+            key = cache.key(self.model, functions, filter_objects)
+            result = cache.get(key)
+            if result is not None:
+                return jsonpify({'data': result})
+            generation = cache.generation()
+            query = query.add_columns(*cache.extra_columns(self.model,
+                                                           functions,
+                                                           filter_objects,
+                                                           self.session))
+
         # Evaluate all the functions at once and get a list of results.
         try:
-            result = list(query.one())
+            row = query.one()
         except OperationalError as exception:
-            # HACK original error message is of the form:
-            #
-            #    '(OperationalError) no such function: bogusfuncname'
-            #
-            original_msg = exception.args[0]
-            bad_function = original_msg[37:]
-            detail = 'unknown function "{0}"'.format(bad_function)
-            return error_response(400, cause=exception, detail=detail)
+            return self._unknown_function(exception)
+        result = list(row[:len(functions)])
 
+        if cache is not None:
+            cache.set(key, generation, self.model, functions, filter_objects,
+                      row, self.session)
         return jsonpify({'data': result})
+
+    def _grouped(self, query, num_functions, group_by, sort):
+        """Returns the response to a request that groups the results of
+        the functions by the fields in `group_by`.
+
+        `query` is the filtered query whose first `num_functions` columns
+        are the functions requested by the client. `sort` is a list of
+        pairs as returned by :meth:`collection_parameters`, whose fields
+        must be among those in `group_by`.
+
+        All the groups on the requested page are computed by a single
+        query. Instead of counting the groups, one more group than the
+        page size is fetched to determine whether there is a next page.
+
+        """
+        # The fields may be relationship paths, in which case the query
+        # is joined with the related model once for each relationship.
+        aliases = {}
+        fields = {}
+        for field_name in group_by:
+            try:
+                query, field = resolve_field(query, self.model, field_name,
+                                             aliases)
+            except AttributeError as exception:
+                detail = 'unknown field "{0}"'.format(field_name)
+                return error_response(400, cause=exception, detail=detail)
+            fields[field_name] = field
+        for symbol, field_name in sort:
+            if field_name not in fields:
+                detail = ('cannot sort by "{0}", which is not a grouping'
+                          ' field').format(field_name)
+                return error_response(400, detail=detail)
+        # By default, order by the grouping fields so that pages are
+        # consistent.
+        if not sort:
+            sort = [('+', field_name) for field_name in group_by]
+        order = []
+        for symbol, field_name in sort:
+            field = fields[field_name]
+            order.append(field.asc() if symbol == '+' else field.desc())
+        try:
+            page_size = request.args.get(PAGE_SIZE_PARAM, self.max_groups)
+            page_size = int(page_size)
+            page_number = int(request.args.get(PAGE_NUMBER_PARAM, 1))
+        except ValueError as exception:
+            detail = 'Page size and page number must be integers'
+            return error_response(400, cause=exception, detail=detail)
+        if not 0 < page_size <= self.max_groups:
+            detail = ('Page size must be a positive integer not exceeding'
+                      " the server's maximum: {0}").format(self.max_groups)
+            return error_response(400, detail=detail)
+        if page_number < 1:
+            detail = 'Page number must be a positive integer'
+            return error_response(400, detail=detail)
+        columns = [fields[field_name] for field_name in group_by]
+        query = query.add_columns(*columns).group_by(*columns)
+        query = query.order_by(*order)
+        query = query.limit(page_size + 1)
+        query = query.offset((page_number - 1) * page_size)
+        try:
+            rows = query.all()
+        except OperationalError as exception:
+            return self._unknown_function(exception)
+        has_next = len(rows) > page_size
+        data = [{'group': dict(zip(group_by, row[num_functions:])),
+                 'results': list(row[:num_functions])}
+                for row in rows[:page_size]]
+        prev = page_number - 1 if page_number > 1 else None
+        next_ = page_number + 1 if has_next else None
+        paginated = Paginated(data, first=1, prev=prev, next_=next_,
+                              page_size=page_size)
+        result = {'data': data, 'links': paginated.pagination_links}
+        return jsonpify(result)
+
+    def _histogram(self, query, functions):
+        """Returns the response to a request for a histogram of the
+        results of the functions, as described in :ref:`histograms`.
+
+        `query` is the filtered query whose columns are the specified
+        functions. All the buckets are computed by a single query, and
+        the buckets that contain no rows are filled in afterwards.
+
+        """
+        field_name = request.args.get(HISTOGRAM_FIELD_PARAM)
+        width = request.args.get(HISTOGRAM_WIDTH_PARAM, 'day')
+        if width not in BUCKET_FORMATS:
+            detail = 'Bucket width must be one of {0}'
+            detail = detail.format(', '.join(sorted(BUCKET_FORMATS)))
+            return error_response(400, detail=detail)
+        try:
+            field_type = get_field_type(self.model, field_name)
+        except AttributeError as exception:
+            detail = 'unknown field "{0}"'.format(field_name)
+            return error_response(400, cause=exception, detail=detail)
+        if not isinstance(field_type, (Date, DateTime)):
+            detail = 'Histogram field "{0}" must be a date or a date and time'
+            return error_response(400, detail=detail.format(field_name))
+        field = getattr(self.model, field_name)
+        # Determine the bounds of the histogram, if any. The first bucket
+        # starts at the start of the bucket that contains `start`, and
+        # the last bucket is the one that contains the instant just
+        # before `end`.
+        bounds = []
+        for param in HISTOGRAM_START_PARAM, HISTOGRAM_END_PARAM:
+            value = request.args.get(param)
+            try:
+                bounds.append(to_datetime(value) if value else None)
+            except (ValueError, OverflowError) as exception:
+                detail = 'Unable to parse {0} as a date'.format(param)
+                return error_response(400, cause=exception, detail=detail)
+        start, end = bounds
+        if start is not None:
+            start = truncate(start, width)
+            bound = start if isinstance(field_type, DateTime) else start.date()
+            query = query.filter(field >= bound)
+        if end is not None:
+            bound = end if isinstance(field_type, DateTime) else end.date()
+            query = query.filter(field < bound)
+        bind = self.session.get_bind(mapper=sqlalchemy_inspect(self.model))
+        try:
+            bucket = bucket_expression(bind.dialect, field, width)
+        except UnsupportedDialect as exception:
+            return error_response(501, cause=exception, detail=str(exception))
+        query = query.add_columns(bucket).filter(field.isnot(None))
+        query = query.group_by(bucket).order_by(bucket)
+        # There is no need to fetch more buckets than can be returned.
+        query = query.limit(self.max_buckets + 1)
+        try:
+            rows = query.all()
+        except OperationalError as exception:
+            return self._unknown_function(exception)
+        num_functions = len(functions)
+        results = dict((truncate(to_datetime(row[-1]), width),
+                        list(row[:num_functions]))
+                       for row in rows)
+        if not results and (start is None or end is None):
+            return jsonpify({'data': []})
+        # Fill in the buckets that contain no rows.
+        empty = [0 if str(function['name']).lower() in ZERO_FUNCTIONS
+                 else None for function in functions]
+        current = start if start is not None else min(results)
+        last = max(results) if end is None else None
+        data = []
+        while (current < end) if end is not None else (current <= last):
+            if len(data) == self.max_buckets:
+                detail = ("Number of buckets must not exceed the server's"
+                          ' maximum: {0}').format(self.max_buckets)
+                return error_response(400, detail=detail)
+            data.append({'bucket': current.isoformat(),
+                         'results': results.get(current, empty)})
+            current = next_bucket(current, width)
+        return jsonpify({'data': data})
+
+    def _unknown_function(self, exception):
+        """Returns an error response for the
+        :exc:`~sqlalchemy.exc.OperationalError` raised when evaluating a
+        function that does not exist.
+
+        """
+        # HACK original error message is of the form:
+        #
+        #    '(OperationalError) no such function: bogusfuncname'
+        #
+        original_msg = exception.args[0]
+        bad_function = original_msg[37:]
+        detail = 'unknown function "{0}"'.format(bad_function)
+        return error_response(400, cause=exception, detail=detail)
@@ -51,3 +51,28 @@ def changes_on_update(model):
     """
     return any(column.onupdate is not None
                for column in sqlalchemy_inspect(model).columns)
+
+
+def server_updated_attributes(model):
+    """Returns the list of names of the attributes of the specified
+    SQLAlchemy model class whose values are set by the server when an
+    instance is updated.
+
+    These are the attributes for columns that have the
+    :attr:`sqlalchemy.Column.onupdate` or
+    :attr:`sqlalchemy.Column.server_onupdate` attribute set, and the
+    version counter of the model, if any.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    columns = [column for column in mapper.columns
+               if column.onupdate is not None or
+               column.server_onupdate is not None]
+    if mapper.version_id_col is not None:
+        columns.append(mapper.version_id_col)
+    result = []
+    for column in columns:
+        key = mapper.get_property_by_column(column).key
+        if key not in result:
+            result.append(key)
+    return result
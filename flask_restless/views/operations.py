@@ -0,0 +1,347 @@
+# operations.py - views for atomic operations on many resources
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Views for performing many operations in a single request.
+
+The main class in this module, :class:`OperationsAPI`, is a
+:class:`~flask.MethodView` subclass that accepts a list of operations in
+the format of the `Atomic Operations`_ extension to the JSON API
+specification and performs them in a single database transaction.
+
+.. _Atomic Operations: https://jsonapi.org/ext/atomic/
+
+"""
+from flask import current_app
+from flask import json
+from flask import request
+from flask.views import MethodView
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.exceptions import BadRequest
+from werkzeug.routing import BuildError
+
+from ..helpers import collection_name
+from ..helpers import model_for
+from ..helpers import url_for
+from .base import error
+from .base import error_response
+from .base import errors_response
+from .base import is_conflict
+from .base import jsonpify
+from .base import JSONAPI_MIMETYPE
+from .base import JSONAPI_VERSION
+from .base import OPERATION_ENVIRON_KEY
+from .base import requires_json_api_accept
+from .base import requires_json_api_mimetype
+from .base import un_camel_case
+
+#: The key of the list of operations in a request document.
+OPERATIONS_KEY = 'atomic:operations'
+
+#: The key of the list of results in a response document.
+RESULTS_KEY = 'atomic:results'
+
+#: The HTTP method used to perform each type of operation.
+OPERATION_METHODS = {'add': 'POST', 'update': 'PATCH', 'remove': 'DELETE'}
+
+#: Headers of a request to the operations endpoint that are not copied
+#: to the request for each operation.
+#:
+#: Other headers, for example those used for authentication, are copied
+#: so that they are seen by the ``before_request`` functions and the
+#: preprocessors of each operation.
+EXCLUDED_HEADERS = ('Accept', 'Accept-Encoding', 'Content-Length',
+                    'Content-Type', 'If-Match', 'If-Modified-Since',
+                    'If-None-Match', 'If-Unmodified-Since')
+
+
+class OperationError(Exception):
+    """Raised when an operation in a request to the operations endpoint
+    is malformed.
+
+    `detail` is a string describing the problem and `pointer` is a JSON
+    Pointer to the offending part of the operation, relative to the
+    operation itself. `status` is the status code of the error response.
+
+    """
+
+    def __init__(self, detail, pointer='', status=400):
+        super(OperationError, self).__init__(detail)
+
+        #: The status code of the error response.
+        self.status = status
+
+        #: A description of the problem with the operation.
+        self.detail = detail
+
+        #: A JSON Pointer to the offending part of the operation.
+        self.pointer = pointer
+
+
+class OperationsAPI(MethodView):
+    """Performs a list of operations on the resources exposed by the
+    APIs created by an :class:`~flask_restless.APIManager`.
+
+    `session` is the SQLAlchemy session in which all operations are
+    performed. `models` is the set of models for which an API has been
+    created; operations on resources of any other type are rejected.
+
+    Each operation is dispatched as a request to the endpoint of the
+    corresponding API, so it is subject to the same ``before_request``
+    functions, allowed methods, preprocessors, and postprocessors as if
+    the client had made that request itself. The views flush the session
+    instead of committing it, and the session is committed once after
+    all operations have succeeded. If any operation fails, the session
+    is rolled back and the error response of that operation is returned.
+
+    For more information, see :ref:`operations`.
+
+    """
+
+    #: List of decorators applied to every method of this class.
+    decorators = [requires_json_api_accept, requires_json_api_mimetype]
+
+    def __init__(self, session, models):
+        super(OperationsAPI, self).__init__()
+        self.session = session
+        self.models = models
+
+    def post(self):
+        """Performs the operations given in the request document, in
+        order, and returns their results in the same order.
+
+        """
+        try:
+            document = json.loads(request.get_data()) or {}
+        except (BadRequest, TypeError, ValueError, OverflowError) as exception:
+            detail = 'Unable to decode data'
+            return error_response(400, cause=exception, detail=detail)
+        operations = document.get(OPERATIONS_KEY)
+        if not isinstance(operations, list):
+            detail = 'Must specify a list of operations'
+            source = {'pointer': '/' + OPERATIONS_KEY}
+            return error_response(400, detail=detail, source=source)
+        # Map the pair (type, lid) of each created resource to its ID.
+        local_ids = {}
+        results = []
+        try:
+            for index, operation in enumerate(operations):
+                pointer = '/{0}/{1}'.format(OPERATIONS_KEY, index)
+                try:
+                    method, url, body, lid = \
+                        self._prepare(operation, local_ids)
+                except OperationError as exception:
+                    self.session.rollback()
+                    source = {'pointer': pointer + exception.pointer}
+                    return error_response(exception.status,
+                                          detail=exception.detail,
+                                          source=source)
+                response = self._dispatch(method, url, body)
+                try:
+                    result = json.loads(response.get_data()) or {}
+                except ValueError:
+                    # For example, the HTML body of a 405 response.
+                    result = {}
+                if response.status_code >= 400:
+                    self.session.rollback()
+                    return self._errors_response(response.status_code,
+                                                 result, pointer)
+                if lid is not None:
+                    local_ids[(operation['data']['type'], lid)] = \
+                        result['data']['id']
+                results.append(dict((key, result[key])
+                                    for key in ('data', 'meta')
+                                    if key in result))
+            self.session.commit()
+        except SQLAlchemyError as exception:
+            self.session.rollback()
+            status = 409 if is_conflict(exception) else 400
+            detail = str(exception)
+            title = un_camel_case(exception.__class__.__name__)
+            return error_response(status, cause=exception, detail=detail,
+                                  title=title)
+        except Exception:
+            self.session.rollback()
+            raise
+        document = {RESULTS_KEY: results,
+                    'jsonapi': {'version': JSONAPI_VERSION}}
+        return jsonpify(document), 200
+
+    def _prepare(self, operation, local_ids):
+        """Returns the HTTP method, URL, request document, and local ID
+        of the request that performs the specified operation.
+
+        `local_ids` maps each pair of type and local ID of the resources
+        created by previous operations to the ID of the resource. The
+        returned local ID is the one assigned by the operation to the
+        resource it creates, or ``None``.
+
+        This method raises :exc:`OperationError` if the operation is
+        malformed.
+
+        """
+        if not isinstance(operation, dict):
+            raise OperationError('Operation must be an object')
+        op = operation.get('op')
+        if op not in OPERATION_METHODS:
+            detail = 'Operation must be one of "add", "update", or "remove"'
+            raise OperationError(detail, '/op')
+        method = OPERATION_METHODS[op]
+        data = operation.get('data')
+        ref = operation.get('ref')
+        lid = None
+        if ref is not None:
+            if not isinstance(ref, dict) or 'type' not in ref:
+                raise OperationError('Reference must have a type', '/ref')
+            ref = self._resolve(ref, local_ids, '/ref')
+        if isinstance(data, list):
+            data = [self._resolve(identifier, local_ids,
+                                  '/data/{0}'.format(i))
+                    for i, identifier in enumerate(data)]
+        elif isinstance(data, dict):
+            data = dict(data)
+            # The local ID of a resource being created is a declaration,
+            # not a reference to a resource created earlier.
+            if op == 'add' and ref is None:
+                lid = data.pop('lid', None)
+            else:
+                data = self._resolve(data, local_ids, '/data')
+            relationships = data.get('relationships')
+            if isinstance(relationships, dict):
+                data['relationships'] = \
+                    self._resolve_relationships(relationships, local_ids)
+        href = operation.get('href')
+        if href is not None:
+            url = href
+        elif ref is not None:
+            url = self._url(ref, '/ref', method)
+        elif op == 'add':
+            if not isinstance(data, dict) or 'type' not in data:
+                raise OperationError('Resource must have a type', '/data')
+            url = self._url(data, '/data', method, collection=True)
+        elif isinstance(data, dict) and 'type' in data and 'id' in data:
+            url = self._url(data, '/data', method)
+        else:
+            detail = 'Must specify the target of the operation'
+            raise OperationError(detail, '/ref')
+        # Removing a resource is the only operation without a body.
+        has_relationship = ref is not None and 'relationship' in ref
+        if op == 'remove' and not has_relationship and href is None:
+            body = None
+        else:
+            body = {'data': data}
+        return method, url, body, lid
+
+    def _resolve(self, identifier, local_ids, pointer):
+        """Returns a copy of the specified resource identifier object
+        with its local ID replaced by the ID of the resource created by an
+        earlier operation.
+
+        """
+        if not isinstance(identifier, dict) or 'lid' not in identifier:
+            return identifier
+        key = (identifier.get('type'), identifier['lid'])
+        if key not in local_ids:
+            detail = 'No resource of type {0} with local ID {1}'.format(*key)
+            raise OperationError(detail, pointer + '/lid')
+        identifier = dict(identifier)
+        del identifier['lid']
+        identifier['id'] = local_ids[key]
+        return identifier
+
+    def _resolve_relationships(self, relationships, local_ids):
+        """Returns a copy of the specified relationships object of a
+        resource object with each local ID resolved as in
+        :meth:`_resolve`.
+
+        """
+        result = {}
+        for name, relationship in relationships.items():
+            pointer = '/data/relationships/{0}/data'.format(name)
+            if isinstance(relationship, dict):
+                relationship = dict(relationship)
+                linkage = relationship.get('data')
+                if isinstance(linkage, list):
+                    relationship['data'] = [
+                        self._resolve(identifier, local_ids,
+                                      '{0}/{1}'.format(pointer, i))
+                        for i, identifier in enumerate(linkage)]
+                else:
+                    relationship['data'] = self._resolve(linkage, local_ids,
+                                                         pointer)
+            result[name] = relationship
+        return result
+
+    def _url(self, target, pointer, method, collection=False):
+        """Returns the URL of the collection, resource, or relationship
+        identified by the specified resource identifier or reference
+        object, to which a request with the specified HTTP method will be
+        made.
+
+        """
+        try:
+            model = model_for(target['type'])
+        except ValueError:
+            model = None
+        if model not in self.models:
+            detail = 'Unknown type "{0}"'.format(target['type'])
+            raise OperationError(detail, pointer + '/type')
+        if not collection and 'id' not in target:
+            detail = 'Must specify resource ID'
+            raise OperationError(detail, pointer)
+        kw = {}
+        if not collection:
+            kw['resource_id'] = target['id']
+        if 'relationship' in target:
+            kw.update(relation_name=target['relationship'], relationship=True)
+        # If there is no such URL, the API does not allow the method.
+        try:
+            return url_for(model, _method=method, **kw)
+        except BuildError:
+            detail = 'Method {0} not allowed for {1}'
+            detail = detail.format(method, collection_name(model))
+            raise OperationError(detail, pointer, status=405)
+
+    def _dispatch(self, method, url, body):
+        """Dispatches a request for a single operation and returns the
+        response.
+
+        """
+        headers = [(key, value) for key, value in request.headers
+                   if key not in EXCLUDED_HEADERS]
+        headers.extend([('Content-Type', JSONAPI_MIMETYPE),
+                        ('Accept', JSONAPI_MIMETYPE)])
+        # Make the URL relative to the root of the application.
+        if url.startswith(request.url_root):
+            url = url[len(request.url_root):]
+        elif url.startswith(request.script_root):
+            url = url[len(request.script_root):]
+        data = json.dumps(body) if body is not None else None
+        environ = {OPERATION_ENVIRON_KEY: True}
+        context = current_app.test_request_context(
+            url, base_url=request.url_root, method=method, data=data,
+            headers=headers, environ_overrides=environ)
+        with context:
+            return current_app.full_dispatch_request()
+
+    def _errors_response(self, status, document, pointer):
+        """Returns an error response with the error objects in the
+        specified response document of a failed operation.
+
+        The JSON Pointer in the source of each error object is made
+        relative to the request document of the operations endpoint.
+
+        """
+        errors = []
+        for error_object in document.get('errors') or [error(status=status)]:
+            source = error_object.get('source') or {}
+            source = dict(source, pointer=pointer + source.get('pointer', ''))
+            errors.append(dict(error_object, source=source))
+        return errors_response(status, errors)
@@ -18,11 +18,18 @@ relationships according to the JSON API specification.
 """
 from flask import json
 from flask import request
+from sqlalchemy import and_
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
 from werkzeug.exceptions import BadRequest
 
+from ..helpers import association_columns
 from ..helpers import collection_name
+from ..helpers import get_all_by
 from ..helpers import get_by
 from ..helpers import get_related_model
+from ..helpers import IN_CLAUSE_SIZE
 from ..helpers import is_like_list
 from .base import APIBase
 from .base import error
@@ -49,6 +56,10 @@ class RelationshipAPI(APIBase):
 
     """
 
+    #: The kind of endpoint provided by this view, used to label the
+    #: metrics of its requests.
+    endpoint_kind = 'relationship'
+
     def __init__(self, session, model,
                  allow_delete_from_to_many_relationships=False, *args, **kw):
         super(RelationshipAPI, self).__init__(session, model, *args, **kw)
@@ -64,6 +75,118 @@ class RelationshipAPI(APIBase):
     def use_resource_identifiers(self):
         return True
 
+    def _association_columns(self, instance, relation_name):
+        """Returns the columns of the association table of the
+        relationship named `relation_name` on `instance`, as returned by
+        :func:`~flask_restless.helpers.association_columns`, if the
+        relationship should be modified by writing to that table
+        directly, or ``None`` if it should be modified through the ORM.
+
+        The ORM is always used if the relationship has already been
+        loaded, since then modifying it through the ORM costs nothing.
+
+        """
+        if relation_name in sqlalchemy_inspect(instance).dict:
+            return None
+        return association_columns(self.model, relation_name)
+
+    def _association_condition(self, instance, local, remote, related):
+        """Returns the condition that selects the rows of an association
+        table linking `instance` to each of the instances in `related`.
+
+        `local` and `remote` are as returned by
+        :func:`~flask_restless.helpers.association_columns`.
+
+        """
+        parent = and_(*[column == getattr(instance, key)
+                        for key, column in local])
+        if len(remote) == 1:
+            key, column = remote[0]
+            children = column.in_([getattr(obj, key) for obj in related])
+        else:
+            children = or_(*[and_(*[column == getattr(obj, key)
+                                    for key, column in remote])
+                             for obj in related])
+        return and_(parent, children)
+
+    def _association_changed(self, instance, relation_name, related):
+        """Expires the relationship named `relation_name` on `instance`,
+        and its reverse on each instance in `related`, after rows of its
+        association table were inserted or deleted directly.
+
+        """
+        self.session.expire(instance, [relation_name])
+        prop = sqlalchemy_inspect(self.model).relationships[relation_name]
+        for reverse in prop._reverse_property:
+            for obj in related:
+                if reverse.key in sqlalchemy_inspect(obj).dict:
+                    self.session.expire(obj, [reverse.key])
+        self._record_changes([self.model, prop.mapper.class_])
+
+    def _add_to_association(self, instance, relation_name, related,
+                            columns):
+        """Inserts rows into an association table so that each instance
+        in `related` is in the relationship named `relation_name` on
+        `instance`.
+
+        `columns` is as returned by
+        :func:`~flask_restless.helpers.association_columns`. Instances
+        that are already in the relationship are skipped, which requires
+        one query for every :data:`~flask_restless.helpers.IN_CLAUSE_SIZE`
+        instances, but the relationship itself is never loaded.
+
+        """
+        table, local, remote = columns
+        remote_columns = [column for key, column in remote]
+        existing = set()
+        for start in range(0, len(related), IN_CLAUSE_SIZE):
+            chunk = related[start:start + IN_CLAUSE_SIZE]
+            condition = self._association_condition(instance, local, remote,
+                                                    chunk)
+            query = select(remote_columns).where(condition)
+            existing.update(tuple(row) for row in self.session.execute(query))
+        parent = dict((column.key, getattr(instance, key))
+                      for key, column in local)
+        rows = []
+        for obj in related:
+            values = tuple(getattr(obj, key) for key, column in remote)
+            if values in existing:
+                continue
+            # Remember the new row so that duplicates in the request are
+            # inserted only once.
+            existing.add(values)
+            row = dict(parent)
+            row.update(zip((column.key for column in remote_columns), values))
+            rows.append(row)
+        if rows:
+            self.session.execute(table.insert(), rows)
+            self._association_changed(instance, relation_name, related)
+
+    def _remove_from_association(self, instance, relation_name, related,
+                                 columns):
+        """Deletes the rows of an association table that put each
+        instance in `related` in the relationship named `relation_name` on
+        `instance`, and returns the number of rows deleted.
+
+        `columns` is as returned by
+        :func:`~flask_restless.helpers.association_columns`. This
+        executes one statement for every
+        :data:`~flask_restless.helpers.IN_CLAUSE_SIZE` instances, and the
+        relationship itself is never loaded.
+
+        """
+        table, local, remote = columns
+        num_deleted = 0
+        for start in range(0, len(related), IN_CLAUSE_SIZE):
+            chunk = related[start:start + IN_CLAUSE_SIZE]
+            condition = self._association_condition(instance, local, remote,
+                                                    chunk)
+            result = self.session.execute(table.delete().where(condition))
+            num_deleted += result.rowcount
+        if num_deleted:
+            self._association_changed(instance, relation_name, related)
+        return num_deleted
+
     def get(self, resource_id, relation_name):
         """Fetches a to-one or to-many relationship from a resource.
 
@@ -142,13 +265,13 @@ class RelationshipAPI(APIBase):
             detail = 'No instance with ID {0} in model {1}'
             detail = detail.format(resource_id, self.model)
             return error_response(404, detail=detail)
-        # If no such relation exists, return a 404.
-        if not hasattr(instance, relation_name):
+        # If no such relation exists, return a 404. Check the model
+        # instead of the instance so that the relationship is not loaded.
+        if not hasattr(self.model, relation_name):
             detail = 'Model {0} has no relation named {1}'
             detail = detail.format(self.model, relation_name)
             return error_response(404, detail=detail)
         related_model = get_related_model(self.model, relation_name)
-        related_value = getattr(instance, relation_name)
         # Unwrap the data from the request.
         data = data.pop('data', {})
         for rel in data:
@@ -165,26 +288,39 @@ class RelationshipAPI(APIBase):
                 detail = ('Type must be {0}, not'
                           ' {1}').format(collection_name(related_model), type_)
                 return error_response(409, detail=detail)
-            # Get the new objects to add to the relation.
-            new_value = get_by(self.session, related_model, rel['id'])
-            if new_value is None:
-                detail = ('No resource of type {0} found with ID'
-                          ' {1}').format(type_, rel['id'])
-                return error_response(404, detail=detail)
-            # Don't append a new value if it already exists in the to-many
-            # relationship.
-            if new_value not in related_value:
-                try:
-                    related_value.append(new_value)
-                except self.validation_exceptions as exception:
-                    return self._handle_validation_exception(exception)
+        # Get the new objects to add to the relation.
+        new_values = get_all_by(self.session, related_model,
+                                [rel['id'] for rel in data])
+        if any(value is None for value in new_values):
+            not_found = (rel for rel, value in zip(data, new_values)
+                         if value is None)
+            detail = 'No resource of type {0} found with ID {1}'
+            errors = [error(detail=detail.format(rel['type'], rel['id']))
+                      for rel in not_found]
+            return errors_response(404, errors)
+        columns = self._association_columns(instance, relation_name)
+        if columns is not None:
+            self._add_to_association(instance, relation_name, new_values,
+                                     columns)
+        else:
+            related_value = getattr(instance, relation_name)
+            for new_value in new_values:
+                # Don't append a new value if it already exists in the
+                # to-many relationship.
+                if new_value not in related_value:
+                    try:
+                        related_value.append(new_value)
+                    except self.validation_exceptions as exception:
+                        return self._handle_validation_exception(exception)
         # Flush all changes to database but do not commit the transaction
         # so that postprocessors have the chance to roll it back
         self.session.flush()
         # Perform any necessary postprocessing.
         for postprocessor in self.postprocessors['POST_RELATIONSHIP']:
             postprocessor()
-        self.session.commit()
+        self._defer('POST_RELATIONSHIP', resource_id=resource_id,
+                    relation_name=relation_name)
+        self._commit()
         return jsonpify({}), 204
 
     def patch(self, resource_id, relation_name):
@@ -246,7 +382,6 @@ class RelationshipAPI(APIBase):
                 if not self.allow_to_many_replacement:
                     detail = 'Not allowed to replace a to-many relationship'
                     return error_response(403, detail=detail)
-                replacement = []
                 for rel in data:
                     if 'type' not in rel:
                         detail = 'Must specify correct data type'
@@ -262,9 +397,8 @@ class RelationshipAPI(APIBase):
                         detail = detail.format(collection_name(related_model),
                                                type_)
                         return error_response(409, detail=detail)
-                    id_ = rel['id']
-                    obj = get_by(self.session, related_model, id_)
-                    replacement.append(obj)
+                replacement = get_all_by(self.session, related_model,
+                                         [rel['id'] for rel in data])
             # Otherwise, we assume the client is trying to set a to-one
             # relationship.
             else:
@@ -309,7 +443,9 @@ class RelationshipAPI(APIBase):
         # Perform any necessary postprocessing.
         for postprocessor in self.postprocessors['PATCH_RELATIONSHIP']:
             postprocessor()
-        self.session.commit()
+        self._defer('PATCH_RELATIONSHIP', resource_id=resource_id,
+                    relation_name=relation_name)
+        self._commit()
         return jsonpify({}), 204
 
     def delete(self, resource_id, relation_name):
@@ -343,16 +479,13 @@ class RelationshipAPI(APIBase):
         instance = get_by(self.session, self.model, resource_id,
                           self.primary_key)
         # If no such relation exists, return an error to the client.
-        if not hasattr(instance, relation_name):
+        if instance is None or not hasattr(self.model, relation_name):
             detail = 'No such link: {0}'.format(relation_name)
             return error_response(404, detail=detail)
         # We assume that the relation is a to-many relation.
         related_model = get_related_model(self.model, relation_name)
         related_type = collection_name(related_model)
-        relation = getattr(instance, relation_name)
         data = data.pop('data')
-        not_found = []
-        to_remove = []
         for rel in data:
             if 'type' not in rel:
                 detail = 'Must specify correct data type'
@@ -367,32 +500,42 @@ class RelationshipAPI(APIBase):
                           ' linkage object with ID {2}')
                 detail = detail.format(related_type, type_, id_)
                 return error_response(409, detail=detail)
-            resource = get_by(self.session, related_model, id_)
-            if resource is None:
-                not_found.append((type_, id_))
-            else:
-                to_remove.append(resource)
+        to_remove = get_all_by(self.session, related_model,
+                               [rel['id'] for rel in data])
+        not_found = [(rel['type'], rel['id'])
+                     for rel, resource in zip(data, to_remove)
+                     if resource is None]
         if not_found:
             detail = 'No resource of type {0} and ID {1} found'
             errors = [error(detail=detail.format(t, i)) for t, i in not_found]
             return errors_response(404, errors)
-        # Remove each of the resources from the relation (if they are not
-        # already absent).
-        for resource in to_remove:
-            try:
-                relation.remove(resource)
-            except ValueError:
-                # The JSON API specification requires that we silently
-                # ignore requests to delete resources that are already
-                # missing from a to-many relation.
-                pass
-        was_deleted = len(self.session.dirty) > 0
+        columns = self._association_columns(instance, relation_name)
+        if columns is not None:
+            num_deleted = self._remove_from_association(instance,
+                                                        relation_name,
+                                                        to_remove, columns)
+            was_deleted = num_deleted > 0
+        else:
+            relation = getattr(instance, relation_name)
+            # Remove each of the resources from the relation (if they are
+            # not already absent).
+            for resource in to_remove:
+                try:
+                    relation.remove(resource)
+                except ValueError:
+                    # The JSON API specification requires that we silently
+                    # ignore requests to delete resources that are already
+                    # missing from a to-many relation.
+                    pass
+            was_deleted = len(self.session.dirty) > 0
         # Flush all changes to database but do not commit the transaction
         # so that postprocessors have the chance to roll it back
         self.session.flush()
         for postprocessor in self.postprocessors['DELETE_RELATIONSHIP']:
             postprocessor(was_deleted=was_deleted)
-        self.session.commit()
+        self._defer('DELETE_RELATIONSHIP', was_deleted=was_deleted,
+                    resource_id=resource_id, relation_name=relation_name)
+        self._commit()
         if not was_deleted:
             detail = 'There was no instance to delete'
             return error_response(404, detail=detail)
@@ -16,32 +16,50 @@ The main class in this module, :class:`API`, is a
 SQLAlchemy models compatible with the JSON API specification.
 
 """
+from functools import partial
 import sys
 
 from flask import json
 from flask import request
+from sqlalchemy import Integer
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
 from werkzeug.exceptions import BadRequest
 
 from ..helpers import collection_name
+from ..helpers import get_all_by
 from ..helpers import get_by
 from ..helpers import get_model
 from ..helpers import get_related_model
+from ..helpers import get_relations
 from ..helpers import has_field
 from ..helpers import is_like_list
 from ..helpers import is_relationship
+from ..helpers import model_info
+from ..helpers import primary_key_for
 from ..helpers import primary_key_value
+from ..helpers import query_by_primary_key
+from ..helpers import session_query
 from ..helpers import string_to_datetime
+from ..search import create_filters
+from ..search import FilterCreationError
+from ..search import FilterParsingError
 from ..serialization import DeserializationException
 from ..serialization import SerializationException
+from ..serialization import simple_relationship_serialize_many
 from .base import APIBase
 from .base import error
 from .base import error_response
 from .base import errors_from_serialization_exceptions
 from .base import errors_response
+from .base import is_not_modified
+from .base import JSONAPI_VERSION
 from .base import jsonpify
 from .base import MultipleExceptions
+from .base import not_modified_response
 from .base import SingleKeyError
+from .base import version_etag
 from .helpers import changes_on_update
+from .helpers import server_updated_attributes
 
 STRING_TYPES = (str, )
 
@@ -58,12 +76,19 @@ def errors_from_deserialization_exceptions(exceptions, included=False):
     raised by attempts to serialize resources included in a compound
     document; this modifies the error message for the exceptions a bit.
 
+    If an exception has an :attr:`~DeserializationException.index`, the
+    error object points to the corresponding resource object in the
+    primary data of the request document.
+
     """
 
     def _to_error(exception):
         detail = exception.message()
         status = exception.status
-        return error(status=status, detail=detail)
+        source = None
+        if getattr(exception, 'index', None) is not None:
+            source = {'pointer': '/data/{0}'.format(exception.index)}
+        return error(status=status, detail=detail, source=source)
 
     errors = list(map(_to_error, exceptions))
     # Workaround: if there is only one error, assign the status code of
@@ -88,15 +113,39 @@ class API(APIBase):
     `page_size`, `max_page_size`, `serializer`, `deserializer`, and
     `includes` are as described in :meth:`APIManager.create_api`.
 
+    `passive_deletes` is as described in :ref:`passivedeletes`.
+
+    `return_changed_attributes` is as described in
+    :ref:`changedattributes`.
+
     """
 
-    def __init__(self, *args, **kw):
-        super(API, self).__init__(*args, **kw)
+    #: The kind of endpoint provided by this view, used to label the
+    #: metrics of its requests.
+    endpoint_kind = 'resource'
+
+    def __init__(self, session, model, passive_deletes=False,
+                 return_changed_attributes=False, *args, **kw):
+        super(API, self).__init__(session, model, *args, **kw)
+
+        #: Whether to delete a single resource with a ``DELETE`` statement
+        #: instead of loading its related instances so that the session
+        #: can cascade the deletion to them.
+        self.passive_deletes = passive_deletes
 
         #: Whether any side-effect changes are made to the SQLAlchemy
         #: model on updates.
         self.changes_on_update = changes_on_update(self.model)
 
+        #: The names of the attributes of the model whose values are set
+        #: by the server when an instance is updated.
+        self.server_updated_attributes = server_updated_attributes(self.model)
+
+        #: Whether the response to a request to update a resource contains
+        #: only the attributes set by the client or by the server, instead
+        #: of the entire resource.
+        self.return_changed_attributes = return_changed_attributes
+
     def collection_processor_type(self, is_relation=False, **kw):
         """The suffix for the pre- and postprocessor identifiers for
         requests on collections of resources.
@@ -317,6 +366,23 @@ class API(APIBase):
             # instid.
             if temp_result is not None:
                 resource_id = temp_result
+        fetch = partial(self._fetch_resource, resource_id)
+        return self._cached_response(fetch, resource_id)
+
+    def _fetch_resource(self, resource_id):
+        """Returns a response containing the resource with the specified
+        ID, after the preprocessors have been applied.
+
+        """
+        # If the client already has the current version of the resource,
+        # as determined by fetching only its version, there is no need
+        # to fetch the resource itself.
+        validators = None
+        if self.validator_query:
+            validators = self._resource_validators(resource_id)
+            if validators is not None and is_not_modified(*validators):
+                return not_modified_response(validators[0], True,
+                                             validators[1])
         # Get the resource with the specified ID.
         resource = get_by(self.session, self.model, resource_id,
                           self.primary_key)
@@ -333,7 +399,7 @@ class API(APIBase):
             detail = 'no resource of type {0} with ID {1}'
             detail = detail.format(collection_name(self.model), resource_id)
             return error_response(404, detail=detail)
-        return self._get_resource_helper(resource)
+        return self._get_resource_helper(resource, validators=validators)
 
     def _get_collection(self):
         """Returns a response containing a collection of resources of the type
@@ -367,9 +433,11 @@ class API(APIBase):
             preprocessor(filters=filters, sort=sort, group_by=group_by,
                          single=single)
 
-        return self._get_collection_helper(filters=filters, sort=sort,
-                                           group_by=group_by, single=single,
-                                           ignorecase=ignorecase)
+        fetch = partial(self._get_collection_helper, filters=filters,
+                        sort=sort, group_by=group_by, single=single,
+                        ignorecase=ignorecase)
+        return self._cached_response(fetch, filters, sort, group_by, single,
+                                     ignorecase)
 
     def get(self, resource_id, relation_name, related_resource_id):
         """Returns the JSON document representing a resource or a collection of
@@ -413,6 +481,9 @@ class API(APIBase):
         format specified by the JSON API specification.
 
         """
+        # This is only possible if deleting many resources was enabled.
+        if resource_id is None:
+            return self._delete_many()
         for preprocessor in self.preprocessors['DELETE_RESOURCE']:
             temp_result = preprocessor(resource_id=resource_id)
             # See the note under the preprocessor in the get() method.
@@ -435,14 +506,41 @@ class API(APIBase):
             detail = 'No resource found with type {0} and ID {1}'
             detail = detail.format(collection_name(self.model), resource_id)
             return error_response(404, detail=detail)
-        self.session.delete(instance)
-        was_deleted = len(self.session.deleted) > 0
+        result = self._check_precondition(instance, resource_id,
+                                          self.passive_deletes)
+        if result is not None:
+            return result
+        if self.passive_deletes:
+            # Delete the row directly, relying on the database to delete
+            # or update the rows that refer to it, instead of loading the
+            # related instances so that the session can cascade the
+            # deletion to them.
+            query = query_by_primary_key(self.session, self.model,
+                                         resource_id, self.primary_key)
+            # The statement deletes the row only if it still has the
+            # version given in the If-Match header.
+            conditional = self.optimistic_concurrency and request.if_match
+            if conditional:
+                column = getattr(self.model, self.version_column)
+                version = getattr(instance, self.version_column)
+                query = query.filter(column == version)
+            was_deleted = query.delete(synchronize_session=False) > 0
+            if conditional and not was_deleted:
+                self.session.rollback()
+                return self._precondition_failed(resource_id)
+            self.session.expunge(instance)
+            self._bulk_changed(self._cascaded_models())
+        else:
+            self.session.delete(instance)
+            was_deleted = len(self.session.deleted) > 0
         # Flush all changes to database but do not commit the transaction
         # so that postprocessors have the chance to roll it back
         self.session.flush()
         for postprocessor in self.postprocessors['DELETE_RESOURCE']:
             postprocessor(was_deleted=was_deleted)
-        self.session.commit()
+        self._defer('DELETE_RESOURCE', was_deleted=was_deleted,
+                    resource_id=resource_id)
+        self._commit()
         if not was_deleted:
             detail = 'There was no instance to delete.'
             return error_response(404, detail=detail)
@@ -464,6 +562,8 @@ class API(APIBase):
         # apply any preprocessors to the POST arguments
         for preprocessor in self.preprocessors['POST_RESOURCE']:
             preprocessor(data=document)
+        if self.allow_bulk_creation and isinstance(document.get('data'), list):
+            return self._post_many(document)
         # Convert the dictionary representation into an instance of the
         # model.
         try:
@@ -495,6 +595,8 @@ class API(APIBase):
         url = '{0}/{1}'.format(request.base_url, primary_key)
         # Provide that URL in the Location header in the response.
         headers = dict(Location=url)
+        if self.optimistic_concurrency:
+            headers.update(self._version_headers(instance))
         # Include any requested resources in a compound document.
         try:
             included = self.get_all_inclusions(instance)
@@ -510,7 +612,63 @@ class API(APIBase):
         status = 201
         for postprocessor in self.postprocessors['POST_RESOURCE']:
             postprocessor(result=result)
-        self.session.commit()
+        self._defer('POST_RESOURCE', result=result)
+        self._commit()
+        return jsonpify(result), status, headers
+
+    def _post_many(self, document):
+        """Creates new resources from a request document whose primary
+        data is a list of resource objects.
+
+        The resources are created with a single flush, and the
+        postprocessors are applied once to the response document, whose
+        primary data is the list of created resources. If the request
+        has a :http:header:`Prefer` header containing ``return=minimal``,
+        the primary data is the list of resource identifier objects
+        instead.
+
+        If any resource object cannot be deserialized, no resources are
+        created and the errors are returned, each pointing to the index
+        of the problematic resource object.
+
+        """
+        try:
+            instances = self.deserializer.deserialize_many(document)
+            self.session.add_all(instances)
+            # Flush all changes to database but do not commit the transaction
+            # so that postprocessors have the chance to roll it back
+            self.session.flush()
+        except DeserializationException as exception:
+            return errors_from_deserialization_exceptions([exception])
+        except MultipleExceptions as e:
+            return errors_from_deserialization_exceptions(e.exceptions)
+        except self.validation_exceptions as exception:
+            return self._handle_validation_exception(exception)
+        headers = {}
+        if 'return=minimal' in request.headers.get('Prefer', ''):
+            result = simple_relationship_serialize_many(instances)
+            headers['Preference-Applied'] = 'return=minimal'
+        else:
+            only = self.sparse_fields
+            try:
+                result = self.serializer.serialize_many(instances, only=only)
+            except MultipleExceptions as e:
+                return errors_from_serialization_exceptions(e.exceptions)
+            except SerializationException as exception:
+                return errors_from_serialization_exceptions([exception])
+            # Include any requested resources in a compound document.
+            try:
+                included = self.get_all_inclusions(instances)
+            except MultipleExceptions as e:
+                return errors_from_serialization_exceptions(e.exceptions,
+                                                            included=True)
+            if included:
+                result.setdefault('included', []).extend(included)
+        status = 201
+        for postprocessor in self.postprocessors['POST_RESOURCE']:
+            postprocessor(result=result)
+        self._defer('POST_RESOURCE', result=result)
+        self._commit()
         return jsonpify(result), status, headers
 
     def _update_instance(self, instance, data, resource_id):
@@ -565,9 +723,6 @@ class API(APIBase):
                     detail = detail.format(linkname, self.collection_name,
                                            resource_id)
                     return error_response(400, detail=detail)
-                # If this is left empty, the relationship will be zeroed.
-                newvalue = []
-                not_found = []
                 for rel in linkage:
                     expected_type = collection_name(related_model)
                     type_ = rel['type']
@@ -575,12 +730,12 @@ class API(APIBase):
                         detail = 'Type must be {0}, not {1}'
                         detail = detail.format(expected_type, type_)
                         return error_response(409, detail=detail)
-                    id_ = rel['id']
-                    inst = get_by(self.session, related_model, id_)
-                    if inst is None:
-                        not_found.append((id_, type_))
-                    else:
-                        newvalue.append(inst)
+                # If this is left empty, the relationship will be zeroed.
+                newvalue = get_all_by(self.session, related_model,
+                                      [rel['id'] for rel in linkage])
+                not_found = [(rel['type'], rel['id'])
+                             for rel, inst in zip(linkage, newvalue)
+                             if inst is None]
                 # If any of the requested to-many linkage objects do not exist,
                 # return an error response.
                 if not_found:
@@ -644,6 +799,271 @@ class API(APIBase):
         except self.validation_exceptions as exception:
             return self._handle_validation_exception(exception)
 
+    def _changed_fields(self, instance, fields):
+        """Returns the list of fields of the specified instance to
+        include in the response to a request that updated it.
+
+        `fields` is the list of names of the attributes and relationships
+        set by the client. The returned list also contains the attributes
+        set by the server, the relationships named in the ``include``
+        query parameter, and the primary key and link of the resource.
+
+        The attributes set by the server that were not already fetched
+        when the session was flushed (for example, by a ``RETURNING``
+        clause when the mapper is configured with ``eager_defaults``) are
+        fetched by a single query that does not load any relationships.
+
+        """
+        state = sqlalchemy_inspect(instance)
+        expired = [key for key in self.server_updated_attributes
+                   if key in state.expired_attributes]
+        if expired:
+            self.session.refresh(instance, attribute_names=expired)
+        only = fields + self.server_updated_attributes
+        toinclude = request.args.get('include')
+        if toinclude is not None:
+            only.extend(path.split('.')[0] for path in toinclude.split(','))
+        only.extend(['self', primary_key_for(instance)])
+        return only
+
+    def _precondition_failed(self, resource_id):
+        """Returns an error response with :http:statuscode:`412` stating
+        that the resource with the specified ID does not have the version
+        given in the :http:header:`If-Match` header of the request.
+
+        """
+        detail = ('Resource of type {0} with ID {1} does not have the version'
+                  ' given in the If-Match header')
+        detail = detail.format(self.collection_name, resource_id)
+        return error_response(412, detail=detail)
+
+    def _check_precondition(self, instance, resource_id, in_statement=False):
+        """Returns an error response with :http:statuscode:`412` if the
+        :http:header:`If-Match` header of the request does not match the
+        version of the specified instance, or ``None`` otherwise.
+
+        `resource_id` is the ID of the instance as given in the URL.
+
+        If the version is stored in the version counter of the model,
+        SQLAlchemy makes the ``UPDATE`` or ``DELETE`` statement for the
+        instance conditional on the version. If `in_statement` is
+        ``True``, the caller executes the statement for the instance
+        itself and must make it conditional on the version. Otherwise,
+        this method executes a conditional ``UPDATE`` statement that does
+        not change the row but fails if the version has changed since the
+        instance was loaded; this locks the row until the transaction
+        ends.
+
+        """
+        if not self.optimistic_concurrency or not request.if_match:
+            return None
+        version = getattr(instance, self.version_column)
+        if not request.if_match.contains(version_etag(version)):
+            return self._precondition_failed(resource_id)
+        version_id_key = model_info(self.model).version_id_key
+        if not in_statement and self.version_column != version_id_key:
+            column = getattr(self.model, self.version_column)
+            query = query_by_primary_key(self.session, self.model,
+                                         resource_id, self.primary_key)
+            query = query.filter(column == version)
+            if query.update({column: column}, synchronize_session=False) < 1:
+                return self._precondition_failed(resource_id)
+        return None
+
+    def _check_bulk_rows(self, num_affected):
+        """Rolls back the session and returns an error response if a
+        statement affected more rows than a single request may update or
+        delete, as given by :attr:`max_bulk_rows`, or returns ``None``
+        otherwise.
+
+        `num_affected` is the number of rows affected by the statement.
+        Checking it after the statement has been executed, instead of
+        counting the matching rows beforehand, ensures that rows inserted
+        concurrently cannot push the statement over the limit.
+
+        """
+        if self.max_bulk_rows is None or num_affected <= self.max_bulk_rows:
+            return None
+        self.session.rollback()
+        detail = ('Request would affect {0} resources, but at most {1} are'
+                  ' allowed')
+        detail = detail.format(num_affected, self.max_bulk_rows)
+        return error_response(400, detail=detail)
+
+    def _version_increment(self):
+        """Returns a dictionary mapping the name of the version counter of
+        the model to the new value it should have after an ``UPDATE``
+        statement on many rows, or an empty dictionary if the model has
+        no version counter or if the database generates its values.
+
+        SQLAlchemy only increments the version counter of instances that
+        it flushes itself, so a statement executed without the unit of
+        work of the session must do it explicitly. An integer version is
+        incremented in SQL; otherwise, the version generator of the
+        mapper is called once for all rows.
+
+        """
+        mapper = sqlalchemy_inspect(self.model)
+        version_id_key = model_info(self.model).version_id_key
+        if version_id_key is None or mapper.version_id_generator is False:
+            return {}
+        column = getattr(self.model, version_id_key)
+        if isinstance(mapper.version_id_col.type, Integer):
+            return {version_id_key: column + 1}
+        return {version_id_key: mapper.version_id_generator(None)}
+
+    def _bulk_changed(self, models):
+        """Marks the specified models as changed by a statement executed
+        without the unit of work of the session, such as an ``UPDATE`` or
+        ``DELETE`` statement on many rows.
+
+        The instances of these models already loaded in the session are
+        expired, since they may no longer reflect the database, and what
+        depends on them is discarded from the caches when the session
+        commits.
+
+        """
+        models = tuple(models)
+        for instance in list(self.session.identity_map.values()):
+            if isinstance(instance, models):
+                self.session.expire(instance)
+        self._record_changes(models)
+
+    def _cascaded_models(self):
+        """Returns the list containing the model of this API and each
+        model related to it, whose rows the database may delete or modify
+        when a row of the model of this API is deleted.
+
+        """
+        models = [self.model]
+        for relation_name in get_relations(self.model):
+            related_model = get_related_model(self.model, relation_name)
+            if related_model not in models:
+                models.append(related_model)
+        return models
+
+    def _delete_many(self):
+        """Deletes each resource in the collection that matches the
+        filters given in the query parameters of the request, using a
+        single ``DELETE`` statement.
+
+        For example, a request like::
+
+            DELETE /people?filter[objects]=[...]
+
+        deletes each person that matches the filters. The response
+        document contains the number of deleted resources as ``total``
+        in its metadata. For more information, see :ref:`deletemany`.
+
+        """
+        try:
+            filters, sort, group_by, single, ignorecase = \
+                self.collection_parameters()
+        except (TypeError, ValueError, OverflowError) as exception:
+            detail = 'Unable to decode filter objects as JSON list'
+            return error_response(400, cause=exception, detail=detail)
+        except SingleKeyError as exception:
+            detail = 'Invalid format for filter[single] query parameter'
+            return error_response(400, cause=exception, detail=detail)
+        for preprocessor in self.preprocessors['DELETE_COLLECTION']:
+            preprocessor(filters=filters)
+        query = session_query(self.session, self.model)
+        try:
+            query = query.filter(*create_filters(self.model, filters))
+        except (FilterParsingError, FilterCreationError) as exception:
+            detail = 'invalid filter object: {0}'.format(str(exception))
+            return error_response(400, cause=exception, detail=detail)
+        num_deleted = query.delete(synchronize_session=False)
+        result = self._check_bulk_rows(num_deleted)
+        if result is not None:
+            return result
+        self._bulk_changed(self._cascaded_models())
+        result = {'meta': {'total': num_deleted},
+                  'jsonapi': {'version': JSONAPI_VERSION}}
+        for postprocessor in self.postprocessors['DELETE_COLLECTION']:
+            postprocessor(result=result, filters=filters)
+        self._defer('DELETE_COLLECTION', result=result, filters=filters)
+        self._commit()
+        return jsonpify(result), 200
+
+    def _patch_many(self, data):
+        """Updates each resource in the collection that matches the
+        filters given in the query parameters of the request according
+        to the request data, using a single ``UPDATE`` statement.
+
+        For example, a request like::
+
+            PATCH /people?filter[objects]=[...]
+
+        sets the attributes given in the request document on each person
+        that matches the filters.
+
+        The primary data of the request document is a resource object
+        without an ID, and it may only specify attributes. The response
+        document contains the number of updated resources as ``total``
+        in its metadata. For more information, see :ref:`patchmany`.
+
+        """
+        try:
+            filters, sort, group_by, single, ignorecase = \
+                self.collection_parameters()
+        except (TypeError, ValueError, OverflowError) as exception:
+            detail = 'Unable to decode filter objects as JSON list'
+            return error_response(400, cause=exception, detail=detail)
+        except SingleKeyError as exception:
+            detail = 'Invalid format for filter[single] query parameter'
+            return error_response(400, cause=exception, detail=detail)
+        for preprocessor in self.preprocessors['PATCH_COLLECTION']:
+            preprocessor(filters=filters, data=data)
+        data = data.pop('data', {})
+        if not isinstance(data, dict):
+            detail = 'Primary data must be a single resource object'
+            return error_response(400, detail=detail)
+        if 'type' not in data:
+            detail = 'Missing "type" element'
+            return error_response(400, detail=detail)
+        if data['type'] != self.collection_name:
+            detail = 'expected type {0}, not {1}'
+            detail = detail.format(self.collection_name, data['type'])
+            return error_response(409, detail=detail)
+        if 'relationships' in data:
+            detail = 'Cannot update relationships of many resources at once'
+            return error_response(400, detail=detail)
+        attributes = data.get('attributes', {})
+        # Only attributes backed by a column can be set by the ``UPDATE``
+        # statement.
+        columns = sqlalchemy_inspect(self.model).column_attrs
+        for field in attributes:
+            if not has_field(self.model, field) or field not in columns:
+                detail = "Model does not have field '{0}'".format(field)
+                return error_response(400, detail=detail)
+        values = dict((k, string_to_datetime(self.model, k, v))
+                      for k, v in attributes.items())
+        query = session_query(self.session, self.model)
+        try:
+            query = query.filter(*create_filters(self.model, filters))
+        except (FilterParsingError, FilterCreationError) as exception:
+            detail = 'invalid filter object: {0}'.format(str(exception))
+            return error_response(400, cause=exception, detail=detail)
+        num_modified = 0
+        if values:
+            values.update(self._version_increment())
+            try:
+                num_modified = query.update(values, synchronize_session=False)
+            except self.validation_exceptions as exception:
+                return self._handle_validation_exception(exception)
+            result = self._check_bulk_rows(num_modified)
+            if result is not None:
+                return result
+            self._bulk_changed([self.model])
+        result = {'meta': {'total': num_modified},
+                  'jsonapi': {'version': JSONAPI_VERSION}}
+        for postprocessor in self.postprocessors['PATCH_COLLECTION']:
+            postprocessor(result=result, filters=filters)
+        self._defer('PATCH_COLLECTION', result=result, filters=filters)
+        self._commit()
+        return jsonpify(result), 200
+
     def patch(self, resource_id):
         """Updates the resource with the specified ID according to the request
         data.
@@ -659,6 +1079,9 @@ class API(APIBase):
             # this also happens when request.data is empty
             detail = 'Unable to decode data'
             return error_response(400, cause=exception, detail=detail)
+        # This is only possible if updating many resources was enabled.
+        if resource_id is None:
+            return self._patch_many(data)
         for preprocessor in self.preprocessors['PATCH_RESOURCE']:
             temp_result = preprocessor(resource_id=resource_id, data=data)
             # See the note under the preprocessor in the get() method.
@@ -707,6 +1130,13 @@ class API(APIBase):
         if id_ != resource_id:
             message = 'ID must be {0}, not {1}'.format(resource_id, id_)
             return error_response(409, detail=message)
+        result = self._check_precondition(instance, resource_id)
+        if result is not None:
+            return result
+        # Remember which fields the client has set, since updating the
+        # instance consumes the resource object.
+        fields = list(data.get('attributes') or ())
+        fields.extend(data.get('relationships') or ())
         result = self._update_instance(instance, data, resource_id)
         # If result is not None, that means there was an error updating the
         # resource.
@@ -717,6 +1147,8 @@ class API(APIBase):
         # representation of the modified resource.
         if self.changes_on_update:
             only = self.sparse_fields.get(self.collection_name)
+            if only is None and self.return_changed_attributes:
+                only = self._changed_fields(instance, fields)
             try:
                 result = self.serializer.serialize(instance, only=only)
             except SerializationException as exception:
@@ -725,8 +1157,13 @@ class API(APIBase):
         else:
             result = dict()
             status = 204
+        headers = {}
+        if self.optimistic_concurrency:
+            headers = self._version_headers(instance)
         # Perform any necessary postprocessing.
         for postprocessor in self.postprocessors['PATCH_RESOURCE']:
             postprocessor(result=result)
-        self.session.commit()
-        return jsonpify(result), status
+        self._defer('PATCH_RESOURCE', result=result,
+                    resource_id=resource_id)
+        self._commit()
+        return jsonpify(result), status, headers
@@ -0,0 +1,174 @@
+# workers.py - background execution of deferred postprocessors
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Background execution of postprocessors after a transaction commits.
+
+The main class in this module, :class:`WorkerPool`, runs the deferred
+postprocessors of a request on a bounded pool of worker threads once
+the session in which the request made its changes has committed them.
+For more information, see :ref:`deferred`.
+
+"""
+import threading
+import time
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+from flask import current_app
+from sqlalchemy import event
+
+#: The default number of worker threads of a :class:`WorkerPool`.
+DEFAULT_NUM_WORKERS = 4
+
+#: The default maximum number of deferred calls waiting to be executed
+#: by a :class:`WorkerPool`.
+DEFAULT_MAX_QUEUE_SIZE = 1000
+
+
+class WorkerPool(object):
+    """Executes deferred postprocessors on a bounded pool of worker
+    threads after the transaction of the request that deferred them
+    commits.
+
+    `num_workers` is the number of worker threads, which are started
+    when the first call is submitted. `max_queue_size` is the maximum
+    number of calls waiting to be executed; when the queue is full,
+    submitting another call blocks until a worker takes one from the
+    queue.
+
+    A call that raises an exception is retried up to `max_retries`
+    times, waiting `retry_delay` seconds before the first retry and
+    twice as long before each subsequent one. Each failure is logged on
+    the application that made the request, and the call is abandoned
+    after the last retry. Calls are executed in an application context,
+    so they may use :data:`flask.current_app`, but not in a request
+    context.
+
+    """
+
+    def __init__(self, num_workers=DEFAULT_NUM_WORKERS,
+                 max_queue_size=DEFAULT_MAX_QUEUE_SIZE, max_retries=3,
+                 retry_delay=0.1):
+        #: The number of worker threads.
+        self.num_workers = num_workers
+
+        #: The maximum number of times a failed call is retried.
+        self.max_retries = max_retries
+
+        #: The number of seconds to wait before retrying a failed call
+        #: for the first time.
+        self.retry_delay = retry_delay
+
+        #: The number of calls that have completed successfully.
+        self.completed = 0
+
+        #: The number of calls that have been abandoned after failing.
+        self.failed = 0
+
+        self._queue = Queue(max_queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def watch(self, session):
+        """Submits the calls deferred in `session` when it commits, and
+        discards them when its transaction ends in any other way, for
+        example when it rolls back or is closed.
+
+        `session` may be a :class:`~sqlalchemy.orm.session.Session` or a
+        :class:`~sqlalchemy.orm.scoping.scoped_session`. Calling this
+        method more than once with the same session has no effect.
+
+        """
+        if event.contains(session, 'after_commit', self._submit_deferred):
+            return
+        event.listen(session, 'after_commit', self._submit_deferred)
+        event.listen(session, 'after_transaction_end',
+                     self._discard_deferred)
+
+    def defer(self, session, functions, kw):
+        """Defers calling each of `functions` with the keyword arguments
+        `kw` until `session` commits.
+
+        This must be called within an application context, and
+        :meth:`watch` must have been called with `session`.
+
+        """
+        app = current_app._get_current_object()
+        calls = session.info.setdefault(self, [])
+        calls.extend((app, function, kw) for function in functions)
+
+    def submit(self, app, function, kw):
+        """Submits a call of `function` with the keyword arguments `kw`
+        in an application context of `app` to be executed by a worker.
+
+        """
+        self._start()
+        self._queue.put((app, function, kw))
+
+    def join(self):
+        """Blocks until all submitted calls have been executed."""
+        self._queue.join()
+
+    def _submit_deferred(self, session):
+        for call in session.info.pop(self, ()):
+            self.submit(*call)
+
+    def _discard_deferred(self, session, transaction):
+        # After a commit, the calls have already been submitted.
+        if transaction.parent is None:
+            session.info.pop(self, None)
+
+    def _start(self):
+        """Starts the worker threads, unless they are already running."""
+        if len(self._threads) >= self.num_workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.num_workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            app, function, kw = self._queue.get()
+            try:
+                self._call(app, function, kw)
+            finally:
+                self._queue.task_done()
+
+    def _call(self, app, function, kw):
+        """Calls `function`, retrying it as described in the
+        documentation for this class.
+
+        """
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                with app.app_context():
+                    function(**kw)
+            except Exception:
+                app.logger.exception('Deferred postprocessor {0} failed'
+                                     ' (attempt {1} of {2})'
+                                     .format(function, attempt + 1,
+                                             self.max_retries + 1))
+                if attempt < self.max_retries:
+                    time.sleep(delay)
+                    delay *= 2
+            else:
+                with self._lock:
+                    self.completed += 1
+                return
+        with self._lock:
+            self.failed += 1
@@ -0,0 +1,130 @@
+# benchmark-introspection.py - measures the cost of model introspection
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Measures the CPU time spent serving requests with and without the
+cache of introspected model information in :mod:`flask_restless.helpers`.
+
+Run this script from the root of the repository::
+
+    python scripts/benchmark-introspection.py
+
+It prints the mean CPU time per request for fetching a collection of
+resources (each of which has several relationships) with the cache
+enabled and disabled. When the cache is disabled, the information about
+a model is introspected again on each call to a helper function, so the
+"uncached" figure is an upper bound on the cost of introspection without
+the cache.
+
+"""
+import time
+
+from flask import Flask
+from sqlalchemy import Column
+from sqlalchemy import create_engine
+from sqlalchemy import ForeignKey
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import sessionmaker
+
+from flask_restless import APIManager
+from flask_restless import helpers
+
+#: The number of resources in the fetched collection.
+NUM_RESOURCES = 100
+
+#: The number of requests made for each measurement.
+NUM_REQUESTS = 50
+
+
+class NoCache(dict):
+    """A dictionary that never stores anything, used to disable the cache
+    of :class:`~flask_restless.helpers.ModelInfo` objects.
+
+    """
+
+    def __setitem__(self, key, value):
+        pass
+
+
+def create_app():
+    engine = create_engine('sqlite://')
+    session = scoped_session(sessionmaker(bind=engine))
+    Base = declarative_base()
+
+    class Person(Base):
+        __tablename__ = 'person'
+        id = Column(Integer, primary_key=True)
+        name = Column(Unicode)
+
+    class Article(Base):
+        __tablename__ = 'article'
+        id = Column(Integer, primary_key=True)
+        title = Column(Unicode)
+        author_id = Column(Integer, ForeignKey('person.id'))
+        author = relationship(Person, backref='articles')
+
+    class Comment(Base):
+        __tablename__ = 'comment'
+        id = Column(Integer, primary_key=True)
+        article_id = Column(Integer, ForeignKey('article.id'))
+        article = relationship(Article, backref='comments')
+        author_id = Column(Integer, ForeignKey('person.id'))
+        author = relationship(Person, backref='comments')
+
+    Base.metadata.create_all(bind=engine)
+    for i in range(NUM_RESOURCES):
+        person = Person(name=u'person{0}'.format(i))
+        article = Article(title=u'article{0}'.format(i), author=person)
+        comment = Comment(article=article, author=person)
+        session.add_all([person, article, comment])
+    session.commit()
+
+    app = Flask(__name__)
+    app.config['SERVER_NAME'] = 'localhost:5000'
+    manager = APIManager(app, session=session)
+    for model in (Person, Article, Comment):
+        manager.create_api(model, page_size=NUM_RESOURCES)
+    return app
+
+
+def measure(client):
+    """Returns the mean CPU time in milliseconds of fetching a
+    collection of resources.
+
+    """
+    headers = {'Accept': 'application/vnd.api+json'}
+    # Warm up.
+    client.get('/api/article?include=author,comments', headers=headers)
+    start = time.process_time()
+    for i in range(NUM_REQUESTS):
+        client.get('/api/article?include=author,comments', headers=headers)
+    return (time.process_time() - start) * 1000 / NUM_REQUESTS
+
+
+def main():
+    client = create_app().test_client()
+    cache = helpers._model_info_cache
+    helpers._model_info_cache = NoCache()
+    try:
+        uncached = measure(client)
+    finally:
+        helpers._model_info_cache = cache
+    cached = measure(client)
+    print('uncached: {0:.2f} ms per request'.format(uncached))
+    print('cached:   {0:.2f} ms per request'.format(cached))
+    print('speedup:  {0:.1f}%'.format(100 * (uncached - cached) / uncached))
+
+
+if __name__ == '__main__':
+    main()
@@ -23,6 +23,7 @@ from __future__ import division
 from datetime import datetime
 
 import dateutil
+from flask import current_app
 from sqlalchemy import Column
 from sqlalchemy import Date
 from sqlalchemy import DateTime
@@ -39,6 +40,7 @@ from flask_restless import JSONAPI_MIMETYPE
 from flask_restless import DefaultDeserializer
 from flask_restless import DefaultSerializer
 from flask_restless import ProcessingException
+from flask_restless import WorkerPool
 
 from .helpers import BetterJSONEncoder as JSONEncoder
 from .helpers import check_sole_error
@@ -886,6 +888,156 @@ class TestCreating(ManagerTestBase):
         assert article['attributes']['type'] == u'fluff'
 
 
+class TestBulkCreation(ManagerTestBase):
+    """Tests for creating several resources in a single request."""
+
+    def setUp(self):
+        super(TestBulkCreation, self).setUp()
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            title = Column(Unicode)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship('Person')
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode, unique=True)
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+
+    def test_create_many(self):
+        """Tests that a list of resource objects creates each of the
+        resources in order.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                allow_bulk_creation=True)
+        data = {'data': [{'type': 'person', 'attributes': {'name': u'foo'}},
+                         {'type': 'person', 'attributes': {'name': u'bar'}}]}
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        assert 'Location' not in response.headers
+        document = loads(response.data)
+        people = document['data']
+        assert [p['attributes']['name'] for p in people] == [u'foo', u'bar']
+        assert self.session.query(self.Person).count() == 2
+        person = self.session.query(self.Person).filter_by(name=u'bar').one()
+        assert people[1]['id'] == str(person.id)
+
+    def test_create_many_with_relationships(self):
+        """Tests that resources created in bulk may have relationships
+        and that related resources can be included in the response.
+
+        """
+        self.session.add(self.Person(id=1, name=u'foo'))
+        self.session.commit()
+        self.manager.create_api(self.Person)
+        self.manager.create_api(self.Article, methods=['POST'],
+                                allow_bulk_creation=True)
+        author = {'author': {'data': {'type': 'person', 'id': '1'}}}
+        data = {'data': [{'type': 'article', 'relationships': author},
+                         {'type': 'article', 'relationships': author}]}
+        response = self.app.post('/api/article?include=author',
+                                 data=dumps(data))
+        assert response.status_code == 201
+        document = loads(response.data)
+        assert len(document['data']) == 2
+        assert [p['id'] for p in document['included']] == ['1']
+        articles = self.session.query(self.Article).all()
+        assert [a.author_id for a in articles] == [1, 1]
+
+    def test_minimal(self):
+        """Tests that a client can request only the resource identifiers
+        of the created resources.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                allow_bulk_creation=True)
+        data = {'data': [{'type': 'person', 'attributes': {'name': u'foo'}},
+                         {'type': 'person', 'attributes': {'name': u'bar'}}]}
+        headers = {'Prefer': 'return=minimal'}
+        response = self.app.post('/api/person', data=dumps(data),
+                                 headers=headers)
+        assert response.status_code == 201
+        assert response.headers['Preference-Applied'] == 'return=minimal'
+        document = loads(response.data)
+        ids = [str(p.id) for p in self.session.query(self.Person)]
+        assert document['data'] == [{'type': 'person', 'id': id_}
+                                    for id_ in ids]
+
+    def test_errors_per_index(self):
+        """Tests that errors in resource objects point to the index of
+        the problematic resource object and that no resources are
+        created.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                allow_bulk_creation=True)
+        data = {'data': [{'type': 'person', 'attributes': {'name': u'foo'}},
+                         {'type': 'person', 'attributes': {'bogus': 0}},
+                         {'attributes': {'name': u'bar'}}]}
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 400
+        errors = loads(response.data)['errors']
+        pointers = [error['source']['pointer'] for error in errors]
+        assert pointers == ['/data/1', '/data/2']
+        assert self.session.query(self.Person).count() == 0
+
+    def test_conflict(self):
+        """Tests that a database integrity error in one resource
+        prevents the creation of all of them.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'],
+                                allow_bulk_creation=True)
+        data = {'data': [{'type': 'person', 'attributes': {'name': u'foo'}},
+                         {'type': 'person', 'attributes': {'name': u'foo'}}]}
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 409
+        assert self.session.query(self.Person).count() == 0
+
+    def test_processors(self):
+        """Tests that the preprocessors and postprocessors are applied
+        once for the entire request.
+
+        """
+        calls = []
+
+        def preprocessor(data=None, **kw):
+            calls.append(len(data['data']))
+
+        def postprocessor(result=None, **kw):
+            calls.append(len(result['data']))
+
+        self.manager.create_api(self.Person, methods=['POST'],
+                                allow_bulk_creation=True,
+                                preprocessors=dict(POST_RESOURCE=[
+                                    preprocessor]),
+                                postprocessors=dict(POST_RESOURCE=[
+                                    postprocessor]))
+        data = {'data': [{'type': 'person', 'attributes': {'name': u'foo'}},
+                         {'type': 'person', 'attributes': {'name': u'bar'}}]}
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        assert calls == [2, 2]
+
+    def test_disabled_by_default(self):
+        """Tests that a list of resource objects is rejected unless bulk
+        creation is enabled.
+
+        """
+        self.manager.create_api(self.Person, methods=['POST'])
+        data = {'data': [{'type': 'person', 'attributes': {'name': u'foo'}}]}
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 400
+        assert self.session.query(self.Person).count() == 0
+
+
 class TestProcessors(ManagerTestBase):
     """Tests for pre- and postprocessors."""
 
@@ -957,6 +1109,85 @@ class TestProcessors(ManagerTestBase):
         person_count = self.session.query(self.Person).count()
         assert person_count == 0
 
+    def test_deferred_postprocessor(self):
+        """Tests that deferred postprocessors are applied in the
+        background after the new resource has been committed, with the
+        universal ones first.
+
+        """
+        calls = []
+
+        def universal(result=None, **kw):
+            calls.append('universal')
+
+        def record(result=None, **kw):
+            # This is executed in an application context.
+            calls.append(current_app.name == self.flaskapp.name)
+            calls.append(result['data']['id'])
+
+        pool = WorkerPool(num_workers=1)
+        deferred = dict(POST_RESOURCE=[universal])
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  deferred_postprocessors=deferred,
+                                  worker_pool=pool)
+        deferred = dict(POST_RESOURCE=[record])
+        self.manager.create_api(self.Person, methods=['POST'],
+                                deferred_postprocessors=deferred)
+        data = dict(data=dict(type='person', attributes=dict(name=u'foo')))
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        pool.join()
+        assert calls == ['universal', True, '1']
+        assert (pool.completed, pool.failed) == (2, 0)
+
+    def test_deferred_postprocessor_not_on_error(self):
+        """Tests that deferred postprocessors are not applied if the
+        session is rolled back.
+
+        """
+        calls = []
+
+        def raise_error(**kw):
+            raise ProcessingException(status=500)
+
+        pool = WorkerPool()
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  worker_pool=pool)
+        postprocessors = dict(POST_RESOURCE=[raise_error])
+        deferred = dict(POST_RESOURCE=[calls.append])
+        self.manager.create_api(self.Person, methods=['POST'],
+                                postprocessors=postprocessors,
+                                deferred_postprocessors=deferred)
+        data = dict(data=dict(type='person'))
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 500
+        self.session.rollback()
+        self.session.commit()
+        pool.join()
+        assert calls == []
+
+    def test_deferred_postprocessor_retry(self):
+        """Tests that a deferred postprocessor that raises an exception
+        is retried, and abandoned after the last retry.
+
+        """
+        attempts = []
+
+        def fail_twice(**kw):
+            attempts.append(1)
+            if len(attempts) <= 2:
+                raise ValueError
+
+        def fail(**kw):
+            raise ValueError
+
+        pool = WorkerPool(num_workers=1, max_retries=2, retry_delay=0)
+        pool.submit(self.flaskapp, fail_twice, {})
+        pool.submit(self.flaskapp, fail, {})
+        pool.join()
+        assert len(attempts) == 3
+        assert (pool.completed, pool.failed) == (1, 1)
+
 
 class TestFlaskSQLAlchemy(FlaskSQLAlchemyTestBase):
     """Tests for creating resources defined as Flask-SQLAlchemy models instead
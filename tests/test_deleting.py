@@ -24,6 +24,8 @@ from sqlalchemy import Column
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
 from sqlalchemy import Unicode
+from sqlalchemy import event
+from sqlalchemy.orm import backref
 from sqlalchemy.orm import relationship
 
 from flask_restless import APIManager
@@ -171,6 +173,170 @@ class TestDeleting(ManagerTestBase):
         # TODO check error message here
 
 
+class TestDeleteMany(ManagerTestBase):
+    """Tests for deleting many resources matching a filter with a single
+    request.
+
+    """
+
+    def setUp(self):
+        super(TestDeleteMany, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            age = Column(Integer)
+
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.session.add_all([Person(id=i, age=i * 10) for i in range(1, 6)])
+        self.session.commit()
+        self.manager.create_api(Person, methods=['DELETE'],
+                                allow_delete_many=True, max_bulk_rows=4)
+
+    def delete_many(self, filters, url='/api/person'):
+        """Returns the response to a request to delete the people
+        matching `filters`.
+
+        """
+        query_string = {'filter[objects]': dumps(filters)}
+        return self.app.delete(url, query_string=query_string)
+
+    def test_delete(self):
+        """Tests that only the resources matching the filters are
+        deleted, and the number of deleted resources is in the metadata.
+
+        """
+        response = self.delete_many([dict(name='age', op='ge', val=30)])
+        assert response.status_code == 200
+        assert loads(response.data)['meta']['total'] == 3
+        people = self.session.query(self.Person).order_by(self.Person.id)
+        assert [p.id for p in people] == [1, 2]
+
+    def test_max_rows(self):
+        """Tests that a request that would delete more resources than
+        allowed is rejected without deleting any of them.
+
+        """
+        response = self.delete_many([])
+        assert response.status_code == 400
+        assert self.session.query(self.Person).count() == 5
+
+    def test_max_rows_concurrent_insert(self):
+        """Tests that the limit applies to the rows actually deleted,
+        including rows inserted after the request began.
+
+        """
+        def insert(conn, cursor, statement, *args):
+            if statement.startswith('DELETE'):
+                cursor.execute('INSERT INTO person (id, age) VALUES (6, 60)')
+
+        engine = self.Base.metadata.bind
+        event.listen(engine, 'before_cursor_execute', insert)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', insert)
+        response = self.delete_many([dict(name='age', op='ge', val=20)])
+        assert response.status_code == 400
+        assert self.session.query(self.Person).count() == 5
+
+    def test_invalid_filter(self):
+        """Tests that an invalid filter yields an error response."""
+        response = self.delete_many([dict(name='bogus', op='eq', val=1)])
+        assert response.status_code == 400
+        assert self.session.query(self.Person).count() == 5
+
+    def test_processors(self):
+        """Tests that the preprocessors and postprocessors are applied
+        once per request.
+
+        """
+        calls = []
+
+        def preprocessor(filters=None, **kw):
+            calls.append('pre')
+            filters.append(dict(name='id', op='eq', val=2))
+
+        def postprocessor(result=None, filters=None, **kw):
+            calls.append('post')
+
+        preprocessors = dict(DELETE_COLLECTION=[preprocessor])
+        postprocessors = dict(DELETE_COLLECTION=[postprocessor])
+        self.manager.create_api(self.Person, methods=['DELETE'],
+                                url_prefix='/api2', allow_delete_many=True,
+                                preprocessors=preprocessors,
+                                postprocessors=postprocessors)
+        response = self.delete_many([], url='/api2/person')
+        assert response.status_code == 200
+        assert loads(response.data)['meta']['total'] == 1
+        assert calls == ['pre', 'post']
+        assert self.session.query(self.Person).get(2) is None
+
+
+class TestPassiveDeletes(ManagerTestBase):
+    """Tests for deleting a resource without loading its related
+    resources.
+
+    """
+
+    def setUp(self):
+        super(TestPassiveDeletes, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id',
+                                                   ondelete='CASCADE'))
+            author = relationship(Person,
+                                  backref=backref('articles',
+                                                  cascade='all'))
+
+        self.Article = Article
+        self.Person = Person
+        engine = self.Base.metadata.bind
+        engine.execute('PRAGMA foreign_keys = ON')
+        self.Base.metadata.create_all()
+        self.session.add(Person(id=1))
+        self.session.add_all([Article(id=i, author_id=1) for i in range(3)])
+        self.session.commit()
+        self.manager.create_api(Person, methods=['DELETE'],
+                                passive_deletes=True)
+        # Record the statements executed from here on.
+        self.statements = []
+
+        def record(conn, cursor, statement, *args):
+            self.statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', record)
+
+    def test_delete(self):
+        """Tests that the database deletes the related rows, and the
+        related instances are not loaded.
+
+        """
+        article = self.session.query(self.Article).get(1)
+        del self.statements[:]
+        response = self.app.delete('/api/person/1')
+        assert response.status_code == 204
+        assert not any('FROM article' in statement
+                       for statement in self.statements)
+        assert self.session.query(self.Person).count() == 0
+        assert self.session.query(self.Article).count() == 0
+        # The related instance already in the session was expired.
+        assert 'author_id' not in vars(article)
+
+    def test_nonexistent_instance(self):
+        """Tests that a request to delete a nonexistent resource yields a
+        :http:status:`404` response.
+
+        """
+        response = self.app.delete('/api/person/2')
+        assert response.status_code == 404
+
+
 class TestProcessors(ManagerTestBase):
     """Tests for pre- and postprocessors."""
 
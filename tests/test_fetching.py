@@ -18,8 +18,12 @@ Flask-Restless meets the minimum requirements of the JSON API
 specification.
 
 """
+from datetime import datetime
 from itertools import product
 from operator import itemgetter
+from shutil import rmtree
+from tempfile import mkdtemp
+import zlib
 from unittest2 import skip
 # In Python 3...
 try:
@@ -29,6 +33,8 @@ except ImportError:
     from urlparse import unquote
 
 from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import event
 from sqlalchemy import ForeignKey
 from sqlalchemy import func
 from sqlalchemy import Integer
@@ -41,7 +47,11 @@ from sqlalchemy.orm import relationship
 
 from flask_restless import APIManager
 from flask_restless import DefaultSerializer
+from flask_restless import FileSystemStore
+from flask_restless import IllegalArgumentError
 from flask_restless import ProcessingException
+from flask_restless import ResponseCache
+from flask_restless.views import compress_response
 
 from .helpers import check_sole_error
 from .helpers import dumps
@@ -1550,6 +1560,30 @@ class TestProcessors(ManagerTestBase):
         people = document['data']
         assert ['1'] == sorted(person['id'] for person in people)
 
+    def test_modified_filters_not_shared(self):
+        """Tests that modifications made by a preprocessor to the filter
+        objects and sort fields of one request do not affect a later
+        request with the same query string.
+
+        """
+        client_filters = [dict(name='id', op='in', val=[1, 3])]
+        seen = []
+
+        def modify(filters=None, sort=None, **kw):
+            seen.append((dumps(filters), list(sort)))
+            filters[0]['val'].append(2)
+            filters.append(dict(name='id', op='lt', val=2))
+            sort.append(('-', 'id'))
+
+        preprocessors = dict(GET_COLLECTION=[modify])
+        self.manager.create_api(self.Person, preprocessors=preprocessors)
+        query = {'filter[objects]': dumps(client_filters), 'sort': 'id'}
+        for i in range(2):
+            response = self.app.get('/api/person', query_string=query)
+            assert response.status_code == 200
+        expected = (dumps(client_filters), [('+', 'id')])
+        assert seen == [expected, expected]
+
     def test_collection_postprocessor(self):
         """Tests that a postprocessor for a collection endpoint has access to
         the filters specified by the client.
@@ -1671,6 +1705,651 @@ class TestDynamicRelationships(ManagerTestBase):
         assert all(article['type'] == 'article' for article in articles)
 
 
+class TestConditionalRequests(ManagerTestBase):
+    """Tests for entity tags, last modification times, and
+    :http:statuscode:`304` responses to conditional :http:method:`get`
+    requests.
+
+    """
+
+    def setUp(self):
+        super(TestConditionalRequests, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+            updated_at = Column(DateTime)
+            version = Column(Integer, nullable=False)
+            __mapper_args__ = {'version_id_col': version}
+
+        class CountingSerializer(DefaultSerializer):
+
+            def serialize(self, instance, *args, **kw):
+                counter.append(instance)
+                return super(CountingSerializer, self).serialize(instance,
+                                                                 *args, **kw)
+
+        counter = []
+        self.counter = counter
+        self.CountingSerializer = CountingSerializer
+        self.Person = Person
+        self.Base.metadata.create_all()
+        person1 = Person(id=1, name=u'foo',
+                         updated_at=datetime(2016, 1, 1, 12, 0, 0))
+        person2 = Person(id=2, name=u'bar',
+                         updated_at=datetime(2016, 1, 2, 12, 0, 0))
+        self.session.add_all([person1, person2])
+        self.session.commit()
+
+    def test_no_validators_by_default(self):
+        """Tests that responses have no validators unless requested."""
+        self.manager.create_api(self.Person)
+        response = self.app.get('/api/person/1')
+        assert response.status_code == 200
+        assert 'ETag' not in response.headers
+        assert 'Last-Modified' not in response.headers
+
+    def test_strong_etag_resource(self):
+        """Tests that a resource has a strong entity tag and that a
+        matching :http:header:`If-None-Match` header yields a
+        :http:statuscode:`304` response with an empty body.
+
+        """
+        self.manager.create_api(self.Person, methods=['GET', 'PATCH'],
+                                etags=True)
+        response = self.app.get('/api/person/1')
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert not etag.startswith('W/')
+        headers = {'If-None-Match': etag}
+        response = self.app.get('/api/person/1', headers=headers)
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+        # After the resource changes, the entity tag no longer matches.
+        data = {'data': {'type': 'person', 'id': '1',
+                         'attributes': {'name': u'baz'}}}
+        response = self.app.patch('/api/person/1', data=dumps(data))
+        assert response.status_code == 204
+        response = self.app.get('/api/person/1', headers=headers)
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_strong_etag_collection(self):
+        """Tests that a collection has an entity tag that depends on the
+        query parameters.
+
+        """
+        self.manager.create_api(self.Person, etags=True)
+        response = self.app.get('/api/person')
+        etag = response.headers['ETag']
+        response = self.app.get('/api/person',
+                                headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        query_string = {'sort': '-id'}
+        response = self.app.get('/api/person', query_string=query_string,
+                                headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_weak_etag_skips_serialization(self):
+        """Tests that a weak entity tag derived from the version counter
+        of a model allows a :http:statuscode:`304` response without
+        serializing the requested resources.
+
+        """
+        self.manager.create_api(self.Person, weak_etags=True,
+                                serializer_class=self.CountingSerializer)
+        for url in ('/api/person/1', '/api/person'):
+            response = self.app.get(url)
+            assert response.status_code == 200
+            etag = response.headers['ETag']
+            assert etag.startswith('W/')
+            del self.counter[:]
+            response = self.app.get(url, headers={'If-None-Match': etag})
+            assert response.status_code == 304
+            assert response.headers['ETag'] == etag
+            assert self.counter == []
+
+    def test_weak_etag_changes_with_version(self):
+        """Tests that the weak entity tag changes when the version of a
+        resource changes.
+
+        """
+        self.manager.create_api(self.Person, weak_etags=True)
+        response = self.app.get('/api/person')
+        etag = response.headers['ETag']
+        person = self.session.query(self.Person).get(1)
+        person.name = u'baz'
+        self.session.commit()
+        response = self.app.get('/api/person',
+                                headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_star(self):
+        """Tests that ``If-None-Match: *`` matches any representation."""
+        self.manager.create_api(self.Person, etags=True)
+        response = self.app.get('/api/person/1',
+                                headers={'If-None-Match': '*'})
+        assert response.status_code == 304
+
+    def test_last_modified(self):
+        """Tests for the :http:header:`Last-Modified` and
+        :http:header:`If-Modified-Since` headers.
+
+        """
+        self.manager.create_api(self.Person,
+                                last_modified_column='updated_at',
+                                serializer_class=self.CountingSerializer)
+        response = self.app.get('/api/person/1')
+        assert response.status_code == 200
+        assert response.headers['Last-Modified'] == \
+            'Fri, 01 Jan 2016 12:00:00 GMT'
+        headers = {'If-Modified-Since': 'Fri, 01 Jan 2016 13:00:00 GMT'}
+        del self.counter[:]
+        response = self.app.get('/api/person/1', headers=headers)
+        assert response.status_code == 304
+        assert self.counter == []
+
+    def test_no_last_modified_for_page(self):
+        """Tests that a page of a collection has no
+        :http:header:`Last-Modified` header unless it is computed over the
+        whole collection, since deleting a resource does not change the
+        latest modification time of the remaining ones.
+
+        """
+        self.manager.create_api(self.Person, methods=['GET', 'DELETE'],
+                                last_modified_column='updated_at')
+        response = self.app.get('/api/person')
+        assert 'Last-Modified' not in response.headers
+        response = self.app.delete('/api/person/1')
+        assert response.status_code == 204
+        headers = {'If-Modified-Since': 'Sat, 02 Jan 2016 12:00:00 GMT'}
+        response = self.app.get('/api/person', headers=headers)
+        assert response.status_code == 200
+
+    def test_no_last_modified_collection(self):
+        """Tests that a collection has no :http:header:`Last-Modified`
+        header even if it is computed by the validator query, since
+        deleting a resource other than the latest one does not change
+        the latest modification time.
+
+        """
+        self.manager.create_api(self.Person, methods=['GET', 'DELETE'],
+                                weak_etags=True,
+                                last_modified_column='updated_at',
+                                validator_query=True)
+        response = self.app.get('/api/person')
+        assert response.status_code == 200
+        assert 'Last-Modified' not in response.headers
+        response = self.app.delete('/api/person/1')
+        assert response.status_code == 204
+        headers = {'If-Modified-Since': 'Sat, 02 Jan 2016 12:00:00 GMT'}
+        response = self.app.get('/api/person', headers=headers)
+        assert response.status_code == 200
+        document = loads(response.data)
+        assert len(document['data']) == 1
+
+    def test_if_none_match_takes_precedence(self):
+        """Tests that the :http:header:`If-Modified-Since` header is
+        ignored when the request has an :http:header:`If-None-Match`
+        header.
+
+        """
+        self.manager.create_api(self.Person, etags=True,
+                                last_modified_column='updated_at')
+        headers = {'If-Modified-Since': 'Sat, 02 Jan 2016 12:00:00 GMT',
+                   'If-None-Match': '"bogus"'}
+        response = self.app.get('/api/person/1', headers=headers)
+        assert response.status_code == 200
+
+    def test_validator_query_collection(self):
+        """Tests that a validator query allows a :http:statuscode:`304`
+        response to a request for a collection without loading any
+        instances.
+
+        """
+        loaded = []
+        event.listen(self.Person, 'load', lambda *args: loaded.append(1))
+        self.manager.create_api(self.Person, weak_etags=True,
+                                validator_query=True)
+        response = self.app.get('/api/person')
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert etag.startswith('W/')
+        del loaded[:]
+        headers = {'If-None-Match': etag}
+        response = self.app.get('/api/person', headers=headers)
+        assert response.status_code == 304
+        assert loaded == []
+        # Updating a resource increments its version.
+        person = self.session.query(self.Person).get(1)
+        person.name = u'baz'
+        self.session.commit()
+        response = self.app.get('/api/person', headers=headers)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        # Deleting a resource changes the number of results.
+        self.session.delete(person)
+        self.session.commit()
+        headers = {'If-None-Match': etag}
+        response = self.app.get('/api/person', headers=headers)
+        assert response.status_code == 200
+
+    def test_validator_query_replaced_row(self):
+        """Tests that the entity tag computed by the validator query
+        changes when a resource is removed and another with the same
+        version is added.
+
+        """
+        self.manager.create_api(self.Person, weak_etags=True,
+                                validator_query=True)
+        response = self.app.get('/api/person')
+        etag = response.headers['ETag']
+        self.session.delete(self.session.query(self.Person).get(1))
+        self.session.add(self.Person(id=3, name=u'baz'))
+        self.session.commit()
+        headers = {'If-None-Match': etag}
+        response = self.app.get('/api/person', headers=headers)
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_validator_query_filtered_collection(self):
+        """Tests that the validator query applies the filters requested by
+        the client.
+
+        """
+        self.manager.create_api(self.Person, weak_etags=True,
+                                validator_query=True)
+        filters = [dict(name='id', op='eq', val=2)]
+        query_string = {'filter[objects]': dumps(filters)}
+        response = self.app.get('/api/person', query_string=query_string)
+        etag = response.headers['ETag']
+        # Changing a resource that is not in the filtered collection does
+        # not change the entity tag.
+        person = self.session.query(self.Person).get(1)
+        person.name = u'baz'
+        self.session.commit()
+        headers = {'If-None-Match': etag}
+        response = self.app.get('/api/person', query_string=query_string,
+                                headers=headers)
+        assert response.status_code == 304
+
+    def test_validator_query_resource(self):
+        """Tests that a validator query allows a :http:statuscode:`304`
+        response to a request for a resource without loading it.
+
+        """
+        loaded = []
+        event.listen(self.Person, 'load', lambda *args: loaded.append(1))
+        self.manager.create_api(self.Person, weak_etags=True,
+                                last_modified_column='updated_at',
+                                validator_query=True)
+        response = self.app.get('/api/person/1')
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        del loaded[:]
+        response = self.app.get('/api/person/1',
+                                headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        headers = {'If-Modified-Since': 'Fri, 01 Jan 2016 12:00:00 GMT'}
+        response = self.app.get('/api/person/1', headers=headers)
+        assert response.status_code == 304
+        assert loaded == []
+        response = self.app.get('/api/person/3',
+                                headers={'If-None-Match': etag})
+        assert response.status_code == 404
+
+    def test_validator_query_requires_version(self):
+        """Tests that a validator query requires a version counter or a
+        last modification time.
+
+        """
+        with self.assertRaises(IllegalArgumentError):
+            self.manager.create_api(self.Person, etags=True,
+                                    validator_query=True)
+
+
+class TestResponseCache(ManagerTestBase):
+    """Tests for the server-side cache of responses to :http:method:`get`
+    requests.
+
+    """
+
+    def setUp(self):
+        super(TestResponseCache, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+        class Tag(self.Base):
+            __tablename__ = 'tag'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        class CountingSerializer(DefaultSerializer):
+
+            def serialize_many(self, instances, *args, **kw):
+                counter.append(instances)
+                return super(CountingSerializer, self).serialize_many(
+                    instances, *args, **kw)
+
+        counter = []
+        self.counter = counter
+        self.CountingSerializer = CountingSerializer
+        self.Article = Article
+        self.Person = Person
+        self.Tag = Tag
+        self.Base.metadata.create_all()
+        self.session.add_all([Person(id=1, name=u'foo'),
+                              Person(id=2, name=u'bar'),
+                              Tag(id=1, name=u'baz')])
+        self.session.commit()
+
+    def test_cached_collection(self):
+        """Tests that a second request for a collection is served from
+        the cache without fetching the collection again.
+
+        """
+        cache = ResponseCache()
+        self.manager.create_api(self.Person, response_cache=cache,
+                                serializer_class=self.CountingSerializer)
+        response1 = self.app.get('/api/person')
+        response2 = self.app.get('/api/person')
+        assert response2.status_code == 200
+        assert response2.data == response1.data
+        assert response2.mimetype == response1.mimetype
+        assert len(self.counter) == 1
+        # Query parameters in a different order yield the same entry.
+        self.app.get('/api/person?page[size]=1&sort=name')
+        self.app.get('/api/person?sort=name&page[size]=1')
+        assert len(self.counter) == 2
+        assert (cache.hits, cache.misses) == (2, 2)
+        assert cache.hit_ratio == 0.5
+
+    def test_cached_resource(self):
+        """Tests that responses for individual resources are cached, but
+        error responses are not.
+
+        """
+        cache = ResponseCache()
+        self.manager.create_api(self.Person, response_cache=cache)
+        response1 = self.app.get('/api/person/1')
+        response2 = self.app.get('/api/person/1')
+        assert response2.data == response1.data
+        self.app.get('/api/person/3')
+        response = self.app.get('/api/person/3')
+        assert response.status_code == 404
+        assert (cache.hits, cache.misses) == (1, 3)
+
+    def test_invalidated_by_update(self):
+        """Tests that committing a change to a resource invalidates the
+        cached responses for its collection.
+
+        """
+        cache = ResponseCache()
+        self.manager.create_api(self.Person, methods=['GET', 'PATCH'],
+                                response_cache=cache)
+        self.app.get('/api/person/1')
+        self.app.get('/api/person')
+        data = {'data': {'type': 'person', 'id': '1',
+                         'attributes': {'name': u'baz'}}}
+        response = self.app.patch('/api/person/1', data=dumps(data))
+        assert response.status_code == 204
+        document = loads(self.app.get('/api/person/1').data)
+        assert document['data']['attributes']['name'] == u'baz'
+        document = loads(self.app.get('/api/person').data)
+        names = sorted(p['attributes']['name'] for p in document['data'])
+        assert names == [u'bar', u'baz']
+        assert cache.stale == 2
+        assert cache.hits == 0
+
+    def test_invalidated_by_related_write(self):
+        """Tests that creating a resource invalidates the cached responses
+        for collections that refer to it, but not for unrelated
+        collections.
+
+        """
+        cache = ResponseCache()
+        self.manager.create_api(self.Person, response_cache=cache)
+        self.manager.create_api(self.Tag, response_cache=cache)
+        self.manager.create_api(self.Article, methods=['POST'])
+        self.app.get('/api/person?include=articles')
+        self.app.get('/api/tag')
+        data = {'data': {'type': 'article',
+                         'relationships': {'author': {'data': {
+                             'type': 'person', 'id': '1'}}}}}
+        response = self.app.post('/api/article', data=dumps(data))
+        assert response.status_code == 201
+        document = loads(self.app.get('/api/person?include=articles').data)
+        assert len(document['included']) == 1
+        self.app.get('/api/tag')
+        assert cache.hits == 1
+        assert cache.stale == 1
+
+    def test_invalidated_by_relationship_write(self):
+        """Tests that updating a relationship invalidates the cached
+        responses for the collections on both sides of it.
+
+        """
+        self.session.add(self.Article(id=1))
+        self.session.commit()
+        cache = ResponseCache()
+        self.manager.create_api(self.Person, methods=['GET', 'PATCH'],
+                                allow_to_many_replacement=True,
+                                response_cache=cache)
+        self.manager.create_api(self.Article)
+        self.app.get('/api/person/1')
+        data = {'data': [{'type': 'article', 'id': '1'}]}
+        response = self.app.patch('/api/person/1/relationships/articles',
+                                  data=dumps(data))
+        assert response.status_code == 204
+        document = loads(self.app.get('/api/person/1').data)
+        articles = document['data']['relationships']['articles']['data']
+        assert articles == [{'type': 'article', 'id': '1'}]
+
+    def test_scope(self):
+        """Tests that responses are not shared between scopes, including
+        scopes established by preprocessors.
+
+        """
+        scope = ['foo']
+
+        def only_current_user(filters=None, **kw):
+            filters.append(dict(name='name', op='eq', val=scope[0]))
+
+        preprocessors = dict(GET_COLLECTION=[only_current_user])
+        cache = ResponseCache(scope=lambda: scope[0])
+        self.manager.create_api(self.Person, response_cache=cache,
+                                preprocessors=preprocessors)
+        document = loads(self.app.get('/api/person').data)
+        assert [p['id'] for p in document['data']] == ['1']
+        scope[0] = 'bar'
+        document = loads(self.app.get('/api/person').data)
+        assert [p['id'] for p in document['data']] == ['2']
+        assert cache.hits == 0
+
+    def test_accept_header(self):
+        """Tests that the :http:header:`Accept` header is part of the
+        cache key.
+
+        """
+        cache = ResponseCache()
+        self.manager.create_api(self.Person, response_cache=cache)
+        self.app.get('/api/person')
+        self.app.get('/api/person', headers={'Accept': '*/*'})
+        assert cache.hits == 0
+
+    def test_conditional_hit(self):
+        """Tests that a cached response with an entity tag yields a
+        :http:statuscode:`304` response to a conditional request.
+
+        """
+        cache = ResponseCache()
+        self.manager.create_api(self.Person, response_cache=cache,
+                                etags=True)
+        etag = self.app.get('/api/person').headers['ETag']
+        response = self.app.get('/api/person', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        assert cache.hits == 1
+
+    def test_byte_budget(self):
+        """Tests that the default store discards responses when the
+        total size exceeds the budget.
+
+        """
+        cache = ResponseCache()
+        self.manager.create_api(self.Person, response_cache=cache)
+        self.app.get('/api/person/1')
+        # Make room for exactly one response.
+        cache.store.maxbytes = cache.store.size
+        self.app.get('/api/person/2')
+        self.app.get('/api/person/1')
+        assert cache.stats()['evictions'] == 2
+        assert len(cache.store) == 1
+        assert cache.hits == 0
+
+    def test_filesystem_store(self):
+        """Tests that responses can be stored in files in a directory."""
+        directory = mkdtemp()
+        try:
+            cache = ResponseCache(FileSystemStore(directory))
+            self.manager.create_api(self.Person, methods=['GET', 'DELETE'],
+                                    response_cache=cache)
+            response1 = self.app.get('/api/person')
+            response2 = self.app.get('/api/person')
+            assert response2.data == response1.data
+            assert len(cache.store) == 1
+            response = self.app.delete('/api/person/1')
+            assert response.status_code == 204
+            document = loads(self.app.get('/api/person').data)
+            assert [p['id'] for p in document['data']] == ['2']
+            assert cache.stats()['evictions'] is None
+            assert (cache.hits, cache.stale) == (1, 1)
+        finally:
+            rmtree(directory)
+
+
+class TestCompression(ManagerTestBase):
+    """Tests for compressing the bodies of responses according to the
+    :http:header:`Accept-Encoding` header of the request.
+
+    """
+
+    def setUp(self):
+        super(TestCompression, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        self.Person = Person
+        self.Base.metadata.create_all()
+        people = [Person(id=i, name=u'person{0}'.format(i))
+                  for i in range(1, 21)]
+        self.session.add_all(people)
+        self.session.commit()
+
+    def test_gzip(self):
+        """Tests that a large response is compressed with gzip."""
+        self.manager.create_api(self.Person, compress=True)
+        uncompressed = self.app.get('/api/person').data
+        headers = {'Accept-Encoding': 'deflate;q=0.5, gzip'}
+        response = self.app.get('/api/person', headers=headers)
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert int(response.headers['Content-Length']) == len(response.data)
+        assert len(response.data) < len(uncompressed)
+        data = zlib.decompress(response.data, zlib.MAX_WBITS + 16)
+        assert data == uncompressed
+
+    def test_deflate(self):
+        """Tests that a response is compressed with deflate if the client
+        does not accept gzip.
+
+        """
+        self.manager.create_api(self.Person, compress=True)
+        uncompressed = self.app.get('/api/person').data
+        headers = {'Accept-Encoding': 'gzip;q=0, deflate'}
+        response = self.app.get('/api/person', headers=headers)
+        assert response.headers['Content-Encoding'] == 'deflate'
+        assert zlib.decompress(response.data) == uncompressed
+
+    def test_no_compression(self):
+        """Tests that responses are not compressed unless the client
+        accepts it, compression is enabled, and the body is large
+        enough.
+
+        """
+        self.manager.create_api(self.Person, compress=True,
+                                compression_threshold=1000)
+        response = self.app.get('/api/person')
+        assert 'Content-Encoding' not in response.headers
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        headers = {'Accept-Encoding': 'gzip'}
+        response = self.app.get('/api/person/1', headers=headers)
+        assert 'Content-Encoding' not in response.headers
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        loads(response.data)
+
+    def test_disabled_by_default(self):
+        """Tests that responses are not compressed by default."""
+        self.manager.create_api(self.Person)
+        response = self.app.get('/api/person',
+                                headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+        assert 'Vary' not in response.headers
+
+    def test_weak_etag(self):
+        """Tests that the strong entity tag of a compressed response is
+        made weak and that it still matches conditional requests.
+
+        """
+        self.manager.create_api(self.Person, compress=True, etags=True)
+        headers = {'Accept-Encoding': 'gzip'}
+        response = self.app.get('/api/person', headers=headers)
+        etag = response.headers['ETag']
+        assert etag.startswith('W/')
+        headers['If-None-Match'] = etag
+        response = self.app.get('/api/person', headers=headers)
+        assert response.status_code == 304
+        assert 'Content-Encoding' not in response.headers
+
+    def test_streamed(self):
+        """Tests that a streamed response is compressed incrementally."""
+        chunks = [b'foo' * 10, b'bar' * 10]
+        headers = {'Accept-Encoding': 'gzip'}
+        with self.flaskapp.test_request_context(headers=headers):
+            response = self.flaskapp.response_class(iter(chunks))
+            response = compress_response(response, threshold=1000)
+            assert response.headers['Content-Encoding'] == 'gzip'
+            assert 'Content-Length' not in response.headers
+            data = b''.join(response.response)
+        assert zlib.decompress(data, zlib.MAX_WBITS + 16) == b''.join(chunks)
+
+    def test_bad_level(self):
+        """Tests that attempting to create an API with an invalid
+        compression level raises an exception.
+
+        """
+        with self.assertRaises(IllegalArgumentError):
+            self.manager.create_api(self.Person, compress=True,
+                                    compression_level=10)
+
+
 class TestFlaskSQLAlchemy(FlaskSQLAlchemyTestBase):
     """Tests for fetching resources defined as Flask-SQLAlchemy models
     instead of pure SQLAlchemy models.
@@ -10,8 +10,22 @@
 # License version 3 and under the 3-clause BSD license. For more
 # information, see LICENSE.AGPL and LICENSE.BSD.
 """Unit tests for function evaluation endpoints."""
+from datetime import date
+from datetime import datetime
+
 from sqlalchemy import Column
+from sqlalchemy import Date
+from sqlalchemy import DateTime
+from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy import event
+from sqlalchemy import func
+from sqlalchemy.orm import relationship
+
+from flask_restless import AggregateCache
+from flask_restless import APIManager
+from flask_restless.views import function
 
 from .helpers import check_sole_error
 from .helpers import dumps
@@ -158,6 +172,86 @@ class TestFunctionEvaluation(ManagerTestBase):
         results = document['data']
         assert [30, 10.0] == results
 
+    def test_function_filters(self):
+        """Tests that each function object may have its own filters,
+        and that all the functions are evaluated in a single query.
+
+        """
+        self.session.add_all([self.Person(age=5), self.Person(age=10),
+                              self.Person(age=15), self.Person(age=20)])
+        self.session.commit()
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, self.Base.metadata.bind,
+                        'before_cursor_execute', record)
+        young = [{'name': 'age', 'op': '<', 'val': 12}]
+        old = [{'name': 'age', 'op': '>=', 'val': 12}]
+        functions = [
+            {'name': 'count', 'field': 'id', 'filter': young},
+            {'name': 'sum', 'field': 'age', 'filter': old},
+            {'name': 'count', 'field': 'id'},
+        ]
+        # The filters in the query parameter apply to all functions.
+        filters = [{'name': 'age', 'op': '>', 'val': 5}]
+        query_string = {'filter[objects]': dumps(filters),
+                        'functions': dumps(functions)}
+        response = self.app.get('/api/eval/person', query_string=query_string)
+        assert response.status_code == 200
+        assert loads(response.data)['data'] == [1, 35, 3]
+        assert len(statements) == 1
+        assert 'FILTER' in statements[0]
+
+    def test_function_filters_without_filter_clause(self):
+        """Tests that function filters are evaluated with a ``CASE``
+        expression if the database does not support the ``FILTER``
+        clause.
+
+        """
+        original = function.supports_filter_clause
+        function.supports_filter_clause = lambda dialect: False
+        self.addCleanup(setattr, function, 'supports_filter_clause',
+                        original)
+        self.session.add_all([self.Person(age=5), self.Person(age=10)])
+        self.session.commit()
+        functions = [
+            {'name': 'count', 'field': 'id',
+             'filter': [{'name': 'age', 'op': '<', 'val': 8}]},
+            {'name': 'max', 'field': 'age',
+             'filter': [{'name': 'age', 'op': '<', 'val': 8}]},
+        ]
+        query_string = {'functions': dumps(functions)}
+        response = self.app.get('/api/eval/person', query_string=query_string)
+        assert response.status_code == 200
+        assert loads(response.data)['data'] == [1, 5]
+
+    def test_bad_function_filter(self):
+        """Tests that an invalid filter object in a function object
+        yields an error response.
+
+        """
+        functions = [{'name': 'count', 'field': 'id',
+                      'filter': [{'name': 'bogus', 'op': 'eq', 'val': 1}]}]
+        query_string = {'functions': dumps(functions)}
+        response = self.app.get('/api/eval/person', query_string=query_string)
+        check_sole_error(response, 400, ['invalid', 'filter', 'function',
+                                         'bogus'])
+
+    def test_function_filter_not_list(self):
+        """Tests that a filter in a function object that is not a list of
+        filter objects yields an error response.
+
+        """
+        for filters in ({'name': 'age', 'op': 'gt', 'val': 3}, [1]):
+            functions = [{'name': 'count', 'field': 'id', 'filter': filters}]
+            query_string = {'functions': dumps(functions)}
+            response = self.app.get('/api/eval/person',
+                                    query_string=query_string)
+            check_sole_error(response, 400, ['filter', 'function', 'list'])
+
     def test_bad_filter_json(self):
         """Tests for invalid JSON in the ``filter[objects]`` query parameter.
 
@@ -192,3 +286,472 @@ class TestFunctionEvaluation(ManagerTestBase):
         response = self.app.get('/api/eval/person', query_string=query_string)
         check_sole_error(response, 400, ['Invalid', 'format', 'single',
                                          'query parameter'])
+
+
+class TestGroupedFunctions(ManagerTestBase):
+    """Tests for grouping the results of the function evaluation
+    endpoint.
+
+    """
+
+    def setUp(self):
+        super(TestGroupedFunctions, self).setUp()
+
+        class Team(self.Base):
+            __tablename__ = 'team'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            age = Column(Integer)
+            role = Column(Unicode)
+            team_id = Column(Integer, ForeignKey('team.id'))
+            team = relationship(Team)
+
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.manager.create_api(Person, allow_functions=True)
+        red = Team(id=1, name=u'red')
+        blue = Team(id=2, name=u'blue')
+        self.session.add_all([
+            Person(age=10, role=u'a', team=red),
+            Person(age=20, role=u'b', team=red),
+            Person(age=30, role=u'a', team=blue),
+            Person(age=50, role=u'c', team=blue),
+            Person(age=70, role=u'c', team=blue),
+        ])
+        self.session.commit()
+
+    def evaluate(self, **params):
+        """Returns the response to a request to evaluate the average and
+        the count of the ages with the specified query parameters.
+
+        """
+        functions = [dict(name='avg', field='age'),
+                     dict(name='count', field='id')]
+        params['functions'] = dumps(functions)
+        return self.app.get('/api/eval/person', query_string=params)
+
+    def test_group(self):
+        """Tests that the functions are evaluated once for each group,
+        in a single query, ordered by the grouping field.
+
+        """
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, self.Base.metadata.bind,
+                        'before_cursor_execute', record)
+        response = self.evaluate(group='role')
+        assert response.status_code == 200
+        document = loads(response.data)
+        assert document['data'] == [
+            {'group': {'role': u'a'}, 'results': [20.0, 2]},
+            {'group': {'role': u'b'}, 'results': [20.0, 1]},
+            {'group': {'role': u'c'}, 'results': [60.0, 2]},
+        ]
+        assert document['links']['next'] is None
+        assert len(statements) == 1
+
+    def test_group_by_relationship(self):
+        """Tests for grouping by a field of a related model, along with
+        filtering and sorting.
+
+        """
+        filters = [dict(name='age', op='lt', val=60)]
+        response = self.evaluate(**{'group': 'team.name,role',
+                                    'sort': '-team.name',
+                                    'filter[objects]': dumps(filters)})
+        assert response.status_code == 200
+        groups = [(row['group']['team.name'], row['group']['role'],
+                   row['results'])
+                  for row in loads(response.data)['data']]
+        assert groups[:2] == [(u'red', u'a', [10.0, 1]),
+                              (u'red', u'b', [20.0, 1])]
+        assert sorted(groups[2:]) == [(u'blue', u'a', [30.0, 1]),
+                                      (u'blue', u'c', [50.0, 1])]
+
+    def test_pagination(self):
+        """Tests that the groups are paginated."""
+        response = self.evaluate(**{'group': 'role', 'page[size]': 2})
+        document = loads(response.data)
+        assert [row['group']['role'] for row in document['data']] == \
+            [u'a', u'b']
+        assert document['links']['prev'] is None
+        assert 'page%5Bnumber%5D=2' in document['links']['next']
+        response = self.evaluate(**{'group': 'role', 'page[size]': 2,
+                                    'page[number]': 2})
+        document = loads(response.data)
+        assert [row['group']['role'] for row in document['data']] == [u'c']
+        assert document['links']['next'] is None
+        assert 'page%5Bnumber%5D=1' in document['links']['prev']
+
+    def test_max_groups(self):
+        """Tests that the number of groups is capped by the server."""
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  url_prefix='/api2')
+        self.manager.create_api(self.Person, allow_functions=True,
+                                max_function_groups=2)
+        functions = dumps([dict(name='count', field='id')])
+        query_string = dict(functions=functions, group='role')
+        response = self.app.get('/api2/eval/person',
+                                query_string=query_string)
+        document = loads(response.data)
+        assert len(document['data']) == 2
+        assert document['links']['next'] is not None
+        query_string['page[size]'] = 3
+        response = self.app.get('/api2/eval/person',
+                                query_string=query_string)
+        check_sole_error(response, 400, ['Page size', 'maximum', '2'])
+
+    def test_bad_group(self):
+        """Tests that grouping by an unknown field or sorting by a field
+        other than a grouping field yields an error response.
+
+        """
+        response = self.evaluate(group='bogus')
+        check_sole_error(response, 400, ['unknown field', 'bogus'])
+        response = self.evaluate(group='bogus.name')
+        check_sole_error(response, 400, ['unknown field', 'bogus.name'])
+        response = self.evaluate(group='role', sort='age')
+        check_sole_error(response, 400, ['sort', 'age', 'grouping'])
+
+
+class TestAggregateCache(ManagerTestBase):
+    """Tests for caching the results of the function evaluation endpoint
+    in an :class:`~flask_restless.AggregateCache`.
+
+    """
+
+    def setUp(self):
+        super(TestAggregateCache, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            age = Column(Integer)
+            status = Column(Unicode)
+            nickname = Column(Unicode(collation='NOCASE'))
+
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.cache = AggregateCache()
+        self.manager.create_api(Person, methods=['POST', 'PATCH', 'DELETE'],
+                                allow_functions=True, allow_patch_many=True,
+                                aggregate_cache=self.cache)
+        self.session.add_all([Person(id=1, age=10, status=u'open'),
+                              Person(id=2, age=20, status=u'open'),
+                              Person(id=3, age=30, status=u'closed')])
+        self.session.commit()
+        self.statements = []
+
+        def record(conn, cursor, statement, *args):
+            self.statements.append(statement)
+
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, self.Base.metadata.bind,
+                        'before_cursor_execute', record)
+
+    def evaluate(self, functions, filters=None):
+        """Returns the results of evaluating the specified functions,
+        and clears the list of executed statements beforehand.
+
+        """
+        del self.statements[:]
+        query_string = {'functions': dumps(functions)}
+        if filters is not None:
+            query_string['filter[objects]'] = dumps(filters)
+        response = self.app.get('/api/eval/person', query_string=query_string)
+        assert response.status_code == 200
+        return loads(response.data)['data']
+
+    def test_cached(self):
+        """Tests that a result is computed only once."""
+        functions = [dict(name='avg', field='age')]
+        assert self.evaluate(functions) == [20.0]
+        assert len(self.statements) == 1
+        assert self.evaluate(functions) == [20.0]
+        assert len(self.statements) == 0
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+        # A different filter is a different result.
+        filters = [dict(name='age', op='gt', val=10)]
+        assert self.evaluate(functions, filters) == [25.0]
+        assert len(self.statements) == 1
+
+    def test_incremental(self):
+        """Tests that the result of ``count`` and ``sum`` functions
+        filtered by equality is updated when changes are committed,
+        without querying the database again.
+
+        """
+        functions = [dict(name='count', field='id'),
+                     dict(name='sum', field='age')]
+        filters = [dict(name='status', op='eq', val=u'open')]
+        assert self.evaluate(functions, filters) == [2, 30]
+        data = dict(data=dict(type='person',
+                              attributes=dict(age=5, status=u'open')))
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        assert self.evaluate(functions, filters) == [3, 35]
+        data = dict(data=dict(type='person', id='1',
+                              attributes=dict(status=u'closed')))
+        response = self.app.patch('/api/person/1', data=dumps(data))
+        assert response.status_code < 300
+        assert self.evaluate(functions, filters) == [2, 25]
+        response = self.app.delete('/api/person/2')
+        assert response.status_code == 204
+        assert self.evaluate(functions, filters) == [1, 5]
+        assert self.statements == []
+        assert self.cache.updates == 3
+
+    def test_case_insensitive_collation(self):
+        """Tests that a result filtered by equality to a string is
+        discarded instead of updated in place when the collation of the
+        column does not compare strings by their bytes.
+
+        """
+        functions = [dict(name='count', field='id')]
+        filters = [dict(name='nickname', op='eq', val=u'bob')]
+        assert self.evaluate(functions, filters) == [0]
+        data = dict(data=dict(type='person', attributes=dict(nickname=u'BOB')))
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        assert self.evaluate(functions, filters) == [1]
+        assert self.cache.updates == 0
+
+    def test_sum_of_nothing(self):
+        """Tests that the sum becomes null when no values remain."""
+        functions = [dict(name='sum', field='age')]
+        filters = [dict(name='status', op='eq', val=u'closed')]
+        assert self.evaluate(functions, filters) == [30]
+        response = self.app.delete('/api/person/3')
+        assert response.status_code == 204
+        assert self.evaluate(functions, filters) == [None]
+        assert self.statements == []
+
+    def test_not_incremental(self):
+        """Tests that other results are discarded when changes are
+        committed.
+
+        """
+        functions = [dict(name='max', field='age')]
+        assert self.evaluate(functions) == [30]
+        data = dict(data=dict(type='person', attributes=dict(age=40)))
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        assert self.evaluate(functions) == [40]
+        assert len(self.statements) == 1
+
+    def test_bulk_update(self):
+        """Tests that results are discarded when many resources are
+        updated by a single statement.
+
+        """
+        functions = [dict(name='sum', field='age')]
+        assert self.evaluate(functions) == [60]
+        data = dict(data=dict(type='person', attributes=dict(age=1)))
+        response = self.app.patch('/api/person', data=dumps(data))
+        assert response.status_code == 200
+        assert self.evaluate(functions) == [3]
+
+    def test_rollback(self):
+        """Tests that changes that are rolled back do not affect the
+        results.
+
+        """
+        functions = [dict(name='count', field='id')]
+        assert self.evaluate(functions) == [3]
+        self.session.add(self.Person(id=4))
+        self.session.flush()
+        self.session.rollback()
+        assert self.evaluate(functions) == [3]
+        assert self.statements == []
+
+    def test_result_during_commit(self):
+        """Tests that a result computed after another session commits
+        changes to the database, but before the changes are applied to
+        the stored results, is not stored, since it already reflects
+        them.
+
+        """
+        # Store a result for the model, so that the changes to its rows
+        # are recorded in order to update the stored results.
+        assert self.evaluate([dict(name='count', field='id')]) == [3]
+        functions = [dict(name='count', field='id'),
+                     dict(name='sum', field='age')]
+        key = self.cache.key(self.Person, functions, [])
+        generation = self.cache.generation()
+
+        def evaluate_concurrently(session):
+            other = self.Session()
+            columns = self.cache.extra_columns(self.Person, functions, [],
+                                               other)
+            row = other.query(func.count(self.Person.id),
+                              func.sum(self.Person.age), *columns).one()
+            self.cache.set(key, generation, self.Person, functions, [], row,
+                           other)
+            other.close()
+
+        # Insert this listener before the one registered by the cache.
+        event.listen(self.session, 'after_commit', evaluate_concurrently,
+                     insert=True)
+        self.addCleanup(event.remove, self.session, 'after_commit',
+                        evaluate_concurrently)
+        self.session.add(self.Person(id=4, age=40))
+        self.session.commit()
+        assert self.evaluate(functions) == [4, 100]
+
+    def test_ttl(self):
+        """Tests that results expire."""
+        self.cache.ttl = 0
+        functions = [dict(name='count', field='id')]
+        assert self.evaluate(functions) == [3]
+        assert self.evaluate(functions) == [3]
+        assert len(self.statements) == 1
+
+
+class TestHistogram(ManagerTestBase):
+    """Tests for histograms of the results of the function evaluation
+    endpoint.
+
+    """
+
+    def setUp(self):
+        super(TestHistogram, self).setUp()
+
+        class Event(self.Base):
+            __tablename__ = 'event'
+            id = Column(Integer, primary_key=True)
+            time = Column(DateTime)
+            day = Column(Date)
+            amount = Column(Integer)
+
+        self.Event = Event
+        self.Base.metadata.create_all()
+        self.manager.create_api(Event, allow_functions=True,
+                                max_histogram_buckets=40)
+        self.session.add_all([
+            Event(time=datetime(2016, 1, 1, 10, 5), day=date(2016, 1, 1),
+                  amount=1),
+            Event(time=datetime(2016, 1, 1, 10, 55), day=date(2016, 1, 4),
+                  amount=2),
+            Event(time=datetime(2016, 1, 1, 13, 0), day=date(2016, 1, 10),
+                  amount=4),
+            Event(time=datetime(2016, 3, 2, 0, 0), day=date(2016, 1, 11),
+                  amount=8),
+            Event(time=None, day=None, amount=16),
+        ])
+        self.session.commit()
+
+    def histogram(self, **params):
+        """Returns the response to a request for a histogram of the count
+        of events, the sum of their amounts, and the maximum amount.
+
+        """
+        functions = [dict(name='count', field='id'),
+                     dict(name='sum', field='amount'),
+                     dict(name='max', field='amount')]
+        params['functions'] = dumps(functions)
+        return self.app.get('/api/eval/event', query_string=params)
+
+    def test_hours(self):
+        """Tests that the buckets are consecutive, with the gaps
+        filled.
+
+        """
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, self.Base.metadata.bind,
+                        'before_cursor_execute', record)
+        filters = [dict(name='time', op='lt', val='2016-02-01')]
+        response = self.histogram(**{'histogram[field]': 'time',
+                                     'histogram[width]': 'hour',
+                                     'filter[objects]': dumps(filters)})
+        assert response.status_code == 200
+        assert loads(response.data)['data'] == [
+            {'bucket': '2016-01-01T10:00:00', 'results': [2, 3, 2]},
+            {'bucket': '2016-01-01T11:00:00', 'results': [0, 0, None]},
+            {'bucket': '2016-01-01T12:00:00', 'results': [0, 0, None]},
+            {'bucket': '2016-01-01T13:00:00', 'results': [1, 4, 4]},
+        ]
+        assert len(statements) == 1
+
+    def test_weeks_and_months(self):
+        """Tests that weeks start on Monday and that months are
+        consecutive.
+
+        """
+        response = self.histogram(**{'histogram[field]': 'day',
+                                     'histogram[width]': 'week'})
+        assert response.status_code == 200
+        data = loads(response.data)['data']
+        assert [(row['bucket'], row['results'][0]) for row in data] == [
+            ('2015-12-28T00:00:00', 1),
+            ('2016-01-04T00:00:00', 2),
+            ('2016-01-11T00:00:00', 1),
+        ]
+        response = self.histogram(**{'histogram[field]': 'time',
+                                     'histogram[width]': 'month'})
+        data = loads(response.data)['data']
+        assert [(row['bucket'], row['results'][0]) for row in data] == [
+            ('2016-01-01T00:00:00', 3),
+            ('2016-02-01T00:00:00', 0),
+            ('2016-03-01T00:00:00', 1),
+        ]
+
+    def test_bounds(self):
+        """Tests that the start and end of the histogram restrict and
+        extend the series.
+
+        """
+        response = self.histogram(**{'histogram[field]': 'day',
+                                     'histogram[start]': '2015-12-31',
+                                     'histogram[end]': '2016-01-05'})
+        assert response.status_code == 200
+        data = loads(response.data)['data']
+        assert [(row['bucket'], row['results'][0]) for row in data] == [
+            ('2015-12-31T00:00:00', 0),
+            ('2016-01-01T00:00:00', 1),
+            ('2016-01-02T00:00:00', 0),
+            ('2016-01-03T00:00:00', 0),
+            ('2016-01-04T00:00:00', 1),
+        ]
+
+    def test_unsupported_dialect(self):
+        """Tests that a request for a histogram on a database that does
+        not support it receives a :http:statuscode:`501` response.
+
+        """
+        dialect = self.session.get_bind().dialect
+        dialect.name = 'bogus'
+        self.addCleanup(delattr, dialect, 'name')
+        response = self.histogram(**{'histogram[field]': 'time'})
+        check_sole_error(response, 501, ['not supported', 'bogus'])
+
+    def test_bad_histogram(self):
+        """Tests for error responses to invalid histogram requests."""
+        response = self.histogram(**{'histogram[field]': 'amount'})
+        check_sole_error(response, 400, ['amount', 'date'])
+        response = self.histogram(**{'histogram[field]': 'bogus'})
+        check_sole_error(response, 400, ['unknown field', 'bogus'])
+        response = self.histogram(**{'histogram[field]': 'time',
+                                     'histogram[width]': 'fortnight'})
+        check_sole_error(response, 400, ['width', 'day', 'week'])
+        response = self.histogram(**{'histogram[field]': 'time',
+                                     'histogram[start]': 'bogus'})
+        check_sole_error(response, 400, ['parse', 'histogram[start]'])
+        response = self.histogram(**{'histogram[field]': 'time',
+                                     'group': 'amount'})
+        check_sole_error(response, 400, ['group', 'histogram'])
+        # There are more than 40 days between the first and last events.
+        response = self.histogram(**{'histogram[field]': 'time'})
+        check_sole_error(response, 400, ['buckets', 'maximum', '40'])
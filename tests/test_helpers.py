@@ -0,0 +1,311 @@
+# test_helpers.py - unit tests for the helpers module
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Unit tests for the helper functions in :mod:`flask_restless.helpers`."""
+from datetime import datetime
+
+from unittest2 import TestCase
+
+from sqlalchemy import Column
+from sqlalchemy import Date
+from sqlalchemy import DateTime
+from sqlalchemy import ForeignKey
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy import event
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import backref
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+
+from flask_restless.helpers import assoc_proxy_scalar_collections
+from flask_restless.helpers import foreign_keys
+from flask_restless.helpers import get_all_by
+from flask_restless.helpers import get_field_type
+from flask_restless.helpers import get_related_model
+from flask_restless.helpers import get_relations
+from flask_restless.helpers import has_field
+from flask_restless.helpers import is_like_list
+from flask_restless.helpers import is_relationship
+from flask_restless.helpers import LRUCache
+from flask_restless.helpers import model_info
+from flask_restless.helpers import primary_key_names
+from flask_restless.helpers import resolve_identifiers
+
+from .helpers import ManagerTestBase
+from .helpers import SQLAlchemyTestBase
+
+
+class TestModelInfo(SQLAlchemyTestBase):
+    """Tests for the cached model introspection helpers."""
+
+    def setUp(self):
+        super(TestModelInfo, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+            birthday = Column(Date)
+
+            @hybrid_property
+            def upper_name(self):
+                return func.upper(self.name)
+
+            @hybrid_property
+            def nickname(self):
+                return self.name
+
+            @nickname.setter
+            def nickname(self, value):
+                self.name = value
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+            tags = relationship('Tag', secondary='articletag')
+            tag_names = association_proxy('tags', 'name')
+
+        class ArticleTag(self.Base):
+            __tablename__ = 'articletag'
+            article_id = Column(Integer, ForeignKey('article.id'),
+                                primary_key=True)
+            tag_id = Column(Integer, ForeignKey('tag.id'), primary_key=True)
+
+        class Tag(self.Base):
+            __tablename__ = 'tag'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        self.Article = Article
+        self.Person = Person
+        self.Tag = Tag
+
+    def test_same_object(self):
+        """Tests that the introspected information is computed only once
+        per model.
+
+        """
+        assert model_info(self.Person) is model_info(self.Person)
+        assert model_info(self.Person) is not model_info(self.Article)
+
+    def test_helpers(self):
+        """Tests that the helper functions report the introspected
+        information.
+
+        """
+        assert set(get_relations(self.Article)) == set(['author', 'tags'])
+        assert list(assoc_proxy_scalar_collections(self.Article)) == \
+            ['tag_names']
+        assert get_related_model(self.Article, 'author') is self.Person
+        assert get_related_model(self.Person, 'articles') is self.Article
+        assert is_like_list(self.Person, 'articles')
+        assert not is_like_list(self.Article(), 'author')
+        assert is_relationship(self.Article, 'tags')
+        assert not is_relationship(self.Article, 'tag_names')
+        assert foreign_keys(self.Article) == ['author_id']
+        assert primary_key_names(self.Person) == ['id']
+        assert isinstance(get_field_type(self.Person, 'birthday'), Date)
+        assert get_field_type(self.Person, 'articles') is None
+        assert has_field(self.Person, 'name')
+        assert has_field(self.Person, 'nickname')
+        assert not has_field(self.Person, 'upper_name')
+        assert not has_field(self.Person, 'bogus')
+
+    def test_returned_lists_are_copies(self):
+        """Tests that modifying a list returned by a helper function
+        does not modify the cached information.
+
+        """
+        foreign_keys(self.Article).append('bogus')
+        primary_key_names(self.Article).append('bogus')
+        assert foreign_keys(self.Article) == ['author_id']
+        assert primary_key_names(self.Article) == ['id']
+
+    def test_reconfigured_mappers(self):
+        """Tests that the cached information is discarded when a new
+        model adds a relationship (via a backref) to an existing model.
+
+        """
+        assert set(get_relations(self.Person)) == set(['articles'])
+
+        class Comment(self.Base):
+            __tablename__ = 'comment'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(self.Person, backref=backref('comments'))
+
+        assert set(get_relations(self.Person)) == set(['articles', 'comments'])
+        assert get_related_model(self.Person, 'comments') is Comment
+
+
+class TestLRUCache(TestCase):
+    """Tests for the :class:`~flask_restless.helpers.LRUCache` class."""
+
+    def test_evicts_least_recently_used(self):
+        """Tests that the least recently used entry is discarded when the
+        cache is full.
+
+        """
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        assert cache.get('a') == 1
+        cache['c'] = 3
+        assert len(cache) == 2
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+        assert (cache.hits, cache.misses) == (2, 1)
+
+    def test_replace(self):
+        """Tests that replacing an entry does not evict another."""
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a'] = 3
+        assert len(cache) == 2
+        assert cache.get('a') == 3
+        assert cache.get('b') == 2
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_byte_budget(self):
+        """Tests that entries are discarded while the total size of the
+        values exceeds the budget.
+
+        """
+        cache = LRUCache(maxsize=None, maxbytes=5)
+        cache['a'] = 'xx'
+        cache['b'] = 'yy'
+        cache['c'] = 'zz'
+        assert 'a' not in cache
+        assert (cache.size, cache.evictions) == (4, 1)
+        # A value larger than the budget is not stored at all.
+        cache['d'] = 'xxxxxx'
+        assert 'd' not in cache
+        assert len(cache) == 2
+        del cache['b']
+        assert (len(cache), cache.size) == (1, 2)
+
+
+class TestGetAllBy(ManagerTestBase):
+    """Tests for fetching many instances by primary key at once."""
+
+    def setUp(self):
+        super(TestGetAllBy, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+
+        class Tag(self.Base):
+            __tablename__ = 'tag'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode, unique=True)
+
+        self.Person = Person
+        self.Tag = Tag
+        self.Base.metadata.create_all()
+        self.manager.create_api(Person)
+        self.manager.create_api(Tag)
+        self.session.add_all([Person(id=i) for i in range(1, 6)])
+        self.session.add_all([Tag(id=1, name=u'a'), Tag(id=2, name=u'b')])
+        self.session.commit()
+        # Count the queries made from here on.
+        self.statements = []
+
+        def record(conn, cursor, statement, *args):
+            self.statements.append(statement)
+
+        event.listen(self.Base.metadata.bind, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, self.Base.metadata.bind,
+                        'before_cursor_execute', record)
+
+    def test_order_and_missing(self):
+        """Tests that the instances are returned in the order of the
+        given primary keys, with ``None`` for each one that does not
+        exist, using a single query.
+
+        """
+        self.session.expire_all()
+        people = get_all_by(self.session, self.Person, ['3', 10, '1', 3])
+        assert [p and p.id for p in people] == [3, None, 1, 3]
+        assert len(self.statements) == 1
+
+    def test_identity_map(self):
+        """Tests that instances already in the session are not fetched
+        again.
+
+        """
+        person = self.session.query(self.Person).get(2)
+        del self.statements[:]
+        people = get_all_by(self.session, self.Person, ['2'])
+        assert people == [person]
+        assert len(self.statements) == 0
+
+    def test_chunks(self):
+        """Tests that the primary keys are split among several queries
+        when there are more of them than the chunk size.
+
+        """
+        self.session.expire_all()
+        people = get_all_by(self.session, self.Person, range(1, 6),
+                            chunk_size=2)
+        assert [p.id for p in people] == [1, 2, 3, 4, 5]
+        assert len(self.statements) == 3
+
+    def test_other_primary_key(self):
+        """Tests for fetching instances by a column other than the
+        primary key of the mapper.
+
+        """
+        tags = get_all_by(self.session, self.Tag, [u'b', u'c'],
+                          primary_key='name')
+        assert [t and t.id for t in tags] == [2, None]
+
+    def test_datetime_primary_key(self):
+        """Tests that primary keys of types that cannot be constructed
+        from a string, like dates and times, are parsed so that the
+        fetched instances are found.
+
+        """
+        class Event(self.Base):
+            __tablename__ = 'event'
+            time = Column(DateTime, primary_key=True)
+
+        self.Base.metadata.create_all()
+        self.manager.create_api(Event)
+        self.session.add(Event(time=datetime(2016, 1, 1, 12, 0, 0)))
+        self.session.commit()
+        self.session.expire_all()
+        events = get_all_by(self.session, Event,
+                            ['2016-01-01T12:00:00', '2016-01-02T12:00:00'])
+        assert [e and e.time for e in events] == \
+            [datetime(2016, 1, 1, 12, 0, 0), None]
+
+    def test_resolve_identifiers(self):
+        """Tests that identifiers are grouped by model, with one query
+        for each model.
+
+        """
+        self.session.expire_all()
+        identifiers = [(self.Tag, 2), (self.Person, 4), (self.Tag, 3),
+                       (self.Person, 1)]
+        instances = resolve_identifiers(self.session, identifiers)
+        assert [type(i) for i in instances] == \
+            [self.Tag, self.Person, type(None), self.Person]
+        assert [i and i.id for i in instances] == [2, 4, None, 1]
+        assert len(self.statements) == 2
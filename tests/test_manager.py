@@ -25,6 +25,7 @@ from flask_restless import collection_name
 from flask_restless import DefaultSerializer
 from flask_restless import IllegalArgumentError
 from flask_restless import model_for
+from flask_restless import primary_key_for
 from flask_restless import serializer_for
 from flask_restless import url_for
 
@@ -417,6 +418,68 @@ class TestAPIManager(ManagerTestBase):
         assert collection_name(model_for('people')) == 'people'
         assert model_for(collection_name(self.Person)) is self.Person
 
+    def test_model_for_before_create_api(self):
+        """Tests that a failed lookup by :func:`flask_restless.model_for`
+        does not prevent a successful lookup after the API is created.
+
+        """
+        with self.assertRaises(ValueError):
+            model_for('people')
+        self.manager.create_api(self.Person, collection_name='people')
+        assert model_for('people') is self.Person
+
+    def test_collection_name_before_create_api(self):
+        """Tests that a failed lookup by
+        :func:`flask_restless.collection_name` does not prevent a
+        successful lookup after the API is created.
+
+        """
+        with self.assertRaises(ValueError):
+            collection_name(self.Person)
+        self.manager.create_api(self.Person, collection_name='people')
+        assert collection_name(self.Person) == 'people'
+
+    def test_primary_key_for(self):
+        """Tests the global :func:`flask_restless.primary_key_for`
+        function for both models and instances.
+
+        """
+        self.manager.create_api(self.Person)
+        self.manager.create_api(self.Article, primary_key='title')
+        self.manager.create_api(self.Tag)
+        assert primary_key_for(self.Person) == 'id'
+        assert primary_key_for(self.Article) == 'title'
+        assert primary_key_for(self.Tag()) == 'name'
+
+    def test_primary_key_for_nonexistent(self):
+        """Tests that attempting to get the primary key for an unknown
+        model yields an error.
+
+        """
+        with self.assertRaises(ValueError):
+            primary_key_for(self.Person)
+
+    def test_forgotten_manager(self):
+        """Tests that the global helper functions no longer know about
+        the APIs created by an :class:`APIManager` that has been removed
+        from the set of known managers.
+
+        """
+        self.manager.create_api(self.Person, collection_name='people')
+        assert collection_name(self.Person) == 'people'
+        model_for.created_managers.clear()
+        with self.assertRaises(ValueError):
+            collection_name(self.Person)
+        with self.assertRaises(ValueError):
+            model_for('people')
+
+    def test_manager_model_for(self):
+        """Tests the :meth:`APIManager.model_for` method."""
+        self.manager.create_api(self.Person, collection_name='people')
+        assert self.manager.model_for('people') is self.Person
+        with self.assertRaises(ValueError):
+            self.manager.model_for('articles')
+
     def test_disallowed_methods(self):
         """Tests that disallowed methods respond with :http:status:`405`."""
         self.manager.create_api(self.Person, methods=[])
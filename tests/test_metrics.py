@@ -0,0 +1,226 @@
+# test_metrics.py - unit tests for the metrics endpoint
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Unit tests for recording metrics of requests and exposing them in the
+text format of Prometheus.
+
+"""
+import threading
+
+from flask import abort
+from sqlalchemy import Column
+from sqlalchemy import ForeignKey
+from sqlalchemy import Integer
+from sqlalchemy.orm import relationship
+
+from flask_restless import APIManager
+from flask_restless import Metrics
+from flask_restless import ResponseCache
+
+from .helpers import ManagerTestBase
+
+
+def parse(text):
+    """Returns a dictionary mapping each sample in the specified text
+    format of Prometheus to its value.
+
+    """
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+class TestMetrics(ManagerTestBase):
+    """Tests for the :class:`~flask_restless.Metrics` class and the
+    metrics endpoint.
+
+    """
+
+    def setUp(self):
+        super(TestMetrics, self).setUp()
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship('Person')
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.metrics = Metrics()
+        self.cache = ResponseCache()
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  metrics=self.metrics)
+        self.manager.create_api(Article, methods=['GET', 'POST'],
+                                allow_functions=True)
+        self.manager.create_api(Person, response_cache=self.cache)
+
+    def scrape(self):
+        """Returns the samples exposed by the metrics endpoint."""
+        response = self.app.get('/api/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        return parse(response.data.decode('utf-8'))
+
+    def test_requests(self):
+        """Tests that requests are counted by endpoint and status."""
+        self.session.add(self.Article(id=1))
+        self.session.commit()
+        self.app.get('/api/article')
+        self.app.get('/api/article/1')
+        self.app.get('/api/article/2')
+        self.app.get('/api/eval/article?functions=[]')
+        samples = self.scrape()
+        labels = '{{collection="article",endpoint="{0}",method="GET",' \
+                 'status="{1}"}}'
+        prefix = 'flask_restless_requests_total'
+        assert samples[prefix + labels.format('collection', 200)] == 1
+        assert samples[prefix + labels.format('resource', 200)] == 1
+        assert samples[prefix + labels.format('resource', 404)] == 1
+        assert samples[prefix + labels.format('eval', 200)] == 1
+
+    def test_http_exception(self):
+        """Tests that a request aborted with an HTTP error is counted with
+        the status code of the error.
+
+        """
+
+        def forbid(**kw):
+            abort(403)
+
+        preprocessors = dict(GET_COLLECTION=[forbid])
+        self.manager.create_api(self.Person, url_prefix='/api2',
+                                preprocessors=preprocessors)
+        response = self.app.get('/api2/person')
+        assert response.status_code == 403
+        samples = self.scrape()
+        labels = '{{collection="person",endpoint="collection",method="GET",' \
+                 'status="{0}"}}'
+        prefix = 'flask_restless_requests_total'
+        assert samples[prefix + labels.format(403)] == 1
+        assert prefix + labels.format(500) not in samples
+
+    def test_latency_histogram(self):
+        """Tests that the latency histogram has cumulative buckets."""
+        self.app.get('/api/article')
+        self.app.get('/api/article')
+        samples = self.scrape()
+        labels = 'collection="article",endpoint="collection",method="GET"'
+        prefix = 'flask_restless_request_duration_seconds'
+        assert samples['{0}_count{{{1}}}'.format(prefix, labels)] == 2
+        assert samples['{0}_sum{{{1}}}'.format(prefix, labels)] > 0
+        bucket = '{0}_bucket{{{1},le="{2}"}}'
+        counts = [samples[bucket.format(prefix, labels, float(bound))]
+                  for bound in self.metrics.buckets]
+        assert counts == sorted(counts)
+        assert samples[bucket.format(prefix, labels, '+Inf')] == 2
+
+    def test_sizes(self):
+        """Tests that the numbers of primary and included resources, the
+        size of the response, and the time spent counting are recorded.
+
+        """
+        person = self.Person(id=1)
+        articles = [self.Article(id=i, author=person) for i in range(3)]
+        self.session.add_all(articles)
+        self.session.commit()
+        response = self.app.get('/api/article?include=author')
+        samples = self.scrape()
+        labels = '{collection="article",endpoint="collection",method="GET"}'
+        prefix = 'flask_restless_'
+        assert samples[prefix + 'rows_returned_total' + labels] == 3
+        assert samples[prefix + 'included_resources_total' + labels] == 1
+        assert samples[prefix + 'response_bytes_total' + labels] == \
+            len(response.data)
+        assert samples[prefix + 'count_query_seconds_total' + labels] > 0
+
+    def test_cache(self):
+        """Tests that the hits and misses of caches are exposed."""
+        self.app.get('/api/person')
+        self.app.get('/api/person')
+        samples = self.scrape()
+        labels = '{cache="response",index="0"}'
+        assert samples['flask_restless_cache_hits_total' + labels] == 1
+        assert samples['flask_restless_cache_misses_total' + labels] == 1
+        assert samples['flask_restless_cache_hit_ratio' + labels] == 0.5
+
+    def test_threads(self):
+        """Tests that requests recorded by several threads are merged."""
+        labels = ('person', 'collection', 'GET')
+
+        def record():
+            for i in range(100):
+                self.metrics.record(labels, 200, 0.001, {'rows': 2})
+
+        threads = [threading.Thread(target=record) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        samples = parse(self.metrics.exposition())
+        labels = '{collection="person",endpoint="collection",method="GET"'
+        assert samples['flask_restless_requests_total' + labels +
+                       ',status="200"}'] == 400
+        assert samples['flask_restless_rows_returned_total' + labels +
+                       '}'] == 800
+
+    def test_exited_threads(self):
+        """Tests that the shards of threads that have exited are folded
+        into the totals without losing their requests.
+
+        """
+        labels = ('person', 'collection', 'GET')
+
+        def record():
+            self.metrics.record(labels, 200, 0.001, {'rows': 2})
+
+        for i in range(20):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        samples = parse(self.metrics.exposition())
+        assert len(self.metrics._shards) == 0
+        labels = '{collection="person",endpoint="collection",method="GET"'
+        assert samples['flask_restless_requests_total' + labels +
+                       ',status="200"}'] == 20
+        assert samples['flask_restless_rows_returned_total' + labels +
+                       '}'] == 40
+        assert samples['flask_restless_request_duration_seconds_count' +
+                       labels + '}'] == 20
+        # Collecting again does not count the folded shards twice.
+        samples = parse(self.metrics.exposition())
+        assert samples['flask_restless_requests_total' + labels +
+                       ',status="200"}'] == 20
+
+    def test_escape(self):
+        """Tests that label values are escaped."""
+        self.metrics.record(('a"b\\c', 'collection', 'GET'), 200, 0, {})
+        text = self.metrics.exposition()
+        assert 'collection="a\\"b\\\\c"' in text
+
+    def test_disabled(self):
+        """Tests that the metrics endpoint does not exist unless metrics
+        are recorded.
+
+        """
+        manager = APIManager(self.flaskapp, session=self.session,
+                             url_prefix='/api2')
+        manager.create_api(self.Person)
+        response = self.app.get('/api2/metrics')
+        assert response.status_code == 404
@@ -0,0 +1,198 @@
+# test_operations.py - unit tests for the atomic operations endpoint
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Unit tests for performing many operations in a single request via
+the atomic operations endpoint.
+
+"""
+from sqlalchemy import Column
+from sqlalchemy import ForeignKey
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy import event
+from sqlalchemy.orm import backref
+from sqlalchemy.orm import relationship
+
+from flask_restless import APIManager
+
+from .helpers import dumps
+from .helpers import loads
+from .helpers import ManagerTestBase
+
+
+class TestOperations(ManagerTestBase):
+    """Tests for the atomic operations endpoint."""
+
+    def setUp(self):
+        super(TestOperations, self).setUp()
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            title = Column(Unicode)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship('Person', backref=backref('articles'))
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode, unique=True)
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  atomic_operations=True)
+        self.manager.create_api(Article, methods=['POST', 'PATCH', 'DELETE'])
+        self.manager.create_api(Person, methods=['POST', 'PATCH'],
+                                allow_delete_from_to_many_relationships=True)
+
+    def operations(self, *operations):
+        """Returns the response to a request with the specified
+        operations.
+
+        """
+        document = {'atomic:operations': list(operations)}
+        return self.app.post('/api/operations', data=dumps(document))
+
+    def test_disabled(self):
+        """Tests that the endpoint does not exist unless it is enabled."""
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  url_prefix='/api2')
+        self.manager.create_api(self.Article, methods=['POST'])
+        response = self.app.post('/api2/operations', data=dumps({}))
+        assert response.status_code == 404
+
+    def test_local_ids(self):
+        """Tests that resources created by earlier operations can be
+        referred to by their local IDs, and that the results are given in
+        the order of the operations.
+
+        """
+        response = self.operations(
+            {'op': 'add',
+             'data': {'type': 'person', 'lid': 'p',
+                      'attributes': {'name': u'foo'}}},
+            {'op': 'add',
+             'data': {'type': 'article', 'lid': 'a',
+                      'attributes': {'title': u'bar'},
+                      'relationships': {
+                          'author': {'data': {'type': 'person',
+                                              'lid': 'p'}}}}},
+            {'op': 'update',
+             'data': {'type': 'article', 'lid': 'a',
+                      'attributes': {'title': u'baz'}}},
+            {'op': 'add',
+             'data': {'type': 'article', 'attributes': {'title': u'qux'}}},
+            {'op': 'add',
+             'ref': {'type': 'person', 'lid': 'p',
+                     'relationship': 'articles'},
+             'data': [{'type': 'article', 'id': '2'}]})
+        assert response.status_code == 200
+        results = loads(response.data)['atomic:results']
+        assert len(results) == 5
+        assert results[0]['data']['type'] == 'person'
+        assert results[1]['data']['id'] == '1'
+        assert results[2] == {}
+        assert results[3]['data']['id'] == '2'
+        assert results[4] == {}
+        person = self.session.query(self.Person).one()
+        assert sorted(a.title for a in person.articles) == [u'baz', u'qux']
+
+    def test_single_commit(self):
+        """Tests that all operations are committed in a single
+        transaction.
+
+        """
+        commits = []
+
+        def record(session):
+            commits.append(session)
+
+        event.listen(self.session, 'after_commit', record)
+        self.addCleanup(event.remove, self.session, 'after_commit', record)
+        self.session.add(self.Article(id=1))
+        self.session.commit()
+        del commits[:]
+        response = self.operations(
+            {'op': 'add', 'data': {'type': 'person'}},
+            {'op': 'update',
+             'ref': {'type': 'article', 'id': '1',
+                     'relationship': 'author'},
+             'data': {'type': 'person', 'id': '1'}},
+            {'op': 'remove', 'ref': {'type': 'article', 'id': '1'}})
+        assert response.status_code == 200
+        assert len(commits) == 1
+        assert self.session.query(self.Article).count() == 0
+        assert self.session.query(self.Person).count() == 1
+
+    def test_rollback(self):
+        """Tests that if an operation fails, none of the operations are
+        performed and the error refers to the failed operation.
+
+        """
+        response = self.operations(
+            {'op': 'add',
+             'data': {'type': 'person', 'attributes': {'name': u'foo'}}},
+            {'op': 'add',
+             'data': {'type': 'article', 'attributes': {'bogus': 1}}})
+        assert response.status_code == 400
+        errors = loads(response.data)['errors']
+        assert len(errors) == 1
+        pointer = errors[0]['source']['pointer']
+        assert pointer.startswith('/atomic:operations/1')
+        assert self.session.query(self.Person).count() == 0
+
+    def test_conflict_on_flush(self):
+        """Tests that a database error in a later operation rolls back
+        the earlier operations.
+
+        """
+        response = self.operations(
+            {'op': 'add',
+             'data': {'type': 'person', 'attributes': {'name': u'foo'}}},
+            {'op': 'add',
+             'data': {'type': 'person', 'attributes': {'name': u'foo'}}})
+        assert response.status_code == 409
+        assert self.session.query(self.Person).count() == 0
+
+    def test_method_not_allowed(self):
+        """Tests that operations are subject to the methods allowed by
+        each API.
+
+        """
+        self.session.add(self.Person(id=1))
+        self.session.commit()
+        response = self.operations(
+            {'op': 'remove', 'ref': {'type': 'person', 'id': '1'}})
+        assert response.status_code == 405
+
+    def test_unknown_local_id(self):
+        """Tests that referring to an unknown local ID yields an error."""
+        response = self.operations(
+            {'op': 'update',
+             'data': {'type': 'article', 'lid': 'bogus',
+                      'attributes': {'title': u'foo'}}})
+        assert response.status_code == 400
+        error = loads(response.data)['errors'][0]
+        assert error['source']['pointer'] == '/atomic:operations/0/data/lid'
+
+    def test_malformed(self):
+        """Tests that malformed requests yield errors."""
+        response = self.operations({'op': 'bogus'})
+        assert response.status_code == 400
+        error = loads(response.data)['errors'][0]
+        assert error['source']['pointer'] == '/atomic:operations/0/op'
+        response = self.operations(
+            {'op': 'add', 'data': {'type': 'bogus'}})
+        assert response.status_code == 400
+        response = self.app.post('/api/operations', data=dumps({}))
+        assert response.status_code == 400
@@ -0,0 +1,99 @@
+# test_profiling.py - unit tests for the sampling profiler
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Unit tests for profiling a sample of the requests to each endpoint."""
+import os
+import pstats
+import shutil
+import tempfile
+
+from sqlalchemy import Column
+from sqlalchemy import Integer
+
+from flask_restless import APIManager
+from flask_restless import SamplingProfiler
+
+from .helpers import ManagerTestBase
+
+
+class TestSamplingProfiler(ManagerTestBase):
+    """Tests for the :class:`~flask_restless.SamplingProfiler` class."""
+
+    def setUp(self):
+        super(TestSamplingProfiler, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.profiler = SamplingProfiler(every=3)
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  profiler=self.profiler)
+        self.manager.create_api(Person)
+
+    def test_sampling(self):
+        """Tests that one in every so many requests to each endpoint is
+        profiled.
+
+        """
+        self.session.add(self.Person(id=1))
+        self.session.commit()
+        for i in range(7):
+            self.app.get('/api/person')
+        for i in range(2):
+            self.app.get('/api/person/1')
+        samples = self.profiler.samples()
+        assert samples == {('person', 'collection', 'GET'): 3,
+                           ('person', 'resource', 'GET'): 1}
+
+    def test_report(self):
+        """Tests that the report lists the hot functions of each
+        endpoint.
+
+        """
+        self.app.get('/api/person')
+        report = self.profiler.report(limit=100)
+        assert 'GET person collection (1 requests)' in report
+        assert 'serialize_many' in report
+
+    def test_dump(self):
+        """Tests that the statistics of each endpoint can be written to
+        files that :mod:`pstats` can read.
+
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.app.get('/api/person')
+        paths = self.profiler.dump(directory)
+        assert paths == [os.path.join(directory,
+                                      'person.collection.GET.pstats')]
+        stats = pstats.Stats(paths[0])
+        assert stats.total_calls > 0
+
+    def test_reset(self):
+        """Tests that the statistics can be discarded."""
+        self.app.get('/api/person')
+        self.profiler.reset()
+        assert self.profiler.samples() == {}
+        assert self.profiler.report() == ''
+
+    def test_disabled(self):
+        """Tests that requests are not profiled unless a
+        :class:`~flask_restless.SamplingProfiler` is provided.
+
+        """
+        manager = APIManager(self.flaskapp, session=self.session)
+        manager.create_api(self.Person, url_prefix='/api2')
+        response = self.app.get('/api2/person')
+        assert response.status_code == 200
+        assert self.profiler.samples() == {}
@@ -0,0 +1,137 @@
+# test_slowlog.py - unit tests for the slow request log
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Unit tests for logging the requests that take longer than a
+threshold.
+
+"""
+import json
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+
+from flask_restless import APIManager
+from flask_restless import SlowRequestLog
+
+from .helpers import dumps
+from .helpers import ManagerTestBase
+
+
+class TestSlowRequestLog(ManagerTestBase):
+    """Tests for the :class:`~flask_restless.SlowRequestLog` class."""
+
+    def setUp(self):
+        super(TestSlowRequestLog, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.records = []
+        self.log = SlowRequestLog(threshold=0, callback=self.records.append,
+                                  explain_rate=1)
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  slow_request_log=self.log)
+        self.manager.create_api(Person, methods=['GET', 'POST'])
+
+    def test_record(self):
+        """Tests that a slow request is logged with its normalized
+        parameters, its SQL statements, and the plan of its query.
+
+        """
+        self.session.add(self.Person(id=1, name=u'foo'))
+        self.session.commit()
+        filters = [{'name': 'name', 'op': 'eq', 'val': 'foo'}]
+        query_string = {'filter[objects]': dumps(filters),
+                        'sort': 'name,-id', 'page[size]': '5'}
+        response = self.app.get('/api/person', query_string=query_string)
+        assert response.status_code == 200
+        assert len(self.records) == 1
+        record = self.records[0]
+        assert record['method'] == 'GET'
+        assert record['path'] == '/api/person'
+        assert record['collection'] == 'person'
+        assert record['status'] == 200
+        assert record['duration'] >= 0
+        assert record['parameters'] == {'filter[objects]': filters,
+                                        'sort': ['name', '-id'],
+                                        'page[size]': 5}
+        statements = record['statements']
+        assert len(statements) >= 2
+        assert any(s['statement'].startswith('SELECT count(*)')
+                   for s in statements)
+        assert all(s['duration'] >= 0 for s in statements)
+        # SQLite explains a query with rows of the form (id, parent,
+        # notused, detail).
+        plan = record['explain']
+        assert len(plan) >= 1
+        assert 'person' in ' '.join(str(row[-1]) for row in plan)
+        # The record can be encoded as JSON.
+        json.dumps(record)
+
+    def test_threshold(self):
+        """Tests that requests faster than the threshold are not
+        logged.
+
+        """
+        self.log.threshold = 60
+        self.app.get('/api/person')
+        assert self.records == []
+
+    def test_no_explain(self):
+        """Tests that the query plan is included only in a sample of the
+        records.
+
+        """
+        self.log.explain_rate = 0
+        self.app.get('/api/person')
+        assert 'explain' not in self.records[0]
+
+    def test_no_query(self):
+        """Tests that requests that do not search a collection are logged
+        without a query plan.
+
+        """
+        data = dict(data=dict(type='person', attributes=dict(name=u'foo')))
+        response = self.app.post('/api/person', data=dumps(data))
+        assert response.status_code == 201
+        record = self.records[0]
+        assert record['method'] == 'POST'
+        assert record['status'] == 201
+        assert any(s['statement'].startswith('INSERT')
+                   for s in record['statements'])
+        assert 'explain' not in record
+
+    def test_file(self):
+        """Tests that records are written as lines of JSON to a file."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'slow.log')
+        log = SlowRequestLog(threshold=0, path=path)
+        self.addCleanup(log.close)
+        manager = APIManager(self.flaskapp, session=self.session,
+                             slow_request_log=log)
+        manager.create_api(self.Person, url_prefix='/api2')
+        self.app.get('/api2/person')
+        self.app.get('/api2/person?include=')
+        with open(path) as f:
+            lines = f.readlines()
+        assert len(lines) == 2
+        record = json.loads(lines[1])
+        assert record['path'] == '/api2/person'
+        assert record['parameters'] == {'include': ['']}
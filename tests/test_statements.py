@@ -0,0 +1,214 @@
+# test_statements.py - unit tests for counting SQL statements
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Unit tests for counting the SQL statements executed by each request
+and detecting probable N + 1 queries.
+
+"""
+import logging
+
+from sqlalchemy import Column
+from sqlalchemy import ForeignKey
+from sqlalchemy import Integer
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import relationship
+
+from flask_restless import APIManager
+from flask_restless import StatementCounter
+from flask_restless.statements import normalize
+
+from .helpers import loads
+from .helpers import ManagerTestBase
+
+
+class ListHandler(logging.Handler):
+    """A logging handler that stores the records it handles."""
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestStatementCounter(ManagerTestBase):
+    """Tests for the :class:`~flask_restless.StatementCounter` class."""
+
+    def setUp(self):
+        super(TestStatementCounter, self).setUp()
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship('Person')
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.counter = StatementCounter()
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  statement_counter=self.counter)
+        self.manager.create_api(Article)
+        self.manager.create_api(Person)
+        # Capture the log messages of the application instead of printing
+        # them, and add the summary to the response only where required.
+        self.handler = ListHandler()
+        self.flaskapp.logger.handlers = [self.handler]
+        self.flaskapp.logger.setLevel(logging.DEBUG)
+        self.flaskapp.logger.disabled = False
+        self.flaskapp.debug = False
+
+    def add_articles(self, n):
+        """Adds `n` articles, each with its own author, and clears the
+        session so that the authors must be loaded again.
+
+        """
+        for i in range(n):
+            self.session.add(self.Article(id=i, author=self.Person(id=i)))
+        self.session.commit()
+        self.session.close()
+
+    def test_header(self):
+        """Tests that the number of statements is reported in the
+        response headers.
+
+        """
+        self.add_articles(2)
+        response = self.app.get('/api/article')
+        assert response.status_code == 200
+        # One statement counts the articles, at least one fetches them,
+        # and one fetches the author of each article.
+        assert int(response.headers['X-Statement-Count']) >= 4
+        assert float(response.headers['X-Statement-Duration']) >= 0
+        document = loads(response.data)
+        assert 'statements' not in document['meta']
+
+    def test_n_plus_one(self):
+        """Tests that loading a relationship once per resource is logged
+        as a probable N + 1 query with the responsible relationship.
+
+        """
+        self.add_articles(6)
+        response = self.app.get('/api/article')
+        assert response.status_code == 200
+        warnings = [record for record in self.handler.records
+                    if record.levelno == logging.WARNING]
+        assert len(warnings) == 1
+        message = warnings[0].getMessage()
+        assert 'probable N + 1 query executed 6 times' in message
+        assert 'Article.author' in message
+
+    def test_no_n_plus_one(self):
+        """Tests that a request below the threshold is logged only as a
+        debug message.
+
+        """
+        self.add_articles(2)
+        self.app.get('/api/article')
+        levels = [record.levelno for record in self.handler.records]
+        assert levels == [logging.DEBUG]
+        assert 'SQL statements' in self.handler.records[0].getMessage()
+
+    def test_meta_in_debug_mode(self):
+        """Tests that the summary is added to the response document in
+        debug mode.
+
+        """
+        self.flaskapp.debug = True
+        self.add_articles(6)
+        response = self.app.get('/api/article')
+        document = loads(response.data)
+        summary = document['meta']['statements']
+        assert summary['count'] == int(response.headers['X-Statement-Count'])
+        assert summary['statements'][0]['count'] == 6
+        n_plus_one = summary['n_plus_one']
+        assert len(n_plus_one) == 1
+        assert n_plus_one[0]['count'] == 6
+        assert n_plus_one[0]['models'] == ['Person']
+        assert n_plus_one[0]['relationships'] == ['Article.author']
+        # The rest of the document is unchanged.
+        assert len(document['data']) == 6
+        assert document['meta']['total'] == 6
+
+    def test_meta_with_etag(self):
+        """Tests that the summary is not added to a response document
+        whose entity tag was computed from the unmodified document.
+
+        """
+        self.flaskapp.debug = True
+        self.manager.create_api(self.Article, url_prefix='/api2', etags=True)
+        self.add_articles(1)
+        response = self.app.get('/api2/article')
+        etag = response.headers['ETag']
+        document = loads(response.data)
+        assert 'statements' not in document['meta']
+        response = self.app.get('/api2/article',
+                                headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+    def test_failed_statement(self):
+        """Tests that a statement that fails leaves nothing behind on its
+        pooled connection.
+
+        """
+
+        def fail(**kw):
+            try:
+                self.session.execute('SELECT * FROM bogus')
+            except OperationalError:
+                pass
+
+        self.manager.create_api(self.Person, url_prefix='/api2',
+                                preprocessors={'GET_COLLECTION': [fail]})
+        response = self.app.get('/api2/person')
+        assert response.status_code == 200
+        connection = self.session.connection()
+        assert connection.info == {}
+
+    def test_options(self):
+        """Tests that the headers and the log may be disabled."""
+        self.counter.header = False
+        self.counter.log = False
+        response = self.app.get('/api/article')
+        assert 'X-Statement-Count' not in response.headers
+        assert self.handler.records == []
+
+    def test_disabled(self):
+        """Tests that statements are not counted unless a
+        :class:`~flask_restless.StatementCounter` is provided.
+
+        """
+        manager = APIManager(self.flaskapp, session=self.session)
+        manager.create_api(self.Article, url_prefix='/api2')
+        response = self.app.get('/api2/article')
+        assert response.status_code == 200
+        assert 'X-Statement-Count' not in response.headers
+        assert self.handler.records == []
+
+    def test_normalize(self):
+        """Tests that statements differing only in their bound parameters
+        have the same shape.
+
+        """
+        first = 'SELECT *\n  FROM person WHERE id IN (?, ?, ?)'
+        second = 'SELECT * FROM person WHERE id IN (?)'
+        assert normalize(first) == normalize(second)
+        first = 'SELECT * FROM person WHERE id IN (%(id_1)s, %(id_2)s)'
+        second = 'SELECT * FROM person WHERE id IN (%(id_1)s)'
+        assert normalize(first) == normalize(second)
+        assert normalize('SELECT count(*) FROM person') == \
+            'SELECT count(*) FROM person'
@@ -0,0 +1,164 @@
+# test_timing.py - unit tests for measuring the phases of requests
+#
+# Copyright 2011 Lincoln de Sousa <lincoln@comum.org>.
+# Copyright 2012, 2013, 2014, 2015, 2016 Jeffrey Finkelstein
+#           <jeffrey.finkelstein@gmail.com> and contributors.
+#
+# This file is part of Flask-Restless.
+#
+# Flask-Restless is distributed under both the GNU Affero General Public
+# License version 3 and under the 3-clause BSD license. For more
+# information, see LICENSE.AGPL and LICENSE.BSD.
+"""Unit tests for measuring the time spent in each phase of handling a
+request and reporting it in the :http:header:`Server-Timing` header.
+
+"""
+from flask import request
+from sqlalchemy import Column
+from sqlalchemy import ForeignKey
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy.orm import relationship
+
+from flask_restless import APIManager
+from flask_restless import ServerTiming
+
+from .helpers import ManagerTestBase
+
+
+def names(header):
+    """Returns the list of names of the metrics in the specified value of
+    the :http:header:`Server-Timing` header.
+
+    """
+    return [part.split(';')[0] for part in header.split(', ')]
+
+
+class TestServerTiming(ManagerTestBase):
+    """Tests for the :class:`~flask_restless.ServerTiming` class."""
+
+    def setUp(self):
+        super(TestServerTiming, self).setUp()
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship('Person')
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.metrics = []
+
+        def sink(metrics):
+            self.metrics.append((request.path, metrics))
+
+        self.timing = ServerTiming(sink=sink)
+        self.manager = APIManager(self.flaskapp, session=self.session,
+                                  server_timing=self.timing)
+        self.manager.create_api(Article, allow_functions=True)
+        self.manager.create_api(Person)
+
+    def test_header(self):
+        """Tests that the response reports the duration of each phase of
+        a request for a collection.
+
+        """
+        person = self.Person(id=1)
+        self.session.add_all([person, self.Article(id=1, author=person)])
+        self.session.commit()
+        response = self.app.get('/api/article?include=author')
+        assert response.status_code == 200
+        header = response.headers['Server-Timing']
+        for name in ('parse', 'db', 'paginate', 'count', 'serialize',
+                     'include', 'encode', 'total'):
+            assert name in names(header)
+        assert names(header)[-1] == 'total'
+        # The collection is counted and fetched in separate statements.
+        assert 'db;dur=' in header
+        assert ';desc="' in header.split('db;')[1].split(',')[0]
+
+    def test_sink(self):
+        """Tests that the sink receives the durations of each request."""
+        response = self.app.get('/api/person')
+        assert response.status_code == 200
+        assert len(self.metrics) == 1
+        path, metrics = self.metrics[0]
+        assert path == '/api/person'
+        assert all(duration >= 0 for name, duration, count in metrics)
+        by_name = dict((name, count) for name, duration, count in metrics)
+        assert by_name['total'] == 1
+        total = metrics[-1][1]
+        assert all(duration <= total for name, duration, count in metrics
+                   if name != 'db')
+        assert ServerTiming.format(metrics) == \
+            response.headers['Server-Timing']
+
+    def test_processors(self):
+        """Tests that the durations of preprocessors and postprocessors
+        are reported.
+
+        """
+        def noop(**kw):
+            pass
+
+        self.manager.create_api(self.Person, url_prefix='/api2',
+                                preprocessors={'GET_COLLECTION': [noop]},
+                                postprocessors={'GET_COLLECTION': [noop]})
+        response = self.app.get('/api2/person')
+        header = response.headers['Server-Timing']
+        assert 'preprocessors' in names(header)
+        assert 'postprocessors' in names(header)
+
+    def test_error(self):
+        """Tests that error responses are measured too."""
+        response = self.app.get('/api/person/1')
+        assert response.status_code == 404
+        assert 'total' in names(response.headers['Server-Timing'])
+
+    def test_function_evaluation(self):
+        """Tests that requests to the function evaluation endpoint are
+        measured.
+
+        """
+        self.session.add(self.Article(id=1))
+        self.session.commit()
+        response = self.app.get('/api/eval/article?functions=[]')
+        assert response.status_code == 200
+        header = response.headers['Server-Timing']
+        assert 'encode' in names(header)
+        assert 'total' in names(header)
+
+    def test_no_header(self):
+        """Tests that the durations may be sent only to the sink."""
+        self.timing.header = False
+        response = self.app.get('/api/person')
+        assert 'Server-Timing' not in response.headers
+        assert len(self.metrics) == 1
+
+    def test_disabled(self):
+        """Tests that requests are not measured unless a
+        :class:`~flask_restless.ServerTiming` is provided.
+
+        """
+        manager = APIManager(self.flaskapp, session=self.session)
+        manager.create_api(self.Person, url_prefix='/api2')
+        response = self.app.get('/api2/person')
+        assert response.status_code == 200
+        assert 'Server-Timing' not in response.headers
+        assert self.metrics == []
+
+    def test_format(self):
+        """Tests the format of the :http:header:`Server-Timing` header."""
+        spans = [('db', 0.001), ('encode', 0.0005), ('db', 0.002)]
+        metrics = ServerTiming.metrics(spans)
+        assert [(name, count) for name, duration, count in metrics] == \
+            [('db', 2), ('encode', 1)]
+        assert ServerTiming.format(metrics) == \
+            'db;dur=3.000;desc="2", encode;dur=0.500'
@@ -37,12 +37,15 @@ from sqlalchemy import func
 from sqlalchemy import Integer
 from sqlalchemy import Time
 from sqlalchemy import Unicode
+from sqlalchemy import event
+from sqlalchemy import literal_column
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref
 from sqlalchemy.orm import relationship
 
 from flask_restless import APIManager
+from flask_restless import IllegalArgumentError
 from flask_restless import JSONAPI_MIMETYPE
 from flask_restless import ProcessingException
 
@@ -962,6 +965,438 @@ class TestUpdating(ManagerTestBase):
                                          'must be a JSON string'])
 
 
+class TestPatchMany(ManagerTestBase):
+    """Tests for updating many resources matching a filter with a single
+    request.
+
+    """
+
+    def setUp(self):
+        super(TestPatchMany, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+            age = Column(Integer)
+            birth_datetime = Column(DateTime)
+
+            @hybrid_property
+            def nickname(self):
+                return self.name
+
+            @nickname.setter
+            def nickname(self, value):
+                self.name = value
+
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.session.add_all([Person(id=i, age=i * 10) for i in range(1, 6)])
+        self.session.commit()
+        self.manager.create_api(Person, methods=['GET', 'PATCH'],
+                                allow_patch_many=True, max_bulk_rows=4)
+
+    def patch_many(self, filters, attributes, url='/api/person'):
+        """Returns the response to a request to update the people
+        matching `filters` with the specified attributes.
+
+        """
+        data = {'data': {'type': 'person', 'attributes': attributes}}
+        query_string = {'filter[objects]': dumps(filters)}
+        return self.app.patch(url, data=dumps(data),
+                              query_string=query_string)
+
+    def test_update(self):
+        """Tests that only the resources matching the filters are
+        updated, and the number of updated resources is in the metadata.
+
+        """
+        person = self.session.query(self.Person).get(1)
+        filters = [dict(name='age', op='lt', val=35)]
+        attributes = {'name': u'foo', 'birth_datetime': '1900-01-02'}
+        response = self.patch_many(filters, attributes)
+        assert response.status_code == 200
+        document = loads(response.data)
+        assert document['meta']['total'] == 3
+        # Instances already in the session are not stale.
+        assert person.name == u'foo'
+        people = self.session.query(self.Person).order_by(self.Person.id)
+        assert [p.name for p in people] == [u'foo'] * 3 + [None] * 2
+        assert people[0].birth_datetime == datetime(1900, 1, 2)
+
+    def test_max_rows(self):
+        """Tests that a request that would update more resources than
+        allowed is rejected without updating any of them.
+
+        """
+        response = self.patch_many([], {'name': u'foo'})
+        check_sole_error(response, 400, ['at most', '4'])
+        assert self.session.query(self.Person).filter_by(name=u'foo').count() \
+            == 0
+
+    def test_not_enabled(self):
+        """Tests that updating many resources is not allowed unless it is
+        enabled.
+
+        """
+        self.manager.create_api(self.Person, methods=['PATCH'],
+                                url_prefix='/api2')
+        response = self.patch_many([], {'name': u'foo'}, url='/api2/person')
+        assert response.status_code == 405
+
+    def test_bad_request(self):
+        """Tests that relationships, fields that are not columns, and
+        invalid filters are rejected.
+
+        """
+        filters = [dict(name='id', op='eq', val=1)]
+        response = self.patch_many(filters, {'bogus': 1})
+        check_sole_error(response, 400, ['does not have field', 'bogus'])
+        response = self.patch_many(filters, {'nickname': u'foo'})
+        check_sole_error(response, 400, ['does not have field', 'nickname'])
+        response = self.patch_many([dict(name='bogus', op='eq', val=1)],
+                                   {'name': u'foo'})
+        check_sole_error(response, 400, ['invalid filter object', 'bogus'])
+        data = {'data': {'type': 'person',
+                         'relationships': {'articles': {'data': []}}}}
+        response = self.app.patch('/api/person', data=dumps(data))
+        check_sole_error(response, 400, ['relationships'])
+        data = {'data': {'type': 'bogus', 'attributes': {'name': u'foo'}}}
+        response = self.app.patch('/api/person', data=dumps(data))
+        assert response.status_code == 409
+
+    def test_processors(self):
+        """Tests that the preprocessors and postprocessors are applied
+        once per request.
+
+        """
+        calls = []
+
+        def preprocessor(filters=None, data=None, **kw):
+            calls.append('pre')
+            filters.append(dict(name='id', op='eq', val=2))
+
+        def postprocessor(result=None, filters=None, **kw):
+            calls.append('post')
+            result['meta']['foo'] = 'bar'
+
+        preprocessors = dict(PATCH_COLLECTION=[preprocessor])
+        postprocessors = dict(PATCH_COLLECTION=[postprocessor])
+        self.manager.create_api(self.Person, methods=['PATCH'],
+                                url_prefix='/api2', allow_patch_many=True,
+                                preprocessors=preprocessors,
+                                postprocessors=postprocessors)
+        response = self.patch_many([], {'age': 0}, url='/api2/person')
+        assert response.status_code == 200
+        assert loads(response.data)['meta'] == {'total': 1, 'foo': 'bar'}
+        assert calls == ['pre', 'post']
+        assert self.session.query(self.Person).get(2).age == 0
+
+
+class TestOptimisticConcurrency(ManagerTestBase):
+    """Tests for updating and deleting resources conditionally on the
+    version given in the :http:header:`If-Match` header.
+
+    """
+
+    def setUp(self):
+        super(TestOptimisticConcurrency, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+            name = Column(Unicode)
+            version = Column(Integer, nullable=False)
+            __mapper_args__ = {'version_id_col': version}
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            title = Column(Unicode)
+            revision = Column(Integer, default=1,
+                              onupdate=literal_column('revision + 1'))
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.session.add(Person(id=1))
+        self.session.add(Article(id=1))
+        self.session.commit()
+        self.manager.create_api(Person, methods=['GET', 'PATCH', 'DELETE'],
+                                optimistic_concurrency=True)
+        self.manager.create_api(Article, methods=['PATCH', 'DELETE'],
+                                optimistic_concurrency=True,
+                                version_column='revision')
+
+    def patch_person(self, etag, name=u'foo'):
+        """Returns the response to a request to update the name of the
+        person with the specified :http:header:`If-Match` header.
+
+        """
+        data = {'data': {'type': 'person', 'id': '1',
+                         'attributes': {'name': name}}}
+        headers = {'If-Match': etag} if etag is not None else {}
+        return self.app.patch('/api/person/1', data=dumps(data),
+                              headers=headers)
+
+    def test_fetch_version(self):
+        """Tests that a response containing a resource provides its
+        version as the entity tag.
+
+        """
+        response = self.app.get('/api/person/1')
+        assert response.headers['ETag'] == '"1"'
+
+    def test_update(self):
+        """Tests that an update succeeds only if the entity tag matches
+        the current version of the resource.
+
+        """
+        response = self.patch_person('"1"')
+        assert response.status_code == 204
+        assert response.headers['ETag'] == '"2"'
+        response = self.patch_person('"1"', name=u'bar')
+        check_sole_error(response, 412, ['If-Match'])
+        assert self.session.query(self.Person).get(1).name == u'foo'
+        response = self.patch_person('*', name=u'bar')
+        assert response.status_code == 204
+        # Requests without an If-Match header are not conditional.
+        response = self.patch_person(None, name=u'baz')
+        assert response.status_code == 204
+
+    def test_delete(self):
+        """Tests that a deletion succeeds only if the entity tag matches
+        the current version of the resource.
+
+        """
+        response = self.app.delete('/api/person/1',
+                                   headers={'If-Match': '"2"'})
+        assert response.status_code == 412
+        response = self.app.delete('/api/person/1',
+                                   headers={'If-Match': '"1"'})
+        assert response.status_code == 204
+        assert self.session.query(self.Person).count() == 0
+
+    def test_compressed_version(self):
+        """Tests that the version of a resource in a compressed response
+        remains a strong entity tag that may be used in an
+        :http:header:`If-Match` header.
+
+        """
+        self.manager.create_api(self.Person, methods=['GET', 'PATCH'],
+                                url_prefix='/api2',
+                                optimistic_concurrency=True, compress=True,
+                                compression_threshold=1)
+        headers = {'Accept-Encoding': 'gzip'}
+        response = self.app.get('/api2/person/1', headers=headers)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        etag = response.headers['ETag']
+        assert etag == '"1"'
+        data = {'data': {'type': 'person', 'id': '1',
+                         'attributes': {'name': u'foo'}}}
+        headers['If-Match'] = etag
+        response = self.app.patch('/api2/person/1', data=dumps(data),
+                                  headers=headers)
+        assert response.status_code == 204
+
+    def test_concurrent_update(self):
+        """Tests that an update fails if the resource is modified after
+        it has been fetched in order to compare its version.
+
+        """
+        def modify(session, *args):
+            session.execute('UPDATE person SET version = version + 1')
+
+        event.listen(self.session, 'before_flush', modify)
+        self.addCleanup(event.remove, self.session, 'before_flush', modify)
+        response = self.patch_person('"1"')
+        assert response.status_code == 412
+        assert self.session.query(self.Person).get(1).name is None
+
+    def test_patch_many_increments_version(self):
+        """Tests that updating many resources by filter increments their
+        version counters, so entity tags fetched before the update no
+        longer match.
+
+        """
+        self.manager.create_api(self.Person, methods=['GET', 'PATCH'],
+                                url_prefix='/api2', allow_patch_many=True,
+                                weak_etags=True)
+        response = self.app.get('/api2/person/1')
+        etag = response.headers['ETag']
+        data = {'data': {'type': 'person', 'attributes': {'name': u'foo'}}}
+        query_string = {'filter[objects]': dumps([])}
+        response = self.app.patch('/api2/person', data=dumps(data),
+                                  query_string=query_string)
+        assert response.status_code == 200
+        assert self.session.query(self.Person).get(1).version == 2
+        response = self.app.get('/api2/person/1',
+                                headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        response = self.patch_person('"1"', name=u'bar')
+        check_sole_error(response, 412, ['If-Match'])
+
+    def test_version_column(self):
+        """Tests for using a column other than the version counter of
+        the model as the version.
+
+        """
+        data = {'data': {'type': 'article', 'id': '1',
+                         'attributes': {'title': u'foo'}}}
+        response = self.app.patch('/api/article/1', data=dumps(data),
+                                  headers={'If-Match': '"1"'})
+        assert response.status_code == 200
+        assert response.headers['ETag'] == '"2"'
+        document = loads(response.data)
+        assert document['data']['attributes']['revision'] == 2
+        response = self.app.patch('/api/article/1', data=dumps(data),
+                                  headers={'If-Match': '"1"'})
+        assert response.status_code == 412
+        response = self.app.delete('/api/article/1',
+                                   headers={'If-Match': '"2"'})
+        assert response.status_code == 204
+
+    def test_passive_delete_version_column(self):
+        """Tests that deleting a resource without loading its related
+        resources checks the version in the ``DELETE`` statement itself,
+        without first executing an ``UPDATE`` statement that would lock
+        the row.
+
+        """
+        self.manager.create_api(self.Article, methods=['DELETE'],
+                                url_prefix='/api2',
+                                optimistic_concurrency=True,
+                                version_column='revision',
+                                passive_deletes=True)
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        def modify(conn, cursor, statement, *args):
+            if statement.startswith('DELETE'):
+                cursor.execute('UPDATE article SET revision = 2')
+
+        engine = self.Base.metadata.bind
+        event.listen(engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', record)
+        response = self.app.delete('/api2/article/1',
+                                   headers={'If-Match': '"2"'})
+        assert response.status_code == 412
+        # A concurrent update between loading the resource and deleting
+        # it makes the deletion fail.
+        event.listen(engine, 'before_cursor_execute', modify)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', modify)
+        del statements[:]
+        response = self.app.delete('/api2/article/1',
+                                   headers={'If-Match': '"1"'})
+        assert response.status_code == 412
+        assert not any(s.startswith('UPDATE') for s in statements)
+        assert self.session.query(self.Article).count() == 1
+
+    def test_no_version(self):
+        """Tests that optimistic concurrency control requires a
+        version.
+
+        """
+        class Tag(self.Base):
+            __tablename__ = 'tag'
+            id = Column(Integer, primary_key=True)
+
+        with self.assertRaises(IllegalArgumentError):
+            self.manager.create_api(Tag, optimistic_concurrency=True)
+
+
+class TestChangedAttributes(ManagerTestBase):
+    """Tests for responding to updates with only the changed attributes
+    of the resource.
+
+    """
+
+    def setUp(self):
+        super(TestChangedAttributes, self).setUp()
+
+        class Person(self.Base):
+            __tablename__ = 'person'
+            id = Column(Integer, primary_key=True)
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            title = Column(Unicode)
+            body = Column(Unicode)
+            updated_at = Column(DateTime, server_default=func.now(),
+                                onupdate=func.current_timestamp())
+            author_id = Column(Integer, ForeignKey('person.id'))
+            author = relationship(Person, backref=backref('articles'))
+
+        self.Article = Article
+        self.Person = Person
+        self.Base.metadata.create_all()
+        self.session.add(Person(id=1))
+        self.session.add(Article(id=1, author_id=1, body=u'bar'))
+        self.session.commit()
+        self.manager.create_api(Person)
+        self.manager.create_api(Article, methods=['GET', 'PATCH'],
+                                return_changed_attributes=True)
+        # Record the statements executed from here on.
+        self.statements = []
+
+        def record(conn, cursor, statement, *args):
+            self.statements.append(statement)
+
+        engine = self.Base.metadata.bind
+        event.listen(engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', record)
+
+    def patch_article(self, query_string=None):
+        """Returns the resource object in the response to a request to
+        update the title of the article.
+
+        """
+        data = {'data': {'type': 'article', 'id': '1',
+                         'attributes': {'title': u'foo'}}}
+        response = self.app.patch('/api/article/1', data=dumps(data),
+                                  query_string=query_string)
+        assert response.status_code == 200
+        return loads(response.data)['data']
+
+    def test_changed_attributes(self):
+        """Tests that the response contains only the attributes set by
+        the client and by the server, and that no relationships are
+        loaded.
+
+        """
+        article = self.patch_article()
+        assert article['id'] == '1'
+        assert article['type'] == 'article'
+        assert article['links']['self'].endswith('/api/article/1')
+        assert set(article['attributes']) == set(['title', 'updated_at'])
+        assert article['attributes']['title'] == u'foo'
+        assert article['attributes']['updated_at'] is not None
+        assert 'relationships' not in article
+        assert not any('FROM person' in statement
+                       for statement in self.statements)
+
+    def test_include(self):
+        """Tests that relationships requested by the client are included
+        in the response.
+
+        """
+        article = self.patch_article(query_string={'include': 'author'})
+        assert set(article['relationships']) == set(['author'])
+        assert article['relationships']['author']['data']['id'] == '1'
+
+    def test_sparse_fieldsets(self):
+        """Tests that the fields requested by the client override the
+        changed attributes.
+
+        """
+        query_string = {'fields[article]': 'body'}
+        article = self.patch_article(query_string=query_string)
+        assert article['attributes'] == {'body': u'bar'}
+
+
 class TestProcessors(ManagerTestBase):
     """Tests for pre- and postprocessors."""
 
@@ -20,13 +20,17 @@ specification.
 from sqlalchemy import Column
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
+from sqlalchemy import Table
+from sqlalchemy import event
 from sqlalchemy.orm import backref
 from sqlalchemy.orm import relationship
 
 from flask_restless import ProcessingException
+from flask_restless import ResponseCache
 
 from .helpers import check_sole_error
 from .helpers import dumps
+from .helpers import loads
 from .helpers import ManagerTestBase
 
 
@@ -162,6 +166,29 @@ class TestAdding(ManagerTestBase):
         assert response.status_code == 404
         # TODO check error message here
 
+    def test_multiple_nonexistent_linkages(self):
+        """Tests that an attempt to POST to a relationship URL with
+        several linkage objects that have unknown IDs yields an error for
+        each of them, and that none of the resources are added.
+
+        """
+        person = self.Person(id=1)
+        article = self.Article(id=1)
+        self.session.add_all([article, person])
+        self.session.commit()
+        data = dict(data=[dict(id='2', type='article'),
+                          dict(id='1', type='article'),
+                          dict(id='3', type='article')])
+        data = dumps(data)
+        response = self.app.post('/api/person/1/relationships/articles',
+                                 data=data)
+        assert response.status_code == 404
+        errors = loads(response.data)['errors']
+        assert len(errors) == 2
+        assert 'ID 2' in errors[0]['detail']
+        assert 'ID 3' in errors[1]['detail']
+        assert person.articles == []
+
     def test_empty_request(self):
         """Test that attempting to POST to a relationship URL with no data
         yields an error.
@@ -1049,3 +1076,135 @@ class TestUpdatingToOne(ManagerTestBase):
                                   data=data)
         assert response.status_code == 400
         # TODO check error message here
+
+
+class TestAssociationTable(ManagerTestBase):
+    """Tests for adding to and deleting from a many-to-many relationship
+    by writing to its association table directly.
+
+    """
+
+    def setUp(self):
+        super(TestAssociationTable, self).setUp()
+        articletag = Table('articletag', self.Base.metadata,
+                           Column('article_id', Integer,
+                                  ForeignKey('article.id'), primary_key=True),
+                           Column('tag_id', Integer, ForeignKey('tag.id'),
+                                  primary_key=True))
+
+        class Article(self.Base):
+            __tablename__ = 'article'
+            id = Column(Integer, primary_key=True)
+            tags = relationship('Tag', secondary=articletag,
+                                backref=backref('articles'))
+
+        class Tag(self.Base):
+            __tablename__ = 'tag'
+            id = Column(Integer, primary_key=True)
+
+        self.Article = Article
+        self.Tag = Tag
+        self.Base.metadata.create_all()
+        self.cache = ResponseCache()
+        self.manager.create_api(Article, methods=['GET', 'PATCH'],
+                                allow_delete_from_to_many_relationships=True,
+                                response_cache=self.cache)
+        self.manager.create_api(Tag)
+        self.statements = []
+
+        def record(conn, cursor, statement, *args):
+            self.statements.append(statement)
+
+        engine = self.Base.metadata.bind
+        event.listen(engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, engine, 'before_cursor_execute', record)
+
+    def loaded_collection(self):
+        """Returns ``True`` if and only if a query has loaded the tags of
+        an article (or the articles of a tag).
+
+        """
+        return any('FROM tag, articletag' in statement or
+                   'FROM article, articletag' in statement
+                   for statement in self.statements)
+
+    def test_add(self):
+        """Tests that resources are added without loading the
+        relationship, skipping those that are already in it.
+
+        """
+        article = self.Article(id=1)
+        tags = [self.Tag(id=i) for i in range(1, 4)]
+        self.session.add(article)
+        self.session.add_all(tags)
+        self.session.commit()
+        article.tags = tags[:1]
+        self.session.commit()
+        data = dict(data=[dict(type='tag', id='1'), dict(type='tag', id='2'),
+                          dict(type='tag', id='2')])
+        del self.statements[:]
+        response = self.app.post('/api/article/1/relationships/tags',
+                                 data=dumps(data))
+        assert response.status_code == 204
+        assert not self.loaded_collection()
+        assert sorted(tag.id for tag in article.tags) == [1, 2]
+
+    def test_delete(self):
+        """Tests that resources are deleted without loading the
+        relationship, and that deleting resources that are not in it
+        yields an error.
+
+        """
+        article = self.Article(id=1)
+        tags = [self.Tag(id=i) for i in range(1, 4)]
+        article.tags = tags[:2]
+        self.session.add(article)
+        self.session.add(tags[2])
+        self.session.commit()
+        data = dict(data=[dict(type='tag', id='1'), dict(type='tag', id='3')])
+        del self.statements[:]
+        response = self.app.delete('/api/article/1/relationships/tags',
+                                   data=dumps(data))
+        assert response.status_code == 204
+        data = dict(data=[dict(type='tag', id='3')])
+        response = self.app.delete('/api/article/1/relationships/tags',
+                                   data=dumps(data))
+        assert response.status_code == 404
+        assert not self.loaded_collection()
+        assert [tag.id for tag in article.tags] == [2]
+        assert tags[0].articles == []
+
+    def test_loaded_relationship(self):
+        """Tests that a relationship that has already been loaded is
+        modified through the ORM.
+
+        """
+        article = self.Article(id=1)
+        tag = self.Tag(id=1)
+        self.session.add_all([article, tag])
+        self.session.commit()
+        # Load the relationship before the request is handled.
+        assert article.tags == []
+        data = dict(data=[dict(type='tag', id='1')])
+        response = self.app.post('/api/article/1/relationships/tags',
+                                 data=dumps(data))
+        assert response.status_code == 204
+        assert article.tags == [tag]
+
+    def test_response_cache(self):
+        """Tests that writing to the association table invalidates the
+        cached responses for the related models.
+
+        """
+        article = self.Article(id=1)
+        tag = self.Tag(id=1)
+        self.session.add_all([article, tag])
+        self.session.commit()
+        response = self.app.get('/api/article/1/relationships/tags')
+        assert loads(response.data)['data'] == []
+        data = dict(data=[dict(type='tag', id='1')])
+        response = self.app.post('/api/article/1/relationships/tags',
+                                 data=dumps(data))
+        assert response.status_code == 204
+        response = self.app.get('/api/article/1/relationships/tags')
+        assert loads(response.data)['data'] == [dict(type='tag', id='1')]